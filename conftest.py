@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Package-scope unit test fixtures.
+
+The registries used by the unit tests, `genhub.test_registry` and
+`genhub.test_registry_supp`, are set up here rather than when the package is
+imported. The tests must be run from the GenHub root directory.
+
+Many tests read the sequence files under `testdata/`, which writes a .fai
+index beside each of them; the `fai_cleanup` fixture removes any index a test
+leaves behind, whether or not the test passes.
+"""
+
+import os
+import pytest
+import genhub
+
+
+def _indexes(root='testdata'):
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith('.fai'):
+                yield os.path.join(dirpath, filename)
+
+
+def pytest_configure(config):
+    # Keep the unit tests from reading or writing the user's registry cache.
+    os.environ['GENHUB_CACHE'] = ''
+    genhub.test_registry = genhub.registry.Registry()
+    genhub.test_registry_supp = genhub.registry.Registry()
+    genhub.test_registry_supp.update('testdata/conf')
+
+
+@pytest.fixture(autouse=True)
+def fai_cleanup():
+    existing = set(_indexes())
+    yield
+    for faifile in set(_indexes()) - existing:
+        os.unlink(faifile)
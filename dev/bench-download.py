@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Benchmark segmented downloads against a local, throttled HTTP server.
+
+The server sends each response at a fixed rate, as a remote server limiting
+the throughput of each connection would. A file is downloaded in a single
+stream and then with increasing numbers of segments.
+"""
+
+from __future__ import division
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from genhub.download import _TestServer, DownloadEngine
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--size', type=float, metavar='MB', default=16.0,
+                        help='size of the file to download, in MiB; default '
+                        'is 16')
+    parser.add_argument('--rate', type=float, metavar='MB', default=4.0,
+                        help='throughput of each connection, in MiB per '
+                        'second; default is 4')
+    parser.add_argument('--segments', type=int, nargs='+', metavar='N',
+                        default=[1, 2, 4, 8], help='segment counts to test; '
+                        'default is 1 2 4 8')
+    return parser
+
+
+def main(args):
+    tmpdir = tempfile.mkdtemp()
+    datafile = os.path.join(tmpdir, 'data.bin')
+    size = int(args.size * 2**20)
+    with open(datafile, 'wb') as outstream:
+        outstream.write(os.urandom(size))
+    with open(datafile, 'rb') as instream:
+        data = instream.read()
+
+    print('Segments', 'Seconds', 'MiB/s', sep='\t')
+    with _TestServer(root=tmpdir, rate=args.rate * 2**20) as server:
+        for segments in args.segments:
+            outfile = os.path.join(tmpdir, 'out.bin')
+            engine = DownloadEngine(perhost=segments, segments=segments,
+                                    minsegment=2**16)
+            with engine:
+                start = time.time()
+                engine.add(server.url('data.bin'), outfile)
+                engine.run()
+                elapsed = time.time() - start
+            with open(outfile, 'rb') as instream:
+                assert instream.read() == data, 'download corrupted'
+            os.remove(outfile)
+            print(segments, '{:.2f}'.format(elapsed),
+                  '{:.2f}'.format(size / 2**20 / elapsed), sep='\t')
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
@@ -9,50 +9,60 @@
 # licensed under the BSD 3-clause license: see LICENSE.txt.
 # -----------------------------------------------------------------------------
 
-"""Package-wide configuration"""
+"""
+Package-wide configuration
+
+The package's modules are imported when first accessed as attributes of the
+package (`genhub.stats`, etc.), rather than when the package is imported, so
+that scripts pay only for the modules (and dependencies such as NumPy, PyYAML,
+or PycURL) that they use. The same goes for `genhub.__version__`, which may
+require a call to git. On Python 2, where modules cannot define
+`__getattr__`, everything is imported up front.
+"""
 
-# Package modules
 from __future__ import print_function
-from . import registry
-from . import download
-from . import fasta
-from . import cdhit
-from . import genomedb
-from . import refseq
-from . import crg
-from . import hymbase
-from . import tair
-from . import generic
-from . import iloci
-from . import proteins
-from . import mrnas
-from . import exons
-from . import stats
+import importlib
+import sys
 try:
-    FileNotFoundError
-except NameError:  # pragma: no cover
-    FileNotFoundError = IOError
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
 
-# Custom modules
-from . import am10
-from . import pdom
 
-# Versioneer
-from ._version import get_versions
-__version__ = get_versions()['version']
-del get_versions
+# Package modules
+_submodules = [
+    'registry', 'download', 'fasta', 'composition', 'twobit', 'extract',
+    'cdhit', 'genomedb', 'refseq', 'crg', 'hymbase', 'tair',
+    'generic', 'iloci', 'proteins', 'mrnas', 'exons', 'stats', 'shuffle',
+    'summary',
+    # Custom modules
+    'am10', 'pdom',
+]
 
 
-# Unit test fixtures (can't figure out how to do package-scope global fixtures
-# with nose's setup and teardown mechanism).
-test_registry = registry.Registry()
-test_registry_supp = registry.Registry()
-try:
-    # This will only work when the current working directory is the GenHub
-    # root directory. Fine since it's only for development.
-    test_registry_supp.update('testdata/conf')
-except FileNotFoundError:  # pragma: no cover
-    pass
+def _version():
+    from ._version import get_versions
+    return get_versions()['version']
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module('.' + name, __name__)
+    if name == '__version__':
+        global __version__
+        __version__ = _version()
+        return __version__
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + _submodules + ['__version__'])
+
+
+if sys.version_info < (3, 7):  # pragma: no cover
+    for _module in _submodules:
+        importlib.import_module('.' + _module, __name__)
+    __version__ = _version()
 
 
 sources = {
@@ -67,14 +77,38 @@ sources = {
     'local': 'user-supplied genome (local file system)'
 }
 
-dbtype = {
-    'refseq': refseq.RefSeqDB,
-    'genbank': refseq.GenbankDB,
-    'beebase': hymbase.BeeBaseDB,
-    'crg': crg.CrgDB,
-    'hymbase': hymbase.HymBaseDB,
-    'pdom': pdom.PdomDB,
-    'tair': tair.TairDB,
-    'am10': am10.Am10DB,
-    'local': generic.GenericDB,
-}
+
+class DBTypes(Mapping):
+    """
+    Map genome sources to `GenomeDB` subclasses.
+
+    Each class is given by module and class name, and its module is imported
+    only when the class is first looked up.
+    """
+
+    def __init__(self, classes):
+        self.classes = classes
+
+    def __getitem__(self, source):
+        modname, classname = self.classes[source]
+        module = importlib.import_module('.' + modname, __name__)
+        return getattr(module, classname)
+
+    def __iter__(self):
+        return iter(self.classes)
+
+    def __len__(self):
+        return len(self.classes)
+
+
+dbtype = DBTypes({
+    'refseq': ('refseq', 'RefSeqDB'),
+    'genbank': ('refseq', 'GenbankDB'),
+    'beebase': ('hymbase', 'BeeBaseDB'),
+    'crg': ('crg', 'CrgDB'),
+    'hymbase': ('hymbase', 'HymBaseDB'),
+    'pdom': ('pdom', 'PdomDB'),
+    'tair': ('tair', 'TairDB'),
+    'am10': ('am10', 'Am10DB'),
+    'local': ('generic', 'GenericDB'),
+})
@@ -0,0 +1,587 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Nucleotide composition of DNA sequences.
+
+All IUPAC symbols are counted in a single pass over each sequence, binned into
+the classes needed for GC content, GC skew, and N content:
+
+- A, T, and W (A or T)
+- G
+- C
+- S (G or C)
+- N and X
+- any other (ambiguity) symbol
+
+Counting uses a NumPy `bincount` over a `uint8` view of the sequence when
+NumPy is installed, and `bytes.translate` plus a handful of `bytes.count`
+calls otherwise. In batch mode, many sequences are processed with a single
+pass over a concatenated buffer.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from collections import OrderedDict
+import json
+import os
+import shutil
+import genhub
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+# Average sequence length above which batches are counted sequence by sequence
+_LONG = 2**12
+
+_CLASSES = [b'AaTtWw', b'Gg', b'Cc', b'Ss', b'NnXx']
+_SYMBOLS = b'wgcsno'
+
+_TABLE = bytearray(_SYMBOLS[-1:] * 256)
+for _index, _symbols in enumerate(_CLASSES):
+    for _symbol in bytearray(_symbols):
+        _TABLE[_symbol] = bytearray(_SYMBOLS)[_index]
+_TABLE = bytes(_TABLE)
+
+if numpy is not None:
+    _CLASSMAP = numpy.frombuffer(_TABLE, dtype=numpy.uint8).copy()
+    for _index, _symbol in enumerate(bytearray(_SYMBOLS)):
+        _CLASSMAP[_CLASSMAP == _symbol] = _index
+    _CLASSMAP8 = _CLASSMAP
+    _CLASSMAP = _CLASSMAP.astype(numpy.intp)
+
+
+def _tobytes(seq):
+    if isinstance(seq, bytes):
+        return seq
+    return seq.encode('ascii', 'replace')
+
+
+def counts(seq):
+    """
+    Count the nucleotides of a sequence (bytes or str), by class.
+
+    Returns a tuple: (A+T+W, G, C, S, N+X, other).
+    """
+    if numpy is not None:
+        if not isinstance(seq, numpy.ndarray):
+            seq = numpy.frombuffer(_tobytes(seq), dtype=numpy.uint8)
+        symbols = numpy.bincount(seq, minlength=256)
+        classes = numpy.bincount(_CLASSMAP, weights=symbols, minlength=6)
+        return tuple([int(count) for count in classes])
+    classes = _tobytes(seq).translate(_TABLE)
+    return tuple([classes.count(symbol) for symbol in
+                  [_SYMBOLS[i:i + 1] for i in range(6)]])
+
+
+def metrics(classcounts):
+    """
+    Compute (GC content, GC skew, N content) from class counts.
+
+    The calculations are identical to those historically done with
+    `str.count`: GC content is (G+C+S) / (A+T+W+G+C+S), or 0.0 if there are
+    no such nucleotides; GC skew is (G-C) / (G+C), or 0.0; and N content is
+    (N+X) / length, or 0.0.
+    """
+    atcount, gcount, ccount, scount, ncount, _ = classcounts
+    length = sum(classcounts)
+    gccount = gcount + ccount + scount
+    gccontent = 0.0
+    if atcount + gccount > 0:
+        gccontent = float(gccount) / float(gccount + atcount)
+    gcskew = 0.0
+    if gcount + ccount > 0:
+        gcskew = float(gcount - ccount) / float(gcount + ccount)
+    ncontent = 0.0
+    if ncount > 0:
+        ncontent = float(ncount) / float(length)
+    return gccontent, gcskew, ncontent
+
+
+def composition(seq):
+    """Compute (GC content, GC skew, N content) of a sequence in one pass."""
+    return metrics(counts(seq))
+
+
+def gc_content(seq):
+    """Calculate the %GC content of a nucleotide sequence."""
+    return composition(seq)[0]
+
+
+def gc_skew(seq):
+    """
+    Calculate the GC skew of a nucleotide sequence.
+
+    s = (G - C) / (G + C)
+    """
+    return composition(seq)[1]
+
+
+def n_content(seq):
+    """Calculate the proportion of ambiguous nucleotides in a sequence."""
+    return composition(seq)[2]
+
+
+def batch_counts(buffer, offsets):
+    """
+    Count nucleotides by class for many sequences at once.
+
+    The sequences are concatenated in `buffer` (bytes), and sequence `i`
+    spans `buffer[offsets[i]:offsets[i + 1]]`. Returns a list of tuples, as
+    for `counts`. Short sequences are counted together with a single
+    `bincount`; when the sequences are long, per-sequence overhead is
+    negligible and each is counted separately.
+    """
+    buffer = _tobytes(buffer)
+    offsets = list(offsets)
+    nseqs = len(offsets) - 1
+    if nseqs < 1:
+        return list()
+    if numpy is None:
+        return [counts(buffer[offsets[i]:offsets[i + 1]])
+                for i in range(nseqs)]
+
+    data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+    if offsets[-1] - offsets[0] >= nseqs * _LONG:
+        return [counts(data[offsets[i]:offsets[i + 1]])
+                for i in range(nseqs)]
+
+    data = data[offsets[0]:offsets[-1]]
+    bounds = numpy.asarray(offsets, dtype=numpy.int64) - offsets[0]
+    lengths = numpy.diff(bounds)
+    # One bincount over (sequence, class) pairs: each position contributes
+    # to bin 6 * sequence + class.
+    seqindex = numpy.repeat(numpy.arange(nseqs, dtype=numpy.intp), lengths)
+    bins = seqindex * 6 + _CLASSMAP[data]
+    table = numpy.bincount(bins, minlength=6 * nseqs).reshape(nseqs, 6)
+    return [tuple(row) for row in table.tolist()]
+
+
+def batch(buffer, offsets):
+    """
+    Compute (GC content, GC skew, N content) for many sequences at once.
+
+    See `batch_counts` for a description of the arguments.
+    """
+    return [metrics(c) for c in batch_counts(buffer, offsets)]
+
+
+def batch_records(records, chunksize=2**22):
+    """
+    Compute the composition of each record from a Fasta stream.
+
+    The `records` are (defline, sequence) tuples, for example from
+    `genhub.fasta.parse_bulk`. Sequences are accumulated into a concatenated
+    buffer of roughly `chunksize` bytes and processed in batch, so only a
+    chunk of sequence is held in memory at a time. Yields one tuple per
+    record: (defline, length, (GC content, GC skew, N content)).
+    """
+    deflines, pieces, offsets = list(), list(), [0]
+
+    def flush():
+        results = batch(b''.join(pieces), offsets)
+        for defline, result, i in zip(deflines, results, range(len(results))):
+            yield defline, offsets[i + 1] - offsets[i], result
+
+    for defline, seq in records:
+        seq = _tobytes(seq)
+        deflines.append(defline)
+        pieces.append(seq)
+        offsets.append(offsets[-1] + len(seq))
+        if offsets[-1] >= chunksize:
+            for result in flush():
+                yield result
+            deflines, pieces, offsets = list(), list(), [0]
+    for result in flush():
+        yield result
+
+
+# -----------------------------------------------------------------------------
+# Prefix-sum composition index
+# -----------------------------------------------------------------------------
+
+
+def _npy(filename, shape, dtype):
+    """Create a memory-mapped NumPy array file for writing."""
+    return numpy.lib.format.open_memmap(filename, mode='w+', dtype=dtype,
+                                        shape=shape)
+
+
+def build_index(genome, dirname, blocksize=128):
+    """
+    Build a composition index for a genome.
+
+    The `genome` is a reader such as `genhub.fasta.IndexedFasta` or
+    `genhub.twobit.TwoBitFile` (see `GenomeDB.genome`), or the name of a Fasta
+    file. The index is written to the directory `dirname`: one byte per
+    nucleotide coding its class (`classes.npy`), the cumulative class counts
+    at every `blocksize`-th position of each sequence (`counts.npy`), and a
+    table of contents (`index.json`). Sequences are loaded one at a time.
+    """
+    if numpy is None:
+        raise ImportError('the composition index requires NumPy')
+    if not hasattr(genome, 'fetch_bytes'):
+        with genhub.fasta.IndexedFasta(genome) as reader:
+            return build_index(reader, dirname, blocksize=blocksize)
+
+    entries = list()
+    total, rows = 0, 0
+    for seqid in genome.keys():
+        length = genome.length(seqid)
+        entries.append([seqid, length, total, rows])
+        total += length
+        rows += length // blocksize + 1
+
+    tempdir = dirname + '.tmp'
+    if os.path.exists(tempdir):
+        shutil.rmtree(tempdir)
+    os.makedirs(tempdir)
+    classes = _npy(tempdir + '/classes.npy', (total,), numpy.uint8)
+    counts = _npy(tempdir + '/counts.npy', (rows, 6), numpy.int64)
+    for seqid, length, offset, row in entries:
+        data = numpy.frombuffer(genome.fetch_bytes(seqid), dtype=numpy.uint8)
+        seqclasses = _CLASSMAP8[data]
+        classes[offset:offset + length] = seqclasses
+        nblocks = length // blocksize
+        blocks = seqclasses[:nblocks * blocksize].reshape(nblocks, blocksize)
+        seqcounts = counts[row:row + nblocks + 1]
+        seqcounts[0] = 0
+        for index in range(6):
+            numpy.cumsum((blocks == index).sum(axis=1),
+                         out=seqcounts[1:, index])
+    classes.flush()
+    counts.flush()
+    del classes, counts
+    with open(tempdir + '/index.json', 'w') as outstream:
+        toc = {'blocksize': blocksize, 'sequences': entries}
+        json.dump(toc, outstream)
+
+    if os.path.exists(dirname):
+        shutil.rmtree(dirname)
+    os.rename(tempdir, dirname)
+
+
+class CompositionIndex(object):
+    """
+    Constant-time nucleotide composition of any genomic interval.
+
+    The index (see `build_index`) is memory-mapped, so opening it is cheap and
+    only the pages touched by queries are read. The class counts of an
+    interval are the difference of two prefix counts, each of which is a
+    stored checkpoint plus a count over fewer than `blocksize` positions; no
+    sequence is extracted. Coordinates are 1-based and inclusive, as in GFF3.
+
+        >>> index = CompositionIndex('Atha.gdna.comp')
+        >>> index.composition('NC_003070.9', [(1001, 2000), (3001, 3500)])
+        (0.30466666666666664, -0.07221006564551423, 0.0)
+    """
+
+    def __init__(self, dirname):
+        if numpy is None:
+            raise ImportError('the composition index requires NumPy')
+        self.dirname = dirname
+        with open(dirname + '/index.json', 'r') as instream:
+            toc = json.load(instream)
+        self.blocksize = toc['blocksize']
+        self.entries = OrderedDict()
+        for seqid, length, offset, row in toc['sequences']:
+            self.entries[seqid] = (length, offset, row)
+        # Plain array views of the memory maps are much cheaper to slice
+        self.classes = numpy.load(dirname + '/classes.npy',
+                                  mmap_mode='r').view(numpy.ndarray)
+        self.counts = numpy.load(dirname + '/counts.npy',
+                                 mmap_mode='r').view(numpy.ndarray)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, seqid):
+        return seqid in self.entries
+
+    def close(self):
+        self.classes = None
+        self.counts = None
+
+    def keys(self):
+        return self.entries.keys()
+
+    def length(self, seqid):
+        return self.entries[seqid][0]
+
+    def prefix(self, seqid, position):
+        """Class counts of the first `position` nucleotides of a sequence."""
+        length, offset, row = self.entries[seqid]
+        block = position // self.blocksize
+        checkpoint = self.counts[row + block]
+        start = offset + block * self.blocksize
+        if start == offset + position:
+            return checkpoint
+        residual = numpy.bincount(self.classes[start:offset + position],
+                                  minlength=6)
+        return checkpoint + residual
+
+    def prefixes(self, seqid, positions, chunksize=2**14):
+        """
+        Class counts of many prefixes of a sequence, as an (n, 6) array.
+
+        All positions are handled together: each checkpoint is gathered, and
+        the residual positions of all prefixes are counted in one pass.
+        """
+        length, offset, row = self.entries[seqid]
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+        result = numpy.empty((len(positions), 6), dtype=numpy.int64)
+        columns = numpy.arange(self.blocksize, dtype=numpy.int64)
+        for first in range(0, len(positions), chunksize):
+            chunk = positions[first:first + chunksize]
+            blocks = chunk // self.blocksize
+            counts = self.counts[row + blocks]
+            indices = offset + blocks[:, None] * self.blocksize + columns
+            valid = columns < (chunk - blocks * self.blocksize)[:, None]
+            if valid.any():
+                numpy.minimum(indices, len(self.classes) - 1, out=indices)
+                classes = self.classes[indices]
+                for index in range(6):
+                    counts[:, index] += \
+                        ((classes == index) & valid).sum(axis=1)
+            result[first:first + chunksize] = counts
+        return result
+
+    def _check(self, seqid, start, end):
+        length = self.length(seqid)
+        if start < 1 or end > length or end < start - 1:
+            message = 'invalid range %s:%d-%d' % (seqid, start, end)
+            message += ' (sequence length %d)' % length
+            raise ValueError(message)
+
+    def counts_for(self, seqid, intervals, strand='+'):
+        """
+        Class counts of a feature, as for `counts`.
+
+        The feature is given by its (start, end) intervals, which are spliced
+        together; on the reverse strand, the counts of G and C are swapped,
+        since the feature's sequence is reverse complemented.
+        """
+        total = numpy.zeros(6, dtype=numpy.int64)
+        for start, end in intervals:
+            self._check(seqid, start, end)
+            total += self.prefix(seqid, end) - self.prefix(seqid, start - 1)
+        classcounts = [int(count) for count in total]
+        if strand == '-':
+            classcounts[1], classcounts[2] = classcounts[2], classcounts[1]
+        return tuple(classcounts)
+
+    def composition(self, seqid, intervals, strand='+'):
+        """Compute (GC content, GC skew, N content) of a feature."""
+        return metrics(self.counts_for(seqid, intervals, strand))
+
+    def features(self, instream, ftype):
+        """
+        Compute the composition of each feature of the given type in a GFF3
+        stream.
+
+        The output is the same as that of `batch_records` applied to the
+        sequences extracted by `genhub.extract.extract`, without extracting
+        them: one (defline, length, (GC content, GC skew, N content)) tuple per
+        feature, with multi-features spliced together.
+        """
+        for feature in genhub.extract.features(instream):
+            if feature.ftype != ftype:
+                continue
+            intervals = feature.intervals
+            length = sum([end - start + 1 for start, end in intervals])
+            values = self.composition(feature.seqid, intervals,
+                                      feature.strand)
+            yield feature.defline, length, values
+
+    def windows(self, seqid, size, step=None):
+        """
+        Compute the composition of a sequence in sliding windows.
+
+        Yields (start, end, (GC content, GC skew, N content)) for windows of
+        `size` nucleotides every `step` (by default `size`) nucleotides; the
+        last window is truncated at the end of the sequence.
+        """
+        if step is None:
+            step = size
+        length = self.length(seqid)
+        starts = numpy.arange(0, max(length - size, 0) + step, step)
+        starts = starts[starts < length]
+        ends = numpy.minimum(starts + size, length)
+        first = self.prefixes(seqid, starts)
+        last = self.prefixes(seqid, ends)
+        for start, end, classcounts in zip(starts.tolist(), ends.tolist(),
+                                           (last - first).tolist()):
+            yield start + 1, end, metrics(classcounts)
+
+    def write_track(self, outstream, size, step=None, metric='gc'):
+        """
+        Write a windowed composition track in bedGraph format.
+
+        The `metric` is one of `gc` (GC content), `skew` (GC skew), or `n` (N
+        content).
+        """
+        column = ['gc', 'skew', 'n'].index(metric)
+        for seqid in self.entries:
+            for start, end, values in self.windows(seqid, size, step):
+                print(seqid, start - 1, end, '%.3f' % values[column],
+                      sep='\t', file=outstream)
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+
+def _count_metrics(dna):
+    """The original `str.count` implementation, for comparison."""
+    atcount = dna.count('A') + dna.count('a') + dna.count('T') + \
+        dna.count('t') + dna.count('W') + dna.count('w')
+    gccount = dna.count('C') + dna.count('c') + dna.count('G') + \
+        dna.count('g') + dna.count('S') + dna.count('s')
+    gccontent = 0.0
+    if atcount + gccount > 0:
+        gccontent = float(gccount) / float(gccount + atcount)
+    gcount = dna.count('G') + dna.count('g')
+    ccount = dna.count('C') + dna.count('c')
+    gcskew = 0.0
+    if gcount + ccount > 0:
+        gcskew = float(gcount - ccount) / float(gcount + ccount)
+    ncount = dna.count('N') + dna.count('n') + dna.count('X') + \
+        dna.count('x')
+    ncontent = 0.0
+    if ncount > 0:
+        ncontent = float(ncount) / float(len(dna))
+    return gccontent, gcskew, ncontent
+
+
+def test_counts():
+    """Composition: nucleotide counts"""
+    assert counts('') == (0, 0, 0, 0, 0, 0)
+    assert counts('ACGTacgt') == (4, 2, 2, 0, 0, 0)
+    assert counts(b'WSwsNnXxRYK') == (2, 0, 0, 2, 4, 3)
+    assert composition('GGGC') == (1.0, 0.5, 0.0)
+    assert composition('NNNN') == (0.0, 0.0, 1.0)
+    assert composition('') == (0.0, 0.0, 0.0)
+    assert gc_content('ATGC') == 0.5
+    assert gc_skew('CCCG') == -0.5
+    assert n_content('ACGN') == 0.25
+
+
+def test_composition():
+    """Composition: identical to str.count implementation"""
+    import random
+    random.seed(42)
+    alphabet = 'ACGTacgtNnXxWwSsRYKMBDHV'
+    for length in list(range(12)) + [97, 500, 1024]:
+        for _ in range(10):
+            dna = ''.join([random.choice(alphabet) for _ in range(length)])
+            assert composition(dna) == _count_metrics(dna), dna
+            assert composition(dna.encode('ascii')) == _count_metrics(dna)
+
+
+def test_batch():
+    """Composition: batch mode"""
+    seqs = ['ACGT', '', 'GGGGNN', 'wsWSryn', 'CCCCCCCCCA']
+    buffer = ''.join(seqs).encode('ascii')
+    offsets = [0]
+    for seq in seqs:
+        offsets.append(offsets[-1] + len(seq))
+    assert batch(buffer, offsets) == [_count_metrics(s) for s in seqs]
+    assert batch_counts(buffer, offsets[1:3]) == [counts(seqs[1])]
+    assert batch(buffer, [0]) == []
+
+    records = [('>seq%d' % i, seq) for i, seq in enumerate(seqs)]
+    for chunksize in [1, 5, 1000]:
+        results = list(batch_records(records, chunksize=chunksize))
+        assert [r[0] for r in results] == [r[0] for r in records]
+        assert [r[1] for r in results] == [len(s) for s in seqs]
+        assert [r[2] for r in results] == [_count_metrics(s) for s in seqs]
+
+
+def test_index():
+    """Composition: prefix-sum index"""
+    import random
+    if numpy is None:  # pragma: no cover
+        return
+    fastafile = 'testdata/demo-workdir/Bdis/Bdis.gdna.fa'
+    indexdir = 'testdata/demo-workdir/Bdis/Bdis.gdna.comp'
+    build_index(fastafile, indexdir, blocksize=16)
+    random.seed(24)
+    with genhub.fasta.IndexedFasta(fastafile) as seqs, \
+            CompositionIndex(indexdir) as index:
+        assert list(index.keys()) == list(seqs.keys())
+        for seqid in seqs:
+            length = seqs.length(seqid)
+            assert index.length(seqid) == length
+            assert index.counts_for(seqid, [(1, length)]) == \
+                counts(seqs.fetch_bytes(seqid))
+            for _ in range(50):
+                start = random.randint(1, length)
+                end = random.randint(start - 1, min(start + 100, length))
+                seq = seqs.fetch_bytes(seqid, start, end)
+                assert index.composition(seqid, [(start, end)]) == \
+                    composition(seq), (seqid, start, end)
+                revseq = genhub.extract.revcomp(seq)
+                assert index.composition(seqid, [(start, end)], '-') == \
+                    composition(revseq)
+            windows = list(index.windows(seqid, 1000, 300))
+            assert windows[0][:2] == (1, min(1000, length))
+            assert windows[-1][1] == length
+            for start, end, values in windows:
+                assert values == composition(seqs.fetch(seqid, start, end))
+        try:
+            index.composition(seqid, [(length, length + 1)])
+        except ValueError as e:
+            assert 'invalid range' in str(e)
+        else:
+            assert False, 'invalid range not detected'
+    shutil.rmtree(indexdir)
+
+
+def test_index_features():
+    """Composition: feature statistics from GFF3 coordinates"""
+    if numpy is None:  # pragma: no cover
+        return
+    workdir = 'testdata/demo-workdir/Atha/'
+    indexdir = workdir + 'Atha.gdna.comp'
+    build_index(workdir + 'Atha.gdna.fa', indexdir)
+    cases = [
+        ('Atha.ilocus.mrnas.gff3', 'CDS', 'atha-cds.fa'),
+        ('Atha.ilocus.mrnas.gff3', 'exon', 'atha-exons.fa'),
+        ('Atha.with-introns.gff3', 'intron', 'atha-introns.fa'),
+    ]
+    with CompositionIndex(indexdir) as index:
+        for gff3file, ftype, fastafile in cases:
+            with open(workdir + gff3file, 'r') as instream:
+                observed = list(index.features(instream, ftype))
+            with open('testdata/fasta/' + fastafile, 'rb') as instream:
+                records = genhub.fasta.parse_bulk(instream)
+                expected = [(d.decode('utf-8'), l, v)
+                            for d, l, v in batch_records(records)]
+            assert observed == expected, (gff3file, ftype)
+
+        with open(workdir + 'Atha.gdna.gc.bedgraph', 'w') as outstream:
+            index.write_track(outstream, 100000)
+        with open(workdir + 'Atha.gdna.gc.bedgraph', 'r') as instream:
+            track = instream.read().splitlines()
+        assert track[0] == 'NC_003070.9\t0\t100000\t0.356'
+    os.unlink(workdir + 'Atha.gdna.gc.bedgraph')
+    shutil.rmtree(indexdir)
@@ -9,40 +9,1464 @@
 # licensed under the BSD 3-clause license: see LICENSE.txt.
 # -----------------------------------------------------------------------------
 
-"""Simple module for downloading data with PycURL"""
+"""
+Simple module for downloading data with PycURL
+
+A `DownloadEngine` runs any number of downloads concurrently on a single
+`pycurl.CurlMulti` handle, with a cap on the number of simultaneous transfers
+overall and from any one host. Curl handles are reused from one transfer to
+the next, so that connections to the same server are kept alive rather than
+set up anew for each file.
+
+    >>> with DownloadEngine(maxconnects=8, perhost=2) as engine:
+    ...     for db in dbs:
+    ...         db.download(engine=engine)
+    ...     engine.run()
+
+Downloads are resumable. Data is written to `<localpath>.part`, next to a
+`<localpath>.part.json` file recording the URLs, the expected size, and the
+HTTP validators (ETag or Last-Modified) of the file. An interrupted download
+continues from the end of the partial file with an HTTP or FTP range request
+(an HTTP `If-Range` request, so that a file changed on the server is fetched
+anew) and the partial file is renamed to `localpath` once it is complete. A
+file whose size differs from the recorded one is also fetched anew, which
+catches most changes on FTP servers and on HTTP servers without validators.
+If the server does not support range requests, the file is fetched in full.
+
+Optionally, large files are downloaded in several byte ranges at once over
+separate connections, each written in place into the partial file, which
+helps when the throughput of each connection is limited by the server:
+
+    >>> url_download(url, 'genome.fna.gz', segments=4)
+"""
 
 from __future__ import print_function
+from collections import deque
 import gzip
-import pycurl
+import json
+import os
+import shutil
 import sys
+import pycurl
+try:
+    from urllib.parse import urlparse
+except ImportError:  # pragma: no cover
+    from urlparse import urlparse
+
+
+RANGE_ERRORS = [pycurl.E_RANGE_ERROR, pycurl.E_FTP_COULDNT_USE_REST,
+                pycurl.E_BAD_DOWNLOAD_RESUME]
+CHECKPOINT = 2**24
+
+
+class Download(object):
+    """
+    A file to be downloaded.
+
+    The file's contents are those of one or more URLs, fetched one after the
+    other, and are gzip-compressed if `compress` is true. The downloaded data
+    is written uncompressed to the partial file, and compressed when the
+    download is complete.
+    """
+
+    def __init__(self, urldata, localpath, compress=False):
+        self.urls = [urldata] if isinstance(urldata, str) else list(urldata)
+        self.localpath = localpath
+        self.partpath = localpath + '.part'
+        self.statepath = localpath + '.part.json'
+        self.compress = compress
+        self.outstream = None
+        self.error = None
+
+        # Position of the current URL's data in the partial file.
+        self.current = 0
+        self.start = 0
+        self.offset = 0
+        self.resumed = 0
+
+        # Expected size and validators of the current URL.
+        self.size = None
+        self.etag = None
+        self.lastmodified = None
+        self.ranged = True
+
+        # State of the current transfer.
+        self.handle = None
+        self.rangestart = None
+        self.status = None
+        self.headers = dict()
+        self.started = False
+        self.changed = False
+
+    @property
+    def download(self):
+        return self
+
+    @property
+    def url(self):
+        return self.urls[self.current]
+
+    @property
+    def host(self):
+        return urlparse(self.url).netloc
+
+    @property
+    def http(self):
+        return urlparse(self.url).scheme in ['http', 'https']
+
+    @property
+    def done(self):
+        return self.current >= len(self.urls)
+
+    @property
+    def validator(self):
+        """Validator for an HTTP `If-Range` request."""
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.lastmodified
+
+    def _loadstate(self):
+        """Load the state of a previous, interrupted download."""
+        if not os.path.isfile(self.partpath):
+            return None
+        try:
+            with open(self.statepath, 'r') as instream:
+                state = json.load(instream)
+        except (IOError, OSError, ValueError):
+            return None
+        if state.get('urls') != self.urls or \
+                state.get('compress') != self.compress or \
+                state.get('start', 0) > os.path.getsize(self.partpath):
+            return None
+        return state
+
+    def _state(self):
+        return {
+            'urls': self.urls,
+            'compress': self.compress,
+            'current': self.current,
+            'start': self.start,
+            'size': self.size,
+            'etag': self.etag,
+            'lastmodified': self.lastmodified,
+        }
+
+    def _savestate(self):
+        state = self._state()
+        tmppath = self.statepath + '.tmp'
+        with open(tmppath, 'w') as outstream:
+            json.dump(state, outstream)
+        os.rename(tmppath, self.statepath)
+
+    def _rewind(self):
+        """Discard the partial data of the current URL."""
+        self.outstream.seek(self.start)
+        self.outstream.truncate()
+        self.offset = 0
+
+    def _advance(self):
+        """Move on to the next URL."""
+        self.current += 1
+        self.start = self.outstream.tell()
+        self.offset = 0
+        self.size, self.etag, self.lastmodified = None, None, None
+        self.ranged = True
+        self._savestate()
+
+    def open(self):
+        """Open the partial file, resuming a previous download if possible."""
+        if self.outstream is not None:
+            return
+        state = self._loadstate()
+        if state is None:
+            self.outstream = open(self.partpath, 'w+b')
+            self._savestate()
+            return
+
+        self.outstream = open(self.partpath, 'r+b')
+        self._resume(state)
+
+    def _resume(self, state):
+        if state.get('segments'):
+            # Left by a segmented download, which writes each byte range in
+            # place into a file of the full size: the size of the partial
+            # file says nothing about what has been received.
+            self.restart()
+            return
+        self.outstream.seek(0, os.SEEK_END)
+        self.current = state['current']
+        self.start = state['start']
+        self.offset = self.outstream.tell() - self.start
+        self.size = state['size']
+        self.etag = state['etag']
+        self.lastmodified = state['lastmodified']
+        if self.size is not None and self.offset > self.size:
+            self._rewind()
+        self.resumed += self.offset
+        while not self.done and self.size is not None and \
+                self.offset == self.size:
+            self._advance()
+
+    def prepare(self):
+        """Open the download; return the transfers it needs to start now."""
+        self.open()
+        return [] if self.done else [self]
+
+    def begin(self, handle):
+        """Set up a transfer of the current URL on the given Curl handle."""
+        self.handle = handle
+        self.status = None
+        self.headers = dict()
+        self.started = False
+        self.changed = False
+        self.rangestart = None
+        handle.setopt(pycurl.URL, self.url)
+        handle.setopt(pycurl.WRITEFUNCTION, self.write)
+        handle.setopt(pycurl.HEADERFUNCTION, self.header)
+        if self.offset > 0 and self.ranged:
+            self.rangestart = self.offset
+            handle.setopt(pycurl.RANGE, '{:d}-'.format(self.offset))
+            if self.http and self.validator:
+                handle.setopt(pycurl.HTTPHEADER,
+                              ['If-Range: ' + self.validator])
+
+    def header(self, line):
+        line = line.decode('iso-8859-1').strip()
+        if line.startswith('HTTP/'):
+            self.status = int(line.split()[1])
+            self.headers = dict()
+        elif not self.http and line.startswith('213 ') and \
+                line[4:].isdigit():
+            # The reply to an FTP SIZE command.
+            self.headers['size'] = line[4:]
+        elif ':' in line:
+            name, value = line.split(':', 1)
+            self.headers[name.strip().lower()] = value.strip()
+
+    def write(self, data):
+        if not self.started:
+            self.started = True
+            if not self._body():
+                return 0
+        self.outstream.write(data)
+        self.offset += len(data)
+
+    def _body(self):
+        """
+        Check the response to a transfer, once its body begins.
+
+        Returns false if a resumed transfer is of a file whose size differs
+        from the one recorded when the partial data was received.
+        """
+        if self.rangestart and self.http and self.status != 206:
+            # The server ignored the range, or the file has changed.
+            self._rewind()
+            self.size = None
+        size = self._total()
+        if self.rangestart and self.size is not None and size is not None \
+                and size != self.size:
+            # The file has changed, with no validator (or over FTP, with no
+            # If-Range at all) for the server to tell.
+            self.changed = True
+            return False
+        if self.http:
+            self.etag = self.headers.get('etag')
+            self.lastmodified = self.headers.get('last-modified')
+        if size is not None:
+            self.size = size
+        self._savestate()
+        return True
+
+    def _total(self):
+        """Size of the whole file, according to the response headers."""
+        if not self.http:
+            size = self.headers.get('size', '')
+            return int(size) if size.isdigit() else None
+        if self.status == 206:
+            total = self.headers.get('content-range', '').rpartition('/')[2]
+            if total.isdigit():
+                return int(total)
+        length = self.headers.get('content-length', '')
+        if length.isdigit():
+            return self.offset + int(length)
+        return None
+
+    @property
+    def remaining(self):
+        return self.size - self.offset
+
+    def finish(self):
+        """
+        Finish a successful transfer of the current URL.
+
+        Returns false if less data was received than expected.
+        """
+        self.handle = None
+        if self.size is not None and self.offset != self.size:
+            return False
+        self._advance()
+        return True
+
+    def fallback(self, errno, status):
+        """
+        Handle a failed transfer, if possible, by falling back to a full
+        fetch of the current URL. Returns false if the failure stands.
+        """
+        if self.changed or \
+                self.rangestart and (errno in RANGE_ERRORS or status == 416):
+            self.restart()
+            return True
+        return False
+
+    def restart(self):
+        """Fetch the current URL in full, without a range request."""
+        self.open()
+        self._rewind()
+        self.size, self.etag, self.lastmodified = None, None, None
+        self.ranged = False
+        self._savestate()
+
+    def complete(self):
+        """Move the completed partial file to its final location."""
+        self.close()
+        if self.compress:
+            tmppath = self.localpath + '.tmp'
+            with open(self.partpath, 'rb') as instream, \
+                    gzip.open(tmppath, 'wb') as outstream:
+                shutil.copyfileobj(instream, outstream)
+            os.rename(tmppath, self.localpath)
+            os.remove(self.partpath)
+        else:
+            os.rename(self.partpath, self.localpath)
+        os.remove(self.statepath)
+
+    def close(self):
+        if self.outstream is not None:
+            self.outstream.close()
+            self.outstream = None
+
+
+class SegmentedDownload(Download):
+    """
+    A single-URL download fetched in several byte ranges at once.
+
+    The size of the file and the server's support for range requests are
+    first checked with a `HEAD` request, or over FTP with a SIZE command (an
+    FTP server that reports the size is taken to support REST, which curl
+    uses for the byte range of each segment). The file is
+    then split into `segments` byte ranges of at least `minsegment` bytes,
+    each transferred on its own connection and written in place into the
+    partial file. The progress of each segment is recorded in the state
+    file, so an interrupted download resumes each segment where it left off.
+
+    Small files, and files from servers that do not support range requests,
+    are downloaded in a single stream, as is the whole file if the server
+    ignores the range of any segment.
+    """
+
+    def __init__(self, urldata, localpath, compress=False, segments=4,
+                 minsegment=2**20):
+        Download.__init__(self, urldata, localpath, compress=compress)
+        self.nsegments = segments
+        self.minsegment = minsegment
+        self.segments = None
+        self.unsaved = 0
+
+    @property
+    def done(self):
+        if self.segments:
+            return all(segment.done for segment in self.segments)
+        return Download.done.fget(self)
+
+    def _state(self):
+        state = Download._state(self)
+        if self.segments:
+            state['segments'] = [[seg.start, seg.end, seg.received]
+                                 for seg in self.segments]
+        return state
+
+    def _savestate(self):
+        if self.outstream is not None:
+            self.outstream.flush()
+        Download._savestate(self)
+        self.unsaved = 0
+
+    def _resume(self, state):
+        if state.get('segments'):
+            self.size = state['size']
+            self.etag = state['etag']
+            self.lastmodified = state['lastmodified']
+            self.segments = [Segment(self, *seg) for seg in state['segments']]
+            self.resumed += sum(seg.received for seg in self.segments)
+            return
+        Download._resume(self, state)
+        if self.offset > 0 or self.done:
+            self.segments = False
+
+    def prepare(self):
+        self.open()
+        if self.segments:
+            return [seg for seg in self.segments if not seg.done]
+        return [] if self.done else [self]
+
+    def begin(self, handle):
+        if self.segments is not None:
+            Download.begin(self, handle)
+            return
+        self.handle = handle
+        self.status = None
+        self.headers = dict()
+        self.rangestart = None
+        handle.setopt(pycurl.URL, self.url)
+        handle.setopt(pycurl.HEADERFUNCTION, self.header)
+        handle.setopt(pycurl.NOBODY, True)
+
+    def finish(self):
+        if self.segments is not None:
+            return Download.finish(self)
+        self.handle = None
+        self._split()
+        return True
+
+    def _split(self):
+        """Split the file into segments, after checking its size."""
+        length = self.headers.get('content-length', self.headers.get('size'))
+        if self.http:
+            ranges = self.headers.get('accept-ranges', '').lower() == 'bytes'
+        else:
+            ranges = 'size' in self.headers
+        count = 0
+        if ranges and length is not None and length.isdigit():
+            count = min(self.nsegments, int(length) // self.minsegment)
+        if count < 2:
+            self.segments = False
+            self._savestate()
+            return
+
+        if self.http:
+            self.etag = self.headers.get('etag')
+            self.lastmodified = self.headers.get('last-modified')
+        self.size = int(length)
+        self.outstream.truncate(self.size)
+        bounds = [self.size * i // count for i in range(count + 1)]
+        self.segments = [Segment(self, start, end)
+                         for start, end in zip(bounds[:-1], bounds[1:])]
+        self._savestate()
+
+    def fallback(self, errno, status):
+        if self.segments is None:
+            self.segments = False
+            self._savestate()
+            return True
+        return Download.fallback(self, errno, status)
+
+    def unsegment(self):
+        """Discard all segments and download the file in a single stream."""
+        self.segments = False
+        self.current, self.start = 0, 0
+        self._rewind()
+        self.size, self.etag, self.lastmodified = None, None, None
+        self.ranged = False
+        self._savestate()
+
+    def pwrite(self, data, position):
+        """Write data at the given position of the partial file."""
+        self.unsaved += len(data)
+        if hasattr(os, 'pwrite'):
+            fd = self.outstream.fileno()
+            data = memoryview(data)
+            while len(data) > 0:
+                written = os.pwrite(fd, data, position)
+                data, position = data[written:], position + written
+        else:  # pragma: no cover
+            self.outstream.seek(position)
+            self.outstream.write(data)
+        if self.unsaved >= CHECKPOINT:
+            self._savestate()
+
+    def close(self):
+        if self.outstream is not None and self.segments:
+            self._savestate()
+        Download.close(self)
+
+
+class Segment(object):
+    """A byte range of a `SegmentedDownload`, transferred on its own."""
+
+    def __init__(self, download, start, end, received=0):
+        self.download = download
+        self.start = start
+        self.end = end
+        self.received = received
+        self.handle = None
+        self.status = None
+        self.total = None
+        self.started = False
+        self.unranged = False
+
+    @property
+    def host(self):
+        return self.download.host
+
+    @property
+    def remaining(self):
+        return self.end - self.start - self.received
+
+    @property
+    def done(self):
+        return self.remaining == 0
+
+    def prepare(self):
+        return [] if self.done else [self]
+
+    def begin(self, handle):
+        download = self.download
+        self.handle = handle
+        self.status = None
+        self.total = None
+        self.started = False
+        self.unranged = False
+        handle.setopt(pycurl.URL, download.url)
+        handle.setopt(pycurl.WRITEFUNCTION, self.write)
+        handle.setopt(pycurl.HEADERFUNCTION, self.header)
+        handle.setopt(pycurl.RANGE, '{:d}-{:d}'.format(
+            self.start + self.received, self.end - 1))
+        if download.http and download.validator:
+            handle.setopt(pycurl.HTTPHEADER,
+                          ['If-Range: ' + download.validator])
+
+    def header(self, line):
+        line = line.strip()
+        if line.startswith(b'HTTP/'):
+            self.status = int(line.split()[1])
+            self.total = None
+        elif line.lower().startswith(b'content-range:'):
+            total = line.rpartition(b'/')[2]
+            if total.isdigit():
+                self.total = int(total)
+        elif not self.download.http and line.startswith(b'213 ') and \
+                line[4:].isdigit():
+            self.total = int(line[4:])
+
+    def write(self, data):
+        if not self.started:
+            self.started = True
+            if self.download.http and self.status != 206:
+                # The server ignored the range, or the file has changed.
+                self.unranged = True
+                return 0
+            if self.total is not None and self.total != self.download.size:
+                # The file has changed, with no validator to tell.
+                self.unranged = True
+                return 0
+        if len(data) > self.remaining:
+            self.unranged = True
+            return 0
+        self.download.pwrite(data, self.start + self.received)
+        self.received += len(data)
+
+    def finish(self):
+        self.handle = None
+        if self.remaining != 0:
+            return False
+        self.download._savestate()
+        return True
+
+    def fallback(self, errno, status):
+        if self.unranged or errno in RANGE_ERRORS or status == 416:
+            self.download.unsegment()
+            return True
+        return False
+
+
+class DownloadEngine(object):
+    """
+    Concurrent downloads on a `pycurl.CurlMulti` handle.
+
+    Downloads are queued with `add` (or `url_download`) and transferred by
+    `run`, at most `maxconnects` at a time and at most `perhost` at a time
+    from any one host. Set `follow` to follow redirects.
+
+    If `segments` is greater than 1, each single-URL download of at least
+    `minsegment` bytes per segment is fetched in that many byte ranges at
+    once (see `SegmentedDownload`); the segments of a file count toward the
+    per-host limit.
+    """
+
+    def __init__(self, maxconnects=8, perhost=2, follow=True, segments=1,
+                 minsegment=2**20):
+        self.maxconnects = maxconnects
+        self.perhost = perhost
+        self.follow = follow
+        self.segments = segments
+        self.minsegment = minsegment
+        self.multi = pycurl.CurlMulti()
+        try:
+            self.multi.setopt(pycurl.M_MAXCONNECTS, maxconnects)
+        except AttributeError:  # pragma: no cover
+            pass
+        self.handles = list()
+        self.idle = list()
+        self.queue = deque()
+        self.active = dict()
+        self.hosts = dict()
+        self.completed = list()
+        self.failed = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.close()
+
+    def add(self, urldata, localpath, compress=False, segments=None):
+        """Queue a download; see `Download` and `SegmentedDownload`."""
+        if segments is None:
+            segments = self.segments
+        download = Download(urldata, localpath, compress=compress)
+        if segments > 1 and len(download.urls) == 1:
+            download = SegmentedDownload(urldata, localpath, compress=compress,
+                                         segments=segments,
+                                         minsegment=self.minsegment)
+        self.queue.append(download)
+        return download
+
+    def _handle(self):
+        if self.idle:
+            return self.idle.pop()
+        handle = pycurl.Curl()
+        self.handles.append(handle)
+        return handle
+
+    def _release(self, handle):
+        self.multi.remove_handle(handle)
+        transfer = self.active.pop(handle)
+        self.hosts[transfer.host] -= 1
+        handle.reset()
+        self.idle.append(handle)
+        return transfer
 
+    def _start(self, transfer):
+        handle = self._handle()
+        transfer.begin(handle)
+        handle.setopt(pycurl.FAILONERROR, True)
+        handle.setopt(pycurl.NOSIGNAL, True)
+        if self.follow:
+            handle.setopt(pycurl.FOLLOWLOCATION, True)
+        self.multi.add_handle(handle)
+        self.active[handle] = transfer
+        self.hosts[transfer.host] = self.hosts.get(transfer.host, 0) + 1
 
-def url_download(urldata, localpath, compress=False, follow=True):
+    def _cancel(self, download):
+        """Stop all active and queued transfers of a download."""
+        for handle, transfer in list(self.active.items()):
+            if transfer.download is download:
+                self._release(handle)
+        self.queue = deque(t for t in self.queue if t.download is not download)
+
+    def _fail(self, download, error):
+        self._cancel(download)
+        download.error = error
+        download.close()
+        self.failed.append(download)
+
+    def _complete(self, download):
+        self._cancel(download)
+        try:
+            download.complete()
+        except (IOError, OSError) as e:
+            self._fail(download, e)
+            return
+        self.completed.append(download)
+
+    def _schedule(self):
+        """Start queued transfers, as many as the connection caps allow."""
+        started = 0
+        waiting = deque()
+        while self.queue and len(self.active) < self.maxconnects:
+            transfer = self.queue.popleft()
+            download = transfer.download
+            if not download.done and \
+                    self.hosts.get(transfer.host, 0) >= self.perhost:
+                waiting.append(transfer)
+                continue
+            try:
+                transfers = transfer.prepare()
+            except (IOError, OSError) as e:
+                self._fail(download, e)
+                continue
+            if transfers == [transfer]:
+                self._start(transfer)
+                started += 1
+            elif transfers:
+                self.queue.extendleft(reversed(transfers))
+            elif download.done:
+                self._complete(download)
+        waiting.extend(self.queue)
+        self.queue = waiting
+        return started
+
+    def _finish(self, handle, errno=None, errmsg=None):
+        if handle not in self.active:
+            # Cancelled along with another transfer of the same download.
+            return
+        status = handle.getinfo(pycurl.RESPONSE_CODE)
+        transfer = self._release(handle)
+        download = transfer.download
+        if errno is not None:
+            if transfer.fallback(errno, status):
+                self._cancel(download)
+                self.queue.appendleft(download)
+                return
+            self._fail(download, pycurl.error(errno, errmsg))
+            return
+        if not transfer.finish():
+            message = 'transfer closed with {:d} bytes remaining'.format(
+                transfer.remaining)
+            self._fail(download, pycurl.error(pycurl.E_PARTIAL_FILE, message))
+            return
+        if download.done:
+            self._complete(download)
+        elif transfer is download:
+            self.queue.appendleft(download)
+
+    def run(self):
+        """
+        Transfer all queued downloads.
+
+        All downloads are attempted even if some fail; then the first failure
+        (if any) is raised, with an error message for each printed to the
+        terminal. Failed downloads can be resumed later.
+        """
+        while self.queue or self.active:
+            if self._schedule() == 0 and not self.active:
+                break
+            while True:
+                status, _ = self.multi.perform()
+                if status != pycurl.E_CALL_MULTI_PERFORM:
+                    break
+            while True:
+                remaining, succeeded, failed = self.multi.info_read()
+                for handle in succeeded:
+                    self._finish(handle)
+                for handle, errno, errmsg in failed:
+                    self._finish(handle, errno, errmsg)
+                if remaining == 0:
+                    break
+            if self.active:
+                timeout = self.multi.timeout()
+                if timeout < 0 or timeout > 1000:
+                    timeout = 1000
+                if timeout > 0:
+                    self.multi.select(timeout / 1000.0)
+
+        if self.failed:
+            for download in self.failed:
+                url = download.url if not download.done else download.urls[-1]
+                print('Error: unable to download URL::', url, file=sys.stderr)
+            error = self.failed[0].error
+            self.failed = list()
+            raise error
+
+    def close(self):
+        for handle in list(self.active):
+            self.multi.remove_handle(handle)
+            self.active.pop(handle).download.close()
+        for handle in self.handles:
+            handle.close()
+        self.handles, self.idle = list(), list()
+        self.multi.close()
+
+
+def url_download(urldata, localpath, compress=False, follow=True,
+                 engine=None, segments=None):
     """
     Helper function for downloading remote data files with PycURL.
 
     - urldata: string(s), URL or list of URLs
     - localpath: path of the filename to which output will be written
     - compress: output compression
+    - engine: if given, the download is only queued to this `DownloadEngine`
+    - segments: number of byte ranges to download at once (see
+      `SegmentedDownload`); by default, the engine's setting
     """
-    urls = urldata
-    if isinstance(urldata, str):
-        urls = [urldata]
+    if engine is not None:
+        return engine.add(urldata, localpath, compress=compress,
+                          segments=segments)
+    connections = segments or 1
+    with DownloadEngine(maxconnects=connections, perhost=connections,
+                        follow=follow) as engine:
+        download = engine.add(urldata, localpath, compress=compress,
+                              segments=segments)
+        engine.run()
+    return download
 
-    openfunc = open
-    if compress is True:
-        openfunc = gzip.open
 
-    with openfunc(localpath, 'wb') as out:
-        for url in urls:
-            try:
-                c = pycurl.Curl()
-                c.setopt(c.URL, url)
-                c.setopt(c.WRITEDATA, out)
-                if follow:
-                    c.setopt(c.FOLLOWLOCATION, True)
-                c.perform()
-                c.close()
-            except pycurl.error as e:
-                print('Error: unable to download URL::', url, file=sys.stderr)
-                raise e
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+
+class _TestServer(object):
+    """
+    A local HTTP/1.1 server, standing in for a remote data host.
+
+    Serves files under `root`, with or without support for range requests;
+    if `ranges` is 'ignore', range requests are advertised but ignored. If
+    `validators` is false, no ETag is sent (and If-Range is ignored). If
+    `truncate` is set, each response is cut off after that many bytes and
+    the connection is closed, as if the transfer had been interrupted. If
+    `rate` is set, each response is sent at that many bytes per second.
+    """
+
+    def __init__(self, root='.', delay=0.0, ranges=True, truncate=None,
+                 rate=None, validators=True):
+        import threading
+        try:
+            from http.server import HTTPServer, BaseHTTPRequestHandler
+            from socketserver import ThreadingMixIn
+        except ImportError:  # pragma: no cover
+            from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+            from SocketServer import ThreadingMixIn
+        import time
+
+        server = self
+        self.root = root
+        self.ranges = ranges
+        self.truncate = truncate
+        self.rate = rate
+        self.validators = validators
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = list()
+        self.methods = list()
+        self.active = 0
+        self.maxactive = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with server.lock:
+                    server.connections += 1
+
+            def do_HEAD(self):
+                with server.lock:
+                    server.methods.append('HEAD')
+                self.respond(body=False)
+
+            def do_GET(self):
+                with server.lock:
+                    server.methods.append('GET')
+                    server.requests.append(self.headers.get('Range'))
+                    server.active += 1
+                    server.maxactive = max(server.maxactive, server.active)
+                time.sleep(delay)
+                try:
+                    self.respond()
+                finally:
+                    with server.lock:
+                        server.active -= 1
+
+            def respond(self, body=True):
+                path = os.path.join(server.root, self.path.lstrip('/'))
+                if not os.path.isfile(path):
+                    self.send_error(404)
+                    return
+                with open(path, 'rb') as infile:
+                    data = infile.read()
+                stat = os.stat(path)
+                etag = '"{:x}-{:x}"'.format(int(stat.st_mtime * 1e6),
+                                            stat.st_size)
+                begin, end = 0, len(data)
+                byterange = self.headers.get('Range')
+                ifrange = self.headers.get('If-Range')
+                if not server.validators:
+                    ifrange = None
+                if server.ranges is True and byterange and \
+                        ifrange in [None, etag]:
+                    first, last = byterange.split('=')[1].split('-')
+                    begin = int(first)
+                    end = int(last) + 1 if last else len(data)
+                    if begin >= len(data):
+                        self.send_error(416)
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes {:d}-{:d}/{:d}'
+                                     .format(begin, end - 1, len(data)))
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(end - begin))
+                if server.validators:
+                    self.send_header('ETag', etag)
+                if server.ranges:
+                    self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+                if not body:
+                    return
+                data = data[begin:end]
+                if server.truncate is not None:
+                    data = data[:server.truncate]
+                    self.close_connection = True
+                chunksize = 2**14
+                for i in range(0, len(data), chunksize):
+                    if server.rate:
+                        time.sleep(chunksize / float(server.rate))
+                    self.wfile.write(data[i:i + chunksize])
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.httpd = Server(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, path):
+        port = self.httpd.server_port
+        return 'http://127.0.0.1:{:d}/{:s}'.format(port, path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _TestFTPServer(object):
+    """
+    A local FTP server, standing in for a remote data host such as NCBI.
+
+    Serves files under `root` in passive mode, with support for the SIZE and
+    REST commands. The offset of each RETR command (or None if no REST came
+    before it) is recorded in `requests`. If `truncate` is set, each transfer
+    is cut off after that many bytes, as if it had been interrupted.
+    """
+
+    def __init__(self, root='.', truncate=None):
+        import socket
+        import threading
+        try:
+            from socketserver import (ThreadingMixIn, TCPServer,
+                                      StreamRequestHandler)
+        except ImportError:  # pragma: no cover
+            from SocketServer import (ThreadingMixIn, TCPServer,
+                                      StreamRequestHandler)
+
+        server = self
+        self.root = root
+        self.truncate = truncate
+        self.lock = threading.Lock()
+        self.commands = list()
+        self.requests = list()
+
+        class Handler(StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write((line + '\r\n').encode('ascii'))
+
+            def handle(self):
+                cwd, rest, passive = '', None, None
+                self.reply('220 Ready')
+                while True:
+                    line = self.rfile.readline().decode('ascii').strip()
+                    if not line:
+                        break
+                    command, _, arg = line.partition(' ')
+                    command = command.upper()
+                    with server.lock:
+                        server.commands.append(command)
+                    path = os.path.join(server.root, cwd, arg)
+                    if command in ['USER', 'PASS']:
+                        self.reply('230 Logged in')
+                    elif command == 'PWD':
+                        self.reply('257 "/"')
+                    elif command == 'CWD':
+                        cwd = os.path.join(cwd, arg)
+                        self.reply('250 OK')
+                    elif command == 'TYPE':
+                        self.reply('200 OK')
+                    elif command == 'EPSV':
+                        passive = socket.socket()
+                        passive.bind(('127.0.0.1', 0))
+                        passive.listen(1)
+                        port = passive.getsockname()[1]
+                        self.reply('229 Entering Extended Passive Mode '
+                                   '(|||{:d}|)'.format(port))
+                    elif command == 'SIZE' and os.path.isfile(path):
+                        self.reply('213 {:d}'.format(os.path.getsize(path)))
+                    elif command == 'REST':
+                        rest = int(arg)
+                        self.reply('350 Restarting')
+                    elif command == 'RETR' and os.path.isfile(path):
+                        with server.lock:
+                            server.requests.append(rest)
+                        self.retrieve(path, rest or 0, passive)
+                        rest, passive = None, None
+                    elif command == 'ABOR':
+                        self.reply('226 Aborted')
+                    elif command == 'QUIT':
+                        self.reply('221 Bye')
+                        break
+                    else:
+                        self.reply('550 Failed')
+
+            def retrieve(self, path, offset, passive):
+                data = _read(path)[offset:]
+                if server.truncate is not None:
+                    data = data[:server.truncate]
+                self.reply('150 Opening data connection')
+                connection, _ = passive.accept()
+                try:
+                    connection.sendall(data)
+                except (IOError, OSError):
+                    pass
+                connection.close()
+                passive.close()
+                self.reply('226 Transfer complete')
+
+        class Server(ThreadingMixIn, TCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.ftpd = Server(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.ftpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, path):
+        port = self.ftpd.server_address[1]
+        return 'ftp://127.0.0.1:{:d}/{:s}'.format(port, path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.ftpd.shutdown()
+        self.ftpd.server_close()
+
+
+def _read(path, mode='rb'):
+    with open(path, mode) as infile:
+        return infile.read()
+
+
+def test_url_download():
+    """Download: single file, multiple URLs, compression"""
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    files = ['testdata/fasta/am10-gdna-out.fa', 'testdata/fasta/atha-cds.fa']
+    with _TestServer() as server:
+        outfile = os.path.join(tmpdir, 'am10.fa')
+        url_download(server.url(files[0]), outfile)
+        assert _read(outfile) == _read(files[0])
+
+        outfile = os.path.join(tmpdir, 'both.fa.gz')
+        url_download([server.url(f) for f in files], outfile, compress=True)
+        with gzip.open(outfile, 'rb') as infile:
+            assert infile.read() == _read(files[0]) + _read(files[1])
+
+        outfile = os.path.join(tmpdir, 'bogus.fa')
+        try:
+            url_download(server.url('testdata/bogus.fa'), outfile)
+        except pycurl.error as e:
+            assert e.args[0] == pycurl.E_HTTP_RETURNED_ERROR
+        else:  # pragma: no cover
+            assert False, 'expected a failed download'
+    import shutil
+    shutil.rmtree(tmpdir)
+
+
+def test_engine():
+    """Download: concurrent transfers, per-host cap, connection reuse"""
+    import glob
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    files = sorted(glob.glob('testdata/fasta/*.fa'))[:12]
+    with _TestServer(delay=0.05) as server:
+        with DownloadEngine(maxconnects=8, perhost=3) as engine:
+            for i, infile in enumerate(files):
+                outfile = os.path.join(tmpdir, '{:d}.fa'.format(i))
+                engine.add(server.url(infile), outfile)
+            engine.run()
+            assert len(engine.completed) == len(files)
+            assert len(engine.handles) <= 3
+        assert len(server.requests) == len(files)
+        assert 1 < server.maxactive <= 3
+        assert server.connections <= 3
+
+    for i, infile in enumerate(files):
+        outfile = os.path.join(tmpdir, '{:d}.fa'.format(i))
+        assert _read(outfile) == _read(infile)
+    shutil.rmtree(tmpdir)
+
+
+def test_engine_failure():
+    """Download: all downloads attempted, first failure raised"""
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    infile = 'testdata/fasta/atha-cds.fa'
+    with _TestServer() as server:
+        engine = DownloadEngine(perhost=1)
+        engine.add(server.url('testdata/bogus.fa'), tmpdir + '/bogus.fa')
+        engine.add(server.url(infile), tmpdir + '/cds.fa')
+        try:
+            engine.run()
+        except pycurl.error:
+            pass
+        else:  # pragma: no cover
+            assert False, 'expected a failed download'
+        assert [d.localpath for d in engine.completed] == [tmpdir + '/cds.fa']
+        assert _read(tmpdir + '/cds.fa') == _read(infile)
+        engine.close()
+    shutil.rmtree(tmpdir)
+
+
+def test_resume():
+    """Download: resume an interrupted download with a range request"""
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    infile = 'testdata/fasta/atha-mrnas.fa'
+    outfile = os.path.join(tmpdir, 'mrnas.fa')
+    with _TestServer(truncate=1000) as server:
+        try:
+            url_download(server.url(infile), outfile)
+        except pycurl.error as e:
+            assert e.args[0] == pycurl.E_PARTIAL_FILE
+        else:  # pragma: no cover
+            assert False, 'expected an interrupted download'
+        assert not os.path.exists(outfile)
+        assert os.path.getsize(outfile + '.part') == 1000
+        with open(outfile + '.part.json', 'r') as instream:
+            state = json.load(instream)
+        assert state['size'] == os.path.getsize(infile)
+        assert state['etag'] is not None
+
+        server.truncate = None
+        download = url_download(server.url(infile), outfile)
+        assert server.requests == [None, 'bytes=1000-']
+        assert download.resumed == 1000
+        assert _read(outfile) == _read(infile)
+        assert not os.path.exists(outfile + '.part')
+        assert not os.path.exists(outfile + '.part.json')
+    shutil.rmtree(tmpdir)
+
+
+def test_resume_multi():
+    """Download: resume a multi-URL, compressed download"""
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    files = ['testdata/fasta/am10-gdna-out.fa', 'testdata/fasta/atha-cds.fa']
+    outfile = os.path.join(tmpdir, 'both.fa.gz')
+    with _TestServer() as server:
+        urls = [server.url(f) for f in files]
+        download = Download(urls, outfile, compress=True)
+        download.open()
+        download.outstream.write(_read(files[0]) + _read(files[1])[:300])
+        download.current, download.start = 1, len(_read(files[0]))
+        download.size = len(_read(files[1]))
+        download.close()
+        download._savestate()
+
+        download = url_download(urls, outfile, compress=True)
+        assert server.requests == ['bytes=300-']
+        with gzip.open(outfile, 'rb') as instream:
+            assert instream.read() == _read(files[0]) + _read(files[1])
+
+        # A partial file left by a download of other URLs is not resumed.
+        with open(outfile + '.part', 'wb') as outstream:
+            outstream.write(b'bogus')
+        Download(urls[::-1], outfile)._savestate()
+        url_download(urls, outfile, compress=True)
+        assert server.requests == ['bytes=300-', None, None]
+        with gzip.open(outfile, 'rb') as instream:
+            assert instream.read() == _read(files[0]) + _read(files[1])
+    shutil.rmtree(tmpdir)
+
+
+def test_resume_fallback():
+    """Download: full fetch if ranges are unsupported or the file changed"""
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    datafile = os.path.join(tmpdir, 'data.fa')
+    outfile = os.path.join(tmpdir, 'out.fa')
+    shutil.copy('testdata/fasta/atha-cds.fa', datafile)
+    with _TestServer(root=tmpdir, ranges=False, truncate=500) as server:
+        url = server.url('data.fa')
+        try:
+            url_download(url, outfile)
+        except pycurl.error:
+            pass
+        server.truncate = None
+        download = url_download(url, outfile)
+        assert server.requests == [None, 'bytes=500-']
+        assert _read(outfile) == _read(datafile)
+
+        # Interrupted, then the file changes: If-Range fails, full fetch.
+        server.ranges, server.truncate = True, 500
+        try:
+            url_download(url, outfile)
+        except pycurl.error:
+            pass
+        with open(datafile, 'ab') as outstream:
+            outstream.write(b'>extra\nACGT\n')
+        server.truncate = None
+        url_download(url, outfile)
+        assert server.requests[-1] == 'bytes=500-'
+        assert _read(outfile) == _read(datafile)
+
+        # Partial file already complete: no transfer needed.
+        server.truncate = 500
+        try:
+            url_download(url, outfile)
+        except pycurl.error:
+            pass
+        with open(outfile + '.part', 'wb') as outstream:
+            outstream.write(_read(datafile))
+        count = len(server.requests)
+        url_download(url, outfile)
+        assert len(server.requests) == count
+        assert _read(outfile) == _read(datafile)
+
+        # Range beyond the end of the file: 416, then full fetch.
+        try:
+            url_download(url, outfile)
+        except pycurl.error:
+            pass
+        with open(outfile + '.part', 'wb') as outstream:
+            outstream.write(_read(datafile) + b'ACGT')
+        with open(outfile + '.part.json', 'r') as instream:
+            state = json.load(instream)
+        state['size'] = None
+        with open(outfile + '.part.json', 'w') as outstream:
+            json.dump(state, outstream)
+        server.truncate = None
+        url_download(url, outfile)
+        offset = len(_read(datafile)) + 4
+        assert server.requests[-2:] == ['bytes={:d}-'.format(offset), None]
+        assert _read(outfile) == _read(datafile)
+    shutil.rmtree(tmpdir)
+
+
+def test_resume_changed():
+    """Download: full fetch if a file without validators changed size"""
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    datafile = os.path.join(tmpdir, 'data.fa')
+    outfile = os.path.join(tmpdir, 'out.fa')
+    original = _read('testdata/fasta/atha-cds.fa')
+    shutil.copy('testdata/fasta/atha-cds.fa', datafile)
+    with _TestServer(root=tmpdir, validators=False, truncate=500) as server:
+        url = server.url('data.fa')
+        try:
+            url_download(url, outfile)
+        except pycurl.error:
+            pass
+        with open(datafile, 'wb') as outstream:
+            outstream.write(b'>extra\nACGT\n' + original)
+        server.truncate = None
+        url_download(url, outfile)
+        assert server.requests == [None, 'bytes=500-', None]
+        assert _read(outfile) == _read(datafile)
+
+    shutil.copy('testdata/fasta/atha-cds.fa', datafile)
+    with _TestFTPServer(root=tmpdir, truncate=500) as server:
+        url = server.url('data.fa')
+        try:
+            url_download(url, outfile)
+        except pycurl.error:
+            pass
+        assert os.path.getsize(outfile + '.part') == 500
+        server.truncate = None
+        url_download(url, outfile)
+        assert server.requests == [None, 500]
+        assert _read(outfile) == _read(datafile)
+
+        server.truncate = 500
+        try:
+            url_download(url, outfile)
+        except pycurl.error:
+            pass
+        with open(datafile, 'wb') as outstream:
+            outstream.write(b'>extra\nACGT\n' + original)
+        server.truncate = None
+        url_download(url, outfile)
+        assert server.requests[2:] == [None, 500, None]
+        assert _read(outfile) == _read(datafile)
+    shutil.rmtree(tmpdir)
+
+
+def test_segmented():
+    """Download: segmented download with positioned writes"""
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    infile = 'testdata/fasta/atha-mrnas.fa'
+    size = os.path.getsize(infile)
+    outfile = os.path.join(tmpdir, 'mrnas.fa')
+    with _TestServer() as server:
+        with DownloadEngine(perhost=4, segments=4, minsegment=1000) as engine:
+            download = engine.add(server.url(infile), outfile)
+            engine.run()
+        assert isinstance(download, SegmentedDownload)
+        assert [seg.start for seg in download.segments] == \
+            [0, size // 4, size // 2, size * 3 // 4]
+        assert server.methods == ['HEAD'] + ['GET'] * 4
+        assert sorted(server.requests, key=lambda r: int(r[6:].split('-')[0]))\
+            == ['bytes={:d}-{:d}'.format(seg.start, seg.end - 1)
+                for seg in download.segments]
+        assert _read(outfile) == _read(infile)
+
+        # Multiple URLs and small files are downloaded in a single stream.
+        with DownloadEngine(segments=4, minsegment=size) as engine:
+            multi = engine.add([server.url(infile)] * 2, outfile + '.2')
+            small = engine.add(server.url(infile), outfile + '.gz',
+                               compress=True)
+            engine.run()
+        assert not isinstance(multi, SegmentedDownload)
+        assert small.segments is False
+        assert sorted(server.methods[5:]) == ['GET', 'GET', 'GET', 'HEAD']
+        assert _read(outfile + '.2') == _read(infile) * 2
+        with gzip.open(outfile + '.gz', 'rb') as instream:
+            assert instream.read() == _read(infile)
+    shutil.rmtree(tmpdir)
+
+
+def test_segmented_fallback():
+    """Download: single stream if the server doesn't support ranges"""
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    infile = 'testdata/fasta/atha-mrnas.fa'
+    outfile = os.path.join(tmpdir, 'mrnas.fa')
+    with _TestServer(ranges=False) as server:
+        with DownloadEngine(perhost=4, segments=4, minsegment=1000) as engine:
+            download = engine.add(server.url(infile), outfile)
+            engine.run()
+        assert download.segments is False
+        assert server.methods == ['HEAD', 'GET']
+        assert _read(outfile) == _read(infile)
+
+        # Ranges advertised, but ignored.
+        server.ranges = 'ignore'
+        with DownloadEngine(perhost=4, segments=4, minsegment=1000) as engine:
+            download = engine.add(server.url(infile), outfile)
+            engine.run()
+        assert download.segments is False
+        assert server.methods[2] == 'HEAD'
+        assert server.requests[-1] is None
+        assert _read(outfile) == _read(infile)
+    shutil.rmtree(tmpdir)
+
+
+def test_segmented_ftp():
+    """Download: segmented download and resume over FTP"""
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    infile = 'testdata/fasta/atha-mrnas.fa'
+    size = os.path.getsize(infile)
+    datafile = os.path.join(tmpdir, 'data.fa')
+    outfile = os.path.join(tmpdir, 'mrnas.fa')
+    shutil.copy(infile, datafile)
+    with _TestFTPServer(root=tmpdir) as server:
+        with DownloadEngine(perhost=4, segments=4, minsegment=1000) as engine:
+            download = engine.add(server.url('data.fa'), outfile)
+            engine.run()
+        assert [seg.start for seg in download.segments] == \
+            [0, size // 4, size // 2, size * 3 // 4]
+        assert sorted(offset or 0 for offset in server.requests) == \
+            [seg.start for seg in download.segments]
+        assert _read(outfile) == _read(infile)
+
+        # Interrupted, then the file changes: no If-Range, but the size
+        # reported by the server gives it away.
+        server.truncate = 500
+        engine = DownloadEngine(perhost=2, segments=2, minsegment=1000)
+        engine.add(server.url('data.fa'), outfile)
+        try:
+            engine.run()
+        except pycurl.error:
+            pass
+        else:  # pragma: no cover
+            assert False, 'expected an interrupted download'
+        engine.close()
+        with open(datafile, 'wb') as outstream:
+            outstream.write(b'>extra\nACGT\n' + _read(infile))
+        server.truncate = None
+        count = len(server.requests)
+        with DownloadEngine(perhost=2, segments=2, minsegment=1000) as engine:
+            download = engine.add(server.url('data.fa'), outfile)
+            engine.run()
+        assert download.segments is False
+        assert None in server.requests[count:]
+        assert _read(outfile) == _read(datafile)
+    shutil.rmtree(tmpdir)
+
+
+def test_segmented_resume():
+    """Download: resume each segment of an interrupted download"""
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    infile = 'testdata/fasta/atha-mrnas.fa'
+    outfile = os.path.join(tmpdir, 'mrnas.fa')
+    with _TestServer(truncate=500) as server:
+        engine = DownloadEngine(perhost=2, segments=2, minsegment=1000)
+        engine.add(server.url(infile), outfile)
+        try:
+            engine.run()
+        except pycurl.error as e:
+            assert e.args[0] == pycurl.E_PARTIAL_FILE
+        else:  # pragma: no cover
+            assert False, 'expected an interrupted download'
+        engine.close()
+        with open(outfile + '.part.json', 'r') as instream:
+            segments = json.load(instream)['segments']
+        assert len(segments) == 2
+        assert sum(seg[2] for seg in segments) > 0
+
+        server.truncate = None
+        count = len(server.requests)
+        with DownloadEngine(perhost=2, segments=2, minsegment=1000) as engine:
+            download = engine.add(server.url(infile), outfile)
+            engine.run()
+        assert download.resumed == sum(seg[2] for seg in segments)
+        assert sorted(server.requests[count:]) == sorted(
+            'bytes={:d}-{:d}'.format(start + received, end - 1)
+            for start, end, received in segments if received < end - start)
+        assert _read(outfile) == _read(infile)
+        assert not os.path.exists(outfile + '.part.json')
+
+        # A plain download cannot resume the segments; it starts over
+        os.remove(outfile)
+        server.truncate = 500
+        engine = DownloadEngine(perhost=2, segments=2, minsegment=1000)
+        engine.add(server.url(infile), outfile)
+        try:
+            engine.run()
+        except pycurl.error as e:
+            assert e.args[0] == pycurl.E_PARTIAL_FILE
+        else:  # pragma: no cover
+            assert False, 'expected an interrupted download'
+        engine.close()
+        assert os.path.getsize(outfile + '.part') == os.path.getsize(infile)
+
+        server.truncate = None
+        count = len(server.requests)
+        download = url_download(server.url(infile), outfile)
+        assert download.resumed == 0
+        assert server.requests[count:] == [None]
+        assert _read(outfile) == _read(infile)
+        assert not os.path.exists(outfile + '.part.json')
+    shutil.rmtree(tmpdir)
@@ -11,7 +11,6 @@
 from __future__ import print_function
 import filecmp
 import re
-import subprocess
 import sys
 import genhub
 
@@ -26,18 +25,12 @@ def cds_sequences(db, logstream=sys.stderr):
     gff3infile = '%s/%s.gff3' % (specdir, db.label)
     fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
     outfile = '%s/%s.all.cds.fa' % (specdir, db.label)
-    command = 'xtractore --type=CDS --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    genhub.extract.extract(gff3infile, fastainfile, outfile, 'CDS')
 
     gff3infile = '%s/%s.ilocus.mrnas.gff3' % (specdir, db.label)
     fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
     outfile = '%s/%s.cds.fa' % (specdir, db.label)
-    command = 'xtractore --type=CDS --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    genhub.extract.extract(gff3infile, fastainfile, outfile, 'CDS')
 
 
 def exon_sequences(db, logstream=sys.stderr):
@@ -50,10 +43,7 @@ def exon_sequences(db, logstream=sys.stderr):
     gff3infile = '%s/%s.ilocus.mrnas.gff3' % (specdir, db.label)
     fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
     outfile = '%s/%s.exons.fa' % (specdir, db.label)
-    command = 'xtractore --type=exon --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    genhub.extract.extract(gff3infile, fastainfile, outfile, 'exon')
 
 
 def parse_intron_accessions(instream):
@@ -79,32 +69,33 @@ def parse_intron_accessions(instream):
         yield(line)
 
 
-def intron_sequences(db, logstream=sys.stderr):
+def intron_intervals(db, logstream=sys.stderr):
+    """Label introns with their transcript accessions for extraction."""
     if logstream is not None:  # pragma: no cover
         logmsg = '[GenHub: %s] ' % db.config['species']
-        logmsg += 'extracting intron sequences'
+        logmsg += 'parsing intron accessions'
         print(logmsg, file=logstream)
     specdir = '%s/%s' % (db.workdir, db.label)
 
-    infile = '%s/%s.ilocus.mrnas.gff3' % (specdir, db.label)
-    outfile = '%s/%s.with-introns.gff3' % (specdir, db.label)
-    command = 'canon-gff3 --outfile=%s %s' % (outfile, infile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
-
     infile = '%s/%s.ilocus.mrnas.gff3' % (specdir, db.label)
     outfile = '%s/%s.with-introns.gff3' % (specdir, db.label)
     with open(infile, 'r') as instream, open(outfile, 'w') as outstream:
         for line in parse_intron_accessions(instream):
             print(line, file=outstream)
 
+
+def intron_sequences(db, logstream=sys.stderr):
+    if logstream is not None:  # pragma: no cover
+        logmsg = '[GenHub: %s] ' % db.config['species']
+        logmsg += 'extracting intron sequences'
+        print(logmsg, file=logstream)
+    specdir = '%s/%s' % (db.workdir, db.label)
+
+    intron_intervals(db, logstream=None)
     gff3infile = '%s/%s.with-introns.gff3' % (specdir, db.label)
     fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
     outfile = '%s/%s.introns.fa' % (specdir, db.label)
-    command = 'xtractore --type=intron --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    genhub.extract.extract(gff3infile, fastainfile, outfile, 'intron')
 
 
 # -----------------------------------------------------------------------------
@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+In-process extraction of feature sequences from an indexed genome.
+
+This module reproduces the output of AEGeAn's `xtractore` program: each
+feature of the requested type is written with a defline of the form
+`>label seqid_start-end strand`, and the sequence is wrapped at 80 columns.
+The label is the feature's `accession` attribute, falling back to `Name`,
+`ID`, and finally to the feature type and position. Multi-features (segments
+sharing an ID) are written as a single record, with the segment sequences
+concatenated in genomic order; features on the reverse strand are reverse
+complemented.
+
+Features are reported in the order in which `xtractore` traverses them: top-
+level features in file order, each followed depth-first by its descendants,
+with siblings sorted by position (ties in reverse file order).
+"""
+
+from __future__ import print_function
+from collections import OrderedDict
+from contextlib import contextmanager
+import filecmp
+import os
+import sys
+import genhub
+
+
+try:
+    _maketrans = bytes.maketrans
+except AttributeError:  # pragma: no cover
+    from string import maketrans as _maketrans
+_COMPLEMENT = _maketrans(b'ACGTRYKMBVDHNacgtrykmbvdhn',
+                         b'TGCAYRMKVBHDNtgcayrmkvbhdn')
+
+
+def revcomp(seq):
+    """Reverse complement of a nucleotide sequence (bytes), IUPAC aware."""
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+class Feature(object):
+    """A single GFF3 entry, linked to its children and multi-feature mates."""
+
+    __slots__ = ('seqid', 'ftype', 'start', 'end', 'strand', 'attrs',
+                 'index', 'children', 'segments')
+
+    def __init__(self, fields, index):
+        self.seqid = fields[0]
+        self.ftype = fields[2]
+        self.start = int(fields[3])
+        self.end = int(fields[4])
+        self.strand = fields[6]
+        self.attrs = dict()
+        for keyvalue in fields[8].split(';'):
+            if '=' in keyvalue:
+                key, value = keyvalue.split('=', 1)
+                self.attrs[key] = value
+        self.index = index
+        self.children = list()
+        self.segments = [self]
+
+    @property
+    def label(self):
+        for key in ['accession', 'Name', 'ID']:
+            if key in self.attrs:
+                return self.attrs[key]
+        return '%s:%s' % (self.ftype, self.position)
+
+    @property
+    def span(self):
+        if len(self.segments) == 1:
+            return self.start, self.end
+        return (min(seg.start for seg in self.segments),
+                max(seg.end for seg in self.segments))
+
+    @property
+    def position(self):
+        start, end = self.span
+        return '%s_%d-%d%s' % (self.seqid, start, end, self.strand)
+
+    @property
+    def defline(self):
+        return '>%s %s' % (self.label, self.position)
+
+    @property
+    def intervals(self):
+        """Coordinates of the feature's segments, in genomic order."""
+        return sorted([(seg.start, seg.end) for seg in self.segments])
+
+    def sequence(self, seqs):
+        """Retrieve the feature's sequence from a genome reader."""
+        seq = b''.join([seqs.fetch_bytes(self.seqid, start, end)
+                        for start, end in self.intervals])
+        if self.strand == '-':
+            seq = revcomp(seq)
+        return seq
+
+
+def features(instream):
+    """
+    Parse a GFF3 stream and yield features in `xtractore` traversal order.
+
+    Segments of a multi-feature are collapsed into the first segment, which is
+    the only one yielded; its `segments` attribute lists all of them.
+    """
+    entries = list()
+    byid = dict()
+    multis = dict()
+    for line in instream:
+        if line.startswith('#'):
+            continue
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) != 9:
+            continue
+        feature = Feature(fields, len(entries))
+        featid = feature.attrs.get('ID')
+        if featid is not None:
+            key = (feature.seqid, feature.ftype, featid)
+            if key in multis:
+                multis[key].segments.append(feature)
+                continue
+            multis[key] = feature
+            byid.setdefault(featid, feature)
+        entries.append(feature)
+
+    roots = list()
+    for feature in entries:
+        parents = list()
+        if 'Parent' in feature.attrs:
+            parents = [byid[parentid] for parentid
+                       in feature.attrs['Parent'].split(',')
+                       if parentid in byid]
+        for parent in parents:
+            parent.children.append(feature)
+        if len(parents) == 0:
+            roots.append(feature)
+
+    visited = set()
+    stack = list(reversed(roots))
+    while stack:
+        feature = stack.pop()
+        if feature.index in visited:
+            continue
+        visited.add(feature.index)
+        yield feature
+        children = sorted(feature.children,
+                          key=lambda f: (f.start, f.end, -f.index))
+        stack.extend(reversed(children))
+
+
+@contextmanager
+def _genome(seqfile):
+    """
+    Open a genome sequence file for random access.
+
+    A reader that is already open (such as the one returned by
+    `GenomeDB.genome`) is passed through, and is not closed on exit.
+    """
+    if hasattr(seqfile, 'fetch_bytes'):
+        yield seqfile
+    else:
+        with genhub.fasta.IndexedFasta(seqfile) as seqs:
+            yield seqs
+
+
+def extract(gff3file, seqfile, outfile, ftype):
+    """
+    Extract the sequences of all features of the given type.
+
+    This is a drop-in replacement for `xtractore --type=ftype`. The genome
+    sequence file is indexed (if it is not already) and accessed randomly, and
+    a .fai index is written alongside the output. An open genome reader may
+    be given in place of the sequence file name.
+    """
+    with _genome(seqfile) as seqs, \
+            open(gff3file, 'r') as instream, \
+            open(outfile, 'wb') as outstream:
+        writer = genhub.fasta.FastaWriter(outstream, linewidth=80)
+        with writer:
+            for feature in features(instream):
+                if feature.ftype != ftype:
+                    continue
+                writer.write(feature.defline, feature.sequence(seqs))
+        writer.write_index()
+
+
+def _splice(chrom, intervals, strand, defline):
+    """Assemble a feature's sequence from an in-memory chromosome."""
+    if intervals[0][0] < 1 or max([end for _, end in intervals]) > len(chrom):
+        message = 'invalid range for feature "%s"' % defline[1:]
+        message += ' (sequence length %d)' % len(chrom)
+        raise ValueError(message)
+    seq = b''.join([chrom[start - 1:end] for start, end in intervals])
+    if strand == '-':
+        seq = revcomp(seq)
+    return seq
+
+
+def _records(instream, ftypes):
+    """
+    Group the features of the given types by sequence ID.
+
+    Only what is needed to write each record (type, defline, strand, and
+    segment coordinates) is retained, not the full feature graph.
+    """
+    groups = OrderedDict()
+    for feature in features(instream):
+        if feature.ftype not in ftypes:
+            continue
+        record = (feature.ftype, feature.defline, feature.strand,
+                  feature.intervals)
+        groups.setdefault(feature.seqid, list()).append(record)
+    return groups
+
+
+def sweep(seqfile, jobs):
+    """
+    Extract sequences for many outputs with a single pass over the genome.
+
+    Each job is a `(gff3file, ftype, outfile)` tuple, equivalent to a call to
+    `extract`; each GFF3 file is parsed only once, however many jobs refer to
+    it. The genome is then visited one sequence at a time: each sequence is
+    loaded into memory once and every feature annotated on it is routed to its
+    output file(s), so that only a single chromosome is held in memory.
+
+    Output is identical to that of `extract`. Sequences are visited in the
+    order in which they appear in the GFF3 files; any GFF3 file whose order
+    disagrees with the others (not the case for files sorted by `gt gff3
+    -sort`) is handled separately by `extract`.
+    """
+    byfile = OrderedDict()
+    for gff3file, ftype, outfile in jobs:
+        byfile.setdefault(gff3file, list()).append((ftype, outfile))
+
+    tasks = list()
+    for gff3file, outputs in byfile.items():
+        ftypes = set([ftype for ftype, outfile in outputs])
+        with open(gff3file, 'r') as instream:
+            groups = _records(instream, ftypes)
+        tasks.append((gff3file, outputs, groups))
+
+    order = OrderedDict()
+    for gff3file, outputs, groups in tasks:
+        for seqid in groups:
+            order.setdefault(seqid, len(order))
+    insync = list()
+    for task in tasks:
+        ranks = [order[seqid] for seqid in task[2]]
+        if ranks == sorted(ranks):
+            insync.append(task)
+        else:
+            for ftype, outfile in task[1]:
+                extract(task[0], seqfile, outfile, ftype)
+
+    writers = dict()
+    try:
+        for gff3file, outputs, groups in insync:
+            for ftype, outfile in outputs:
+                outstream = open(outfile, 'wb')
+                writer = genhub.fasta.FastaWriter(outstream, linewidth=80)
+                writers.setdefault((gff3file, ftype), list()).append(writer)
+
+        with _genome(seqfile) as seqs:
+            for seqid in order:
+                chrom = None
+                for gff3file, outputs, groups in insync:
+                    if seqid not in groups:
+                        continue
+                    if chrom is None:
+                        chrom = seqs.fetch_bytes(seqid)
+                    for ftype, defline, strand, intervals in groups[seqid]:
+                        seq = _splice(chrom, intervals, strand, defline)
+                        for writer in writers[(gff3file, ftype)]:
+                            writer.write(defline, seq)
+
+        for writerlist in writers.values():
+            for writer in writerlist:
+                writer.write_index()
+    finally:
+        for writerlist in writers.values():
+            for writer in writerlist:
+                writer.outstream.close()
+
+
+def jobs(db, iloci=True):
+    """
+    List the sequence extraction jobs of the `iloci` and `breakdown` tasks.
+
+    Each job is a `(gff3file, ftype, outfile)` tuple; see `sweep`. The iLocus
+    and miLocus jobs are included only if `iloci` is true.
+    """
+    specdir = '%s/%s' % (db.workdir, db.label)
+    tasks = [
+        ('gff3', 'mRNA', 'all.pre-mrnas.fa'),
+        ('all.mrnas.gff3', 'mRNA', 'all.mrnas.fa'),
+        ('gff3', 'CDS', 'all.cds.fa'),
+        ('ilocus.mrnas.gff3', 'CDS', 'cds.fa'),
+        ('ilocus.mrnas.gff3', 'exon', 'exons.fa'),
+        ('with-introns.gff3', 'intron', 'introns.fa'),
+    ]
+    if iloci:
+        tasks = [('iloci.gff3', 'locus', 'iloci.fa'),
+                 ('miloci.gff3', 'locus', 'miloci.fa')] + tasks
+    joblist = list()
+    for gff3suffix, ftype, fastasuffix in tasks:
+        gff3file = '%s/%s.%s' % (specdir, db.label, gff3suffix)
+        outfile = '%s/%s.%s' % (specdir, db.label, fastasuffix)
+        joblist.append((gff3file, ftype, outfile))
+    return joblist
+
+
+# -----------------------------------------------------------------------------
+# Driver function
+# -----------------------------------------------------------------------------
+
+def prepare(db, iloci=True, logstream=sys.stderr):  # pragma: no cover
+    """
+    Extract all feature sequences with a single pass over the genome.
+
+    This replaces the sequence extraction steps of `iloci.prepare` (if `iloci`
+    is true), `mrnas.prepare`, and `exons.prepare`, which otherwise read the
+    genome sequence once per output file.
+    """
+    genhub.mrnas.mature_mrna_intervals(db, logstream=logstream)
+    genhub.exons.intron_intervals(db, logstream=logstream)
+    if logstream is not None:
+        logmsg = '[GenHub: %s] ' % db.config['species']
+        logmsg += 'extracting feature sequences'
+        print(logmsg, file=logstream)
+    with db.genome() as genome:
+        sweep(genome, jobs(db, iloci=iloci))
+    genhub.mrnas.representatives(db, logstream=logstream)
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+
+def test_revcomp():
+    """Extract: reverse complement"""
+    assert revcomp(b'ACGTNacgtn') == b'nacgtNACGT'
+    assert revcomp(b'GATTACA') == b'TGTAATC'
+    assert revcomp(b'RYKMSW') == b'WSKMRY'
+    assert revcomp(b'') == b''
+
+
+def test_features():
+    """Extract: GFF3 traversal order and multi-features"""
+    gff3 = ('##gff-version 3\n'
+            'chr1\t.\tgene\t100\t900\t.\t+\t.\tID=gene1\n'
+            'chr1\t.\tmRNA\t100\t900\t.\t+\t.\tID=rna1;Parent=gene1\n'
+            'chr1\t.\tmRNA\t100\t900\t.\t+\t.\tID=rna2;Parent=gene1\n'
+            'chr1\t.\texon\t100\t300\t.\t+\t.\tParent=rna1\n'
+            'chr1\t.\tCDS\t150\t300\t.\t+\t.\tID=cds1;Parent=rna1\n'
+            'chr1\t.\tCDS\t500\t800\t.\t+\t.\tID=cds1;Parent=rna1\n'
+            'chr1\t.\texon\t500\t900\t.\t+\t.\tParent=rna1\n'
+            'chr1\t.\texon\t100\t900\t.\t+\t.\tParent=rna2\n'
+            '###\n'
+            'chr1\t.\tlocus\t1000\t2000\t.\t.\t.\t\n')
+    feats = list(features(gff3.splitlines(True)))
+    types = [f.ftype for f in feats]
+    assert types == ['gene', 'mRNA', 'exon', 'mRNA', 'exon', 'CDS', 'exon',
+                     'locus'], types
+    assert feats[1].label == 'rna2'
+    cds = feats[5]
+    assert len(cds.segments) == 2
+    assert cds.defline == '>cds1 chr1_150-800+'
+    assert feats[-1].defline == '>locus:chr1_1000-2000. chr1_1000-2000.'
+
+
+def test_extract():
+    """Extract: feature sequences"""
+    workdir = 'testdata/demo-workdir/'
+    fastafile = workdir + 'Atha/Atha.gdna.fa'
+    cases = [
+        ('Atha/Atha.gff3', 'mRNA', 'atha-all-pre-mrnas.fa'),
+        ('Atha/Atha.ilocus.mrnas.gff3', 'CDS', 'atha-cds.fa'),
+        ('Atha/Atha.ilocus.mrnas.gff3', 'exon', 'atha-exons.fa'),
+        ('Atha/Atha.with-introns.gff3', 'intron', 'atha-introns.fa'),
+    ]
+    outfile = workdir + 'Atha/Atha.extract.fa'
+    for gff3file, ftype, testfile in cases:
+        extract(workdir + gff3file, fastafile, outfile, ftype)
+        testfile = 'testdata/fasta/' + testfile
+        assert filecmp.cmp(outfile, testfile), (ftype, testfile)
+        with open(outfile + '.fai', 'r') as instream:
+            entries = genhub.fasta.load_index(instream)
+        assert entries == genhub.fasta.build_index(outfile)
+
+    fastafile = workdir + 'Bdis/Bdis.gdna.fa'
+    for ltype in ['iloci', 'miloci']:
+        gff3file = 'testdata/gff3/bdis-%s.gff3' % ltype
+        extract(gff3file, fastafile, outfile, 'locus')
+        testfile = 'testdata/fasta/bdis-%s.fa' % ltype
+        assert filecmp.cmp(outfile, testfile), testfile
+
+    os.unlink(outfile)
+
+
+def test_sweep():
+    """Extract: single pass over the genome for many outputs"""
+    workdir = 'testdata/demo-workdir/Atha/'
+    jobs = [
+        (workdir + 'Atha.gff3', 'mRNA', workdir + 'Atha.all.pre-mrnas.fa'),
+        (workdir + 'Atha.ilocus.mrnas.gff3', 'CDS', workdir + 'Atha.cds.fa'),
+        (workdir + 'Atha.ilocus.mrnas.gff3', 'exon',
+         workdir + 'Atha.exons.fa'),
+        (workdir + 'Atha.with-introns.gff3', 'intron',
+         workdir + 'Atha.introns.fa'),
+    ]
+    testfiles = ['atha-all-pre-mrnas.fa', 'atha-cds.fa', 'atha-exons.fa',
+                 'atha-introns.fa']
+    genhub.twobit.convert(workdir + 'Atha.gdna.fa', workdir + 'Atha.gdna.2bit')
+    with genhub.twobit.TwoBitFile(workdir + 'Atha.gdna.2bit') as genome:
+        for seqfile in [workdir + 'Atha.gdna.fa', genome]:
+            sweep(seqfile, jobs)
+            for job, testfile in zip(jobs, testfiles):
+                outfile = job[2]
+                testfile = 'testdata/fasta/' + testfile
+                assert filecmp.cmp(outfile, testfile), (outfile, testfile)
+                with open(outfile + '.fai', 'r') as instream:
+                    entries = genhub.fasta.load_index(instream)
+                assert entries == genhub.fasta.build_index(outfile)
+                os.unlink(outfile + '.fai')
+    os.unlink(workdir + 'Atha.gdna.2bit')
@@ -11,7 +11,15 @@
 """Simple module for reading, writing, subsetting, and comparing sequences."""
 
 from __future__ import print_function
+from collections import Counter, namedtuple, OrderedDict
+import filecmp
+import hashlib
+import io
+import mmap
+import os
+import shutil
 import sys
+import tempfile
 try:
     from StringIO import StringIO
 except ImportError:  # pragma: no cover
@@ -39,16 +47,115 @@ def parse(data):
         yield (name, ''.join(seq))
 
 
-def format(seq, linewidth=70, outstream=sys.stdout):
-    """Print a sequence in a readable format."""
+BLOCKSIZE = 2**22
+
+
+def _record(header, seq, astext=False):
+    """Assemble a parsed Fasta record from pieces spanning several blocks."""
+    defline = b''.join(header).rstrip()
+    seq = b''.join(seq)
+    if astext:
+        return defline.decode('utf-8'), seq.decode('ascii')
+    return defline, seq
+
+
+def _next_record(block, pos, linestart=True):
+    """Offset of the next '>' at the start of a line, or -1 if none."""
+    i = block.find(b'>', pos)
+    while i > 0 and block[i - 1:i] != b'\n':
+        i = block.find(b'>', i + 1)
+    if i == 0 and not linestart:
+        return _next_record(block, 1)
+    return i
+
+
+def parse_bulk(instream, blocksize=BLOCKSIZE, astext=False):
+    """
+    Load sequences in Fasta format, reading the data in large binary blocks.
+
+    A faster alternative to `parse` for large files: rather than processing
+    the data line by line, record boundaries are located by searching each
+    block for '>' and line breaks are stripped from each sequence (or from
+    the part of it in each block) with a single `replace`. Records that lie
+    within a block are sliced directly out of it; only records spanning
+    several blocks are assembled from pieces. Yields a tuple containing a
+    defline and a sequence for each record, as bytes by default or as strings
+    if `astext` is true.
+
+    `instream` is a file-like object; text mode streams are read through
+    their underlying binary buffer when available.
+    """
+    read = instream.read
+    if hasattr(instream, 'buffer'):
+        read = instream.buffer.read
+
+    # A record spanning blocks: `header` holds the pieces of its defline, and
+    # `seq` those of its sequence (None while the defline is incomplete).
+    header, seq = None, None
+    linestart = True
+    while True:
+        block = read(blocksize)
+        if not block:
+            break
+        if not isinstance(block, bytes):
+            block = block.encode('utf-8')
+        if b'\r' in block:
+            block = block.replace(b'\r', b'')
+
+        pos = 0
+        if header is not None and seq is None:
+            newline = block.find(b'\n')
+            if newline < 0:
+                header.append(block)
+                linestart = False
+                continue
+            header.append(block[:newline])
+            seq = list()
+            pos = newline + 1
+
+        start = _next_record(block, pos, linestart)
+        linestart = block.endswith(b'\n')
+        if header is not None:
+            end = len(block) if start < 0 else start
+            seq.append(block[pos:end].replace(b'\n', b''))
+            if start < 0:
+                continue
+            yield _record(header, seq, astext)
+            header, seq = None, None
+
+        while start >= 0:
+            newline = block.find(b'\n', start)
+            if newline < 0:
+                header = [block[start:]]
+                break
+            end = _next_record(block, newline)
+            if end < 0:
+                header = [block[start:newline]]
+                seq = [block[newline + 1:].replace(b'\n', b'')]
+                break
+            defline = block[start:newline].rstrip()
+            sequence = block[newline + 1:end].replace(b'\n', b'')
+            if astext:
+                yield defline.decode('utf-8'), sequence.decode('ascii')
+            else:
+                yield defline, sequence
+            start = end
+
+    if header is not None:
+        yield _record(header, seq or [], astext)
+
+
+def _wrap(seq, linewidth, newline='\n'):
+    """Break a sequence into lines of the given width."""
     if linewidth == 0 or len(seq) <= linewidth:
-        print(seq, file=outstream)
-        return
+        return seq + newline
+    lines = [seq[i:i+linewidth] for i in range(0, len(seq), linewidth)]
+    return newline.join(lines) + newline
 
-    i = 0
-    while i < len(seq):
-        print(seq[i:i+linewidth], file=outstream)
-        i += linewidth
+
+def format(seq, linewidth=70, outstream=sys.stdout):
+    """Print a sequence in a readable format."""
+    outstream.write(_wrap(seq, linewidth))
 
 
 def select(idstream, seqstream):
@@ -63,14 +170,482 @@ def select(idstream, seqstream):
             yield defline, seq
 
 
+def select_indexed(idstream, seqfile, writer, order='file', relabel=None):
+    """
+    Write the requested records of a Fasta file.
+
+    Unlike `select`, this uses the file's index to seek directly to each
+    requested record rather than parsing every record in the file, and copies
+    raw bytes through whenever the record is already wrapped at the writer's
+    line width. Records are written in the order they occur in the file, or
+    in the order in which they were requested if `order` is `requested`. Only
+    the first record is written for a duplicated ID. If `relabel` is
+    provided, it is called on each defline to produce the output defline.
+
+    Files that cannot be indexed (inconsistent line widths) fall back to a
+    full scan with `select`.
+    """
+    assert order in ['requested', 'file'], 'unsupported order ' + order
+    try:
+        seqs = IndexedFasta(seqfile)
+    except ValueError:
+        ids = [line.rstrip() for line in idstream]
+        records = OrderedDict()
+        with open(seqfile, 'r') as seqstream:
+            for defline, seq in select(ids, seqstream):
+                seqid = defline[1:].split()[0]
+                if seqid not in records:
+                    records[seqid] = (defline, seq)
+        if order == 'requested':
+            ids = [seqid for seqid in ids if seqid in records]
+            records = OrderedDict((seqid, records[seqid]) for seqid in ids)
+        for defline, seq in records.values():
+            if relabel:
+                defline = relabel(defline)
+            writer.write(defline, seq)
+        return
+
+    with seqs:
+        for seqid in seqs.select(idstream, order=order):
+            defline = None
+            if relabel:
+                defline = relabel(seqs.defline(seqid))
+            writer.copy(seqs, seqid, defline=defline)
+
+
+def _digest(defline, seq):
+    """Compact digest of a Fasta record."""
+    if not isinstance(defline, bytes):
+        defline = defline.encode('utf-8')
+    if not isinstance(seq, bytes):
+        seq = seq.encode('utf-8')
+    if hasattr(hashlib, 'blake2b'):
+        digest = hashlib.blake2b(digest_size=16)
+    else:  # pragma: no cover
+        digest = hashlib.md5()
+    digest.update(defline)
+    digest.update(b'\n')
+    digest.update(seq)
+    return digest.digest()
+
+
+def _digest_counts(records):
+    counts = Counter()
+    for defline, seq in records:
+        counts[_digest(defline, seq)] += 1
+    return counts
+
+
 def compare(stream1, stream2):
-    seqs1 = dict()
-    seqs2 = dict()
-    for defline, seq in parse(stream1):
-        seqs1[defline] = seq
-    for defline, seq in parse(stream2):
-        seqs2[defline] = seq
-    return seqs1 == seqs2
+    """
+    Order-independent comparison of two sets of sequences.
+
+    Records are compared by digest, so only a small fixed-size hash of each
+    record is held in memory rather than the sequences themselves.
+    """
+    counts1 = _digest_counts(parse(stream1))
+    counts2 = _digest_counts(parse(stream2))
+    return counts1 == counts2
+
+
+def compare_files(file1, file2):
+    """
+    Order-independent comparison of two Fasta files, reporting differences.
+
+    Returns two lists of deflines: records found only in `file1`, and records
+    found only in `file2` (a record duplicated in one file but not the other
+    is reported once per extra copy). Both lists are empty if the files
+    contain the same records.
+
+    Files are streamed, and only a small digest of each record is kept in
+    memory. Byte-identical files are detected without parsing.
+    """
+    if os.path.getsize(file1) == os.path.getsize(file2) and \
+            filecmp.cmp(file1, file2, shallow=False):
+        return list(), list()
+
+    with open(file1, 'rb') as stream1, open(file2, 'rb') as stream2:
+        counts1 = _digest_counts(parse_bulk(stream1))
+        counts2 = _digest_counts(parse_bulk(stream2))
+    only1 = counts1 - counts2
+    only2 = counts2 - counts1
+    del counts1, counts2
+
+    differences = list()
+    for filename, extra in [(file1, only1), (file2, only2)]:
+        deflines = list()
+        if extra:
+            with open(filename, 'rb') as instream:
+                for defline, seq in parse_bulk(instream):
+                    digest = _digest(defline, seq)
+                    if extra[digest] > 0:
+                        extra[digest] -= 1
+                        deflines.append(defline.decode('utf-8'))
+        differences.append(deflines)
+    return differences[0], differences[1]
+
+
+# -----------------------------------------------------------------------------
+# Indexed random access
+# -----------------------------------------------------------------------------
+
+FaiEntry = namedtuple('FaiEntry', 'name length offset linebases linewidth')
+
+
+def _seqid(defline, keyfield=0):
+    """Sequence ID: the first token of a defline (bytes, sans '>')."""
+    tokens = defline[1:].split()
+    if len(tokens) <= keyfield:
+        return ''
+    return tokens[keyfield].decode('utf-8')
+
+
+def build_index(filename, keyfield=0):
+    """
+    Scan a Fasta file and compute a samtools-style index.
+
+    Returns a list of `FaiEntry` objects, one per record, in file order. Each
+    record's sequence must be wrapped at a constant line width (only the last
+    line of a record may be shorter), otherwise random access is impossible
+    and a ValueError is raised. When a sequence ID occurs more than once only
+    the first record is indexed. Records are named by the first token of the
+    defline, or by the token at position `keyfield`.
+    """
+    entries = list()
+    seen = set()
+    name = None
+    position = 0
+    with open(filename, 'rb') as instream:
+        for line in instream:
+            nbytes = len(line)
+            if line.startswith(b'>'):
+                if name is not None and name not in seen:
+                    seen.add(name)
+                    entries.append(FaiEntry(name, length, offset,
+                                            linebases or 0, linewidth or 0))
+                name = _seqid(line.rstrip(), keyfield)
+                offset = position + nbytes
+                length, linebases, linewidth, short = 0, None, None, False
+            elif name is not None:
+                bases = len(line.rstrip(b'\r\n'))
+                if linebases is None:
+                    linebases, linewidth = bases, nbytes
+                elif bases > 0 and (short or bases > linebases):
+                    message = 'inconsistent line length in record "%s" of ' \
+                              'file "%s"; cannot index' % (name, filename)
+                    raise ValueError(message)
+                if bases < linebases:
+                    short = True
+                length += bases
+            position += nbytes
+    if name is not None and name not in seen:
+        entries.append(FaiEntry(name, length, offset, linebases or 0,
+                                linewidth or 0))
+    return entries
+
+
+def write_index(entries, outstream):
+    """Write index entries in .fai format."""
+    for entry in entries:
+        print(*entry, sep='\t', file=outstream)
+
+
+def load_index(instream):
+    """Load index entries from a data stream in .fai format."""
+    entries = list()
+    for line in instream:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) < 5:
+            continue
+        values = [int(value) for value in fields[1:5]]
+        entries.append(FaiEntry(fields[0], *values))
+    return entries
+
+
+def index(filename, force=False):
+    """
+    Load the .fai index for a Fasta file, creating it if necessary.
+
+    The index is (re)built if it does not exist, if it is older than the Fasta
+    file, or if `force` is true. If the index cannot be saved (in a read-only
+    directory, for instance), it is kept in memory only.
+    """
+    faifile = filename + '.fai'
+    if not force and os.path.isfile(faifile) and \
+            os.path.getmtime(faifile) >= os.path.getmtime(filename):
+        with open(faifile, 'r') as instream:
+            return load_index(instream)
+
+    entries = build_index(filename)
+    try:
+        with open(faifile, 'w') as outstream:
+            write_index(entries, outstream)
+    except (IOError, OSError):
+        pass
+    return entries
+
+
+class IndexedFasta(object):
+    """
+    Random access to the records of an indexed Fasta file.
+
+    The file is memory-mapped and a samtools-compatible .fai index is loaded
+    (or built on first use), so any sequence or subsequence can be retrieved
+    by ID without scanning or loading the entire file.
+
+        >>> seqs = IndexedFasta('Bdis.gdna.fa')
+        >>> seqs.fetch('NW_014576703.1', 1, 10)
+        'ATAACGATTA'
+
+    Records are keyed by sequence ID, or by another token of the defline if
+    `keyfield` is set (as for the exons of `genhub.extract`, which share the
+    ID of their mRNA); such an index is built in memory rather than saved as
+    a .fai file.
+    """
+
+    def __init__(self, filename, force=False, keyfield=0):
+        self.filename = filename
+        self.entries = OrderedDict()
+        if keyfield == 0:
+            entries = index(filename, force=force)
+        else:
+            entries = build_index(filename, keyfield=keyfield)
+        for entry in entries:
+            self.entries[entry.name] = entry
+        self._file = open(filename, 'rb')
+        self._data = b''
+        if os.path.getsize(filename) > 0:
+            self._data = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, seqid):
+        return seqid in self.entries
+
+    def __getitem__(self, seqid):
+        return self.fetch(seqid)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def keys(self):
+        return self.entries.keys()
+
+    def length(self, seqid):
+        return self.entries[seqid].length
+
+    def _byte(self, entry, pos):
+        """File offset of the 0-based position `pos` in a sequence."""
+        line, column = divmod(pos, entry.linebases)
+        return entry.offset + line * entry.linewidth + column
+
+    def fetch_bytes(self, seqid, start=None, end=None):
+        """
+        Retrieve a sequence or subsequence as bytes.
+
+        Coordinates are 1-based and inclusive (as in GFF3); by default the
+        entire sequence is returned.
+        """
+        entry = self.entries[seqid]
+        if start is None:
+            start = 1
+        if end is None:
+            end = entry.length
+        if start < 1 or end > entry.length or end < start - 1:
+            message = 'invalid range %s:%d-%d' % (seqid, start, end)
+            message += ' (sequence length %d)' % entry.length
+            raise ValueError(message)
+        if end < start:
+            return b''
+
+        first = self._byte(entry, start - 1)
+        last = self._byte(entry, end - 1) + 1
+        chunk = self._data[first:last]
+        if entry.linewidth != entry.linebases:
+            chunk = chunk.translate(None, b'\r\n')
+        return chunk
+
+    def fetch(self, seqid, start=None, end=None):
+        """Retrieve a sequence or subsequence as a string."""
+        return self.fetch_bytes(seqid, start, end).decode('ascii')
+
+    def fetch_raw(self, seqid):
+        """Retrieve a record's sequence as raw bytes, line breaks included."""
+        entry = self.entries[seqid]
+        if entry.length == 0:
+            return b''
+        end = self._byte(entry, entry.length - 1) + 1
+        end += entry.linewidth - entry.linebases
+        return self._data[entry.offset:end]
+
+    def select(self, ids, order='requested'):
+        """
+        Yield the IDs of the requested records present in the file.
+
+        Records are reported in the order in which they were requested, or in
+        the order in which they occur in the file if `order` is `file`. Each
+        ID in `ids` may include trailing whitespace (such as a newline) and
+        is reported at most once.
+        """
+        assert order in ['requested', 'file'], 'unsupported order ' + order
+        selected = OrderedDict()
+        for seqid in ids:
+            seqid = seqid.rstrip()
+            if seqid in self.entries:
+                selected[seqid] = self.entries[seqid].offset
+        if order == 'file':
+            return iter(sorted(selected, key=selected.get))
+        return iter(selected)
+
+    def defline(self, seqid):
+        entry = self.entries[seqid]
+        linestart = self._data.rfind(b'\n', 0, entry.offset - 1) + 1
+        line = self._data[linestart:entry.offset].rstrip()
+        return line.decode('utf-8')
+
+    def record(self, seqid):
+        """Retrieve a (defline, sequence) tuple as yielded by `parse`."""
+        return self.defline(seqid), self.fetch(seqid)
+
+
+# -----------------------------------------------------------------------------
+# Buffered output
+# -----------------------------------------------------------------------------
+
+class FastaWriter(object):
+    """
+    Buffered writer for sequences in Fasta format.
+
+    Records are wrapped with slicing and a single join, and accumulate in
+    memory until `bufsize` bytes are pending, so that large genomes are
+    written with a handful of large writes rather than one `print` per line.
+    Deflines and sequences may be provided as strings or bytes, and the output
+    stream may be opened in text or binary mode.
+
+    The byte offset and line geometry of each record are recorded as it is
+    written, so a .fai index for the output can be produced without re-reading
+    it (see `write_index`). Offsets assume the writer starts at the beginning
+    of the output file.
+
+        >>> with FastaWriter(outstream, linewidth=80) as writer:
+        ...     for defline, seq in parse_bulk(instream):
+        ...         writer.write(defline, seq)
+        >>> writer.write_index()
+    """
+
+    def __init__(self, outstream, linewidth=70, bufsize=BLOCKSIZE):
+        self.outstream = outstream
+        self.linewidth = linewidth
+        self.bufsize = bufsize
+        self.entries = list()
+        self.binary = not isinstance(outstream, io.TextIOBase)
+        self._buffer = list()
+        self._buffered = 0
+        self._position = 0
+        self._seqids = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.flush()
+
+    def _convert(self, data):
+        """Convert bytes or text to the type expected by the output stream."""
+        if self.binary and not isinstance(data, bytes):
+            return data.encode('utf-8')
+        if not self.binary and isinstance(data, bytes):
+            return data.decode('utf-8')
+        return data
+
+    def _linebases(self, length):
+        """Bases per line for a sequence of the given length."""
+        if self.linewidth > 0 and length > self.linewidth:
+            return self.linewidth
+        return length
+
+    def _emit(self, defline, record, length):
+        """Buffer a defline and a wrapped sequence, and index the record."""
+        newline = b'\n' if self.binary else '\n'
+        header = defline + newline
+        rawheader = header if self.binary else header.encode('utf-8')
+        offset = self._position + len(rawheader)
+        seqid = _seqid(rawheader.rstrip())
+        if seqid not in self._seqids:
+            self._seqids.add(seqid)
+            linebases = self._linebases(length)
+            entry = FaiEntry(seqid, length, offset, linebases, linebases + 1)
+            self.entries.append(entry)
+        self._position = offset + len(record)
+
+        self._buffer.append(header)
+        self._buffer.append(record)
+        self._buffered += len(header) + len(record)
+        if self._buffered >= self.bufsize:
+            self.flush()
+
+    def write(self, defline, seq):
+        """Write a single record; `defline` includes the leading '>'."""
+        defline = self._convert(defline)
+        seq = self._convert(seq)
+        newline = b'\n' if self.binary else '\n'
+        self._emit(defline, _wrap(seq, self.linewidth, newline), len(seq))
+
+    def copy(self, seqs, seqid, defline=None):
+        """
+        Write a record retrieved from an `IndexedFasta` object.
+
+        If the record is already wrapped at this writer's line width, its raw
+        bytes are copied through without re-wrapping. By default the record's
+        original defline is used.
+        """
+        if defline is None:
+            defline = seqs.defline(seqid)
+        entry = seqs.entries[seqid]
+        linebases = self._linebases(entry.length)
+        if entry.length > 0 and entry.linebases == linebases and \
+                entry.linewidth == linebases + 1:
+            record = seqs.fetch_raw(seqid)
+            if record.endswith(b'\n'):
+                record = self._convert(record)
+                self._emit(self._convert(defline), record, entry.length)
+                return
+        self.write(defline, seqs.fetch_bytes(seqid))
+
+    def flush(self):
+        """Write any pending data to the output stream."""
+        if self._buffer:
+            empty = b'' if self.binary else ''
+            self.outstream.write(empty.join(self._buffer))
+            self._buffer = list()
+            self._buffered = 0
+        self.outstream.flush()
+
+    def write_index(self, faifile=None):
+        """
+        Write a .fai index for the output.
+
+        By default the index is written alongside the output file, using the
+        output stream's file name.
+        """
+        self.flush()
+        if faifile is None:
+            faifile = self.outstream.name + '.fai'
+        with open(faifile, 'w') as outstream:
+            write_index(self.entries, outstream)
 
 
 def test_parse():
@@ -92,6 +667,48 @@ def test_parse():
     assert seqs == testseqs, 'empty seqfile fail %r %r' % (seqs, testseqs)
 
 
+def test_parse_bulk():
+    """Fasta: bulk parsing"""
+    data = ('preamble\n'
+            '>seq1 first\n'
+            'ACGT\n'
+            '>seq2\n'
+            'ACGTACGTACGTACGT\r\n'
+            'ACGTACGTACGTACGT\n'
+            '>seq3\n'
+            '>seq4\n'
+            'AC')
+    records = [(b'>seq1 first', b'ACGT'),
+               (b'>seq2', b'ACGTACGTACGTACGTACGTACGTACGTACGT'),
+               (b'>seq3', b''), (b'>seq4', b'AC')]
+    for blocksize in [1, 2, 3, 5, 7, 11, BLOCKSIZE]:
+        instream = io.BytesIO(data.encode('utf-8'))
+        testrecords = list(parse_bulk(instream, blocksize=blocksize))
+        assert testrecords == records, (blocksize, testrecords)
+
+    instream = StringIO(data)
+    testrecords = list(parse_bulk(instream, blocksize=4, astext=True))
+    assert testrecords[1] == ('>seq2', 'ACGTACGTACGTACGTACGTACGTACGTACGT')
+    assert list(parse_bulk(io.BytesIO(b''))) == []
+
+    data = '>seq1 a>b\nAC\nGT\n>seq2\n\n>seq3 c\nA'
+    records = [(b'>seq1 a>b', b'ACGT'), (b'>seq2', b''), (b'>seq3 c', b'A')]
+    for blocksize in [1, 2, 3, 4, 6, 9, BLOCKSIZE]:
+        instream = io.BytesIO(data.encode('utf-8'))
+        testrecords = list(parse_bulk(instream, blocksize=blocksize))
+        assert testrecords == records, (blocksize, testrecords)
+
+    for testfile in ['am10-gdna-out.fa', 'atha-exons.fa', 'mmus-gdna.fa',
+                     'hsal-13-prot-out.fa']:
+        testfile = 'testdata/fasta/' + testfile
+        with open(testfile, 'r') as instream:
+            records = list(parse(instream))
+        with open(testfile, 'r') as instream:
+            testrecords = list(parse_bulk(instream, blocksize=1000,
+                                          astext=True))
+        assert records == testrecords, testfile
+
+
 def test_format_seq():
     """Fasta: sequence formatting"""
     seq = ('TCTCCCTCCA'
@@ -133,6 +750,48 @@ def test_format_seq():
     sio.close()
 
 
+def test_writer():
+    """Fasta: buffered output"""
+    seq = ('TCTCCCTCCA'
+           'ACGCCCGAAC'
+           'GTGTCTGCTC')
+    for linewidth, bufsize in [(0, 1), (10, 16), (20, 4096), (40, 4096)]:
+        sio = StringIO()
+        for defline in ['>seq1 first', '>seq2', '>seq3']:
+            print(defline, file=sio)
+            format(seq, linewidth=linewidth, outstream=sio)
+        print('>seq4', file=sio)
+        format('', linewidth=linewidth, outstream=sio)
+
+        for outstream in [io.StringIO(), io.BytesIO()]:
+            writer = FastaWriter(outstream, linewidth=linewidth,
+                                 bufsize=bufsize)
+            with writer:
+                writer.write('>seq1 first', seq)
+                writer.write(b'>seq2', seq.encode('utf-8'))
+                writer.write('>seq3', seq.encode('utf-8'))
+                writer.write('>seq4', '')
+            testdata = outstream.getvalue()
+            if isinstance(testdata, bytes):
+                testdata = testdata.decode('utf-8')
+            assert testdata == sio.getvalue(), (linewidth, testdata)
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            seqfile = os.path.join(tempdir, 'seqs.fa')
+            with open(seqfile, 'w') as outstream:
+                outstream.write(sio.getvalue())
+            assert writer.entries == build_index(seqfile), writer.entries
+            with open(seqfile, 'w') as outstream:
+                with FastaWriter(outstream, linewidth=linewidth) as writer:
+                    writer.write('>seq1 first', seq)
+                writer.write_index()
+            with open(seqfile + '.fai', 'r') as instream:
+                assert load_index(instream) == build_index(seqfile)
+        finally:
+            shutil.rmtree(tempdir)
+
+
 def test_select():
     """Fasta: sequence extraction"""
     data = ('>seq1\n'
@@ -148,6 +807,62 @@ def test_select():
         'extracted sequence mismatch: %r %r' % (seqs, testseqs)
 
 
+def test_select_indexed():
+    """Fasta: index-driven sequence extraction"""
+    data = ('>seq1\n'
+            'ACGT\n'
+            '>seq2 second\n'
+            'ACGTACGTACGTACGT\n'
+            'ACGTACGTACGTACGT\n'
+            '>seq3\n'
+            'ACGTA\n')
+    tempdir = tempfile.mkdtemp()
+    try:
+        seqfile = os.path.join(tempdir, 'seqs.fa')
+        with open(seqfile, 'w') as outstream:
+            outstream.write(data)
+        with IndexedFasta(seqfile) as seqs:
+            assert seqs.fetch_raw('seq2') == b'ACGTACGTACGTACGT\n' * 2
+            assert list(seqs.select(['seq3\n', 'seq1\n', 'bogus\n',
+                                     'seq3\n'])) == ['seq3', 'seq1']
+            assert list(seqs.select(['seq3', 'seq1'], order='file')) == \
+                ['seq1', 'seq3']
+
+        def relabel(defline):
+            return '>gnl|Test|' + defline[1:]
+
+        with open(seqfile, 'r') as seqstream:
+            records = dict((d[1:].split()[0], (d, s))
+                           for d, s in parse(seqstream))
+        for linewidth in [16, 8]:
+            for order in ['file', 'requested']:
+                ids = ['seq2', 'seq3']
+                if order == 'requested':
+                    ids = ids[::-1]
+                sio = StringIO()
+                for seqid in ids:
+                    defline, seq = records[seqid]
+                    print(relabel(defline), file=sio)
+                    format(seq, linewidth=linewidth, outstream=sio)
+
+                outstream = io.StringIO()
+                with FastaWriter(outstream, linewidth=linewidth) as writer:
+                    select_indexed(['seq3\n', 'seq2\n'], seqfile, writer,
+                                   order=order, relabel=relabel)
+                assert outstream.getvalue() == sio.getvalue(), \
+                    (order, linewidth, outstream.getvalue())
+
+        with open(seqfile, 'w') as outstream:
+            outstream.write(data.replace('ACGTA', 'ACG\nTA'))
+        outstream = io.StringIO()
+        with FastaWriter(outstream, linewidth=3) as writer:
+            select_indexed(['seq3', 'seq1'], seqfile, writer,
+                           order='requested')
+        assert outstream.getvalue() == '>seq3\nACG\nTA\n>seq1\nACG\nT\n'
+    finally:
+        shutil.rmtree(tempdir)
+
+
 def test_compare():
     """Fasta: order-independent sequence comparison"""
     data1 = ('>seq1\n'
@@ -163,3 +878,102 @@ def test_compare():
 
     assert compare(data1.split('\n'), data2.split('\n')), \
         'sequence comparison failed'
+
+
+def test_compare_files():
+    """Fasta: streaming file comparison"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        file1 = os.path.join(tempdir, 'seqs1.fa')
+        file2 = os.path.join(tempdir, 'seqs2.fa')
+        with open(file1, 'w') as outstream:
+            outstream.write('>seq1\nACGT\n>seq2\nACGTACGT\nACGTACGT\n'
+                            '>seq3\nAAAA\n')
+        shutil.copy(file1, file2)
+        assert compare_files(file1, file2) == ([], [])
+
+        with open(file2, 'w') as outstream:
+            outstream.write('>seq3\nAAAA\n>seq2\nACGTACGTACGTACGT\n'
+                            '>seq1\nACGT\n')
+        assert compare_files(file1, file2) == ([], [])
+
+        with open(file2, 'w') as outstream:
+            outstream.write('>seq3\nAAAT\n>seq2\nACGTACGTACGTACGT\n'
+                            '>seq1\nACGT\n>seq1\nACGT\n>seq4\nA\n')
+        only1, only2 = compare_files(file1, file2)
+        assert only1 == ['>seq3'], only1
+        assert only2 == ['>seq3', '>seq1', '>seq4'], only2
+        with open(file1, 'r') as stream1, open(file2, 'r') as stream2:
+            assert compare(stream1, stream2) is False
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_index():
+    """Fasta: building and loading a .fai index"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        seqfile = os.path.join(tempdir, 'seqs.fa')
+        with open(seqfile, 'w') as outstream:
+            outstream.write('>seq1 first\nACGTA\nCG\n>seq2\nACGTACGT\n'
+                            '>seq3\n>seq1 dup\nTTTT\n')
+        entries = index(seqfile)
+        assert entries == [FaiEntry('seq1', 7, 12, 5, 6),
+                           FaiEntry('seq2', 8, 27, 8, 9),
+                           FaiEntry('seq3', 0, 42, 0, 0)], entries
+        assert os.path.exists(seqfile + '.fai')
+        with open(seqfile + '.fai', 'r') as instream:
+            assert instream.readline() == 'seq1\t7\t12\t5\t6\n'
+        assert index(seqfile) == entries
+
+        with open(seqfile, 'w') as outstream:
+            outstream.write('>seq1\nACG\nACGT\n')
+        try:
+            index(seqfile, force=True)
+        except ValueError as e:
+            assert 'inconsistent line length' in str(e)
+        else:  # pragma: no cover
+            assert False, 'non-uniform line widths indexed'
+
+        # An index that cannot be written (here, a directory is in the way)
+        # is kept in memory
+        seqfile = os.path.join(tempdir, 'unwritable.fa')
+        with open(seqfile, 'w') as outstream:
+            outstream.write('>seq1\nACGT\n')
+        os.mkdir(seqfile + '.fai')
+        assert index(seqfile) == [FaiEntry('seq1', 4, 6, 4, 5)]
+        assert IndexedFasta(seqfile).fetch('seq1', 2, 3) == 'CG'
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_indexed_fasta():
+    """Fasta: random access with an indexed reader"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        for testfile in ['bdis-iloci.fa', 'hsal-first-7-out.fa']:
+            seqfile = os.path.join(tempdir, testfile)
+            shutil.copy('testdata/fasta/' + testfile, seqfile)
+            with open(seqfile, 'r') as instream:
+                records = list(parse(instream))
+            with IndexedFasta(seqfile) as seqs:
+                assert len(seqs) == len(records)
+                for defline, seq in records:
+                    seqid = defline[1:].split()[0]
+                    assert seqid in seqs
+                    assert seqs.length(seqid) == len(seq)
+                    assert seqs.record(seqid) == (defline, seq)
+                    for start, end in [(1, 1), (2, 81), (50, 250)]:
+                        end = min(end, len(seq))
+                        assert seqs.fetch(seqid, start, end) == \
+                            seq[start-1:end]
+                    assert seqs.fetch(seqid, 5, 4) == ''
+                assert list(seqs) == [d[1:].split()[0] for d, s in records]
+                try:
+                    seqs.fetch(seqid, 0, 10)
+                except ValueError as e:
+                    assert 'invalid range' in str(e)
+                else:  # pragma: no cover
+                    assert False, 'invalid range accepted'
+    finally:
+        shutil.rmtree(tempdir)
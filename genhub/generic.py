@@ -41,7 +41,7 @@ class GenericDB(genhub.genomedb.GenomeDB):
     def protpath(self):
         return self.config['prot']
 
-    def download(self, logstream=sys.stderr):
+    def download(self, logstream=sys.stderr, engine=None):
         subprocess.call(['mkdir', '-p', self.dbdir])
         if logstream is not None:  # pragma: no cover
             msg = '[GenHub: %s] checking input files' % self.config['species']
@@ -24,6 +24,7 @@ import glob
 import gzip
 import hashlib
 import os
+import shutil
 import subprocess
 import sys
 import tempfile
@@ -98,6 +99,16 @@ class GenomeDB(object):
         filename = '%s.gdna.fa' % self.label
         return self.file_path(filename)
 
+    @property
+    def twobitfile(self):
+        filename = '%s.gdna.2bit' % self.label
+        return self.file_path(filename)
+
+    @property
+    def compindexdir(self):
+        dirname = '%s.gdna.comp' % self.label
+        return self.file_path(dirname)
+
     @property
     def gff3file(self):
         filename = '%s.gff3' % self.label
@@ -143,6 +154,11 @@ class GenomeDB(object):
         filename = '%s.pre-mrnas.tsv' % self.label
         return self.file_path(filename)
 
+    @property
+    def summaryfile(self):
+        filename = '%s.summary.json' % self.label
+        return self.file_path(filename)
+
     # ----------
     # Determine whether raw data files need to be compressed during download.
     # ----------
@@ -183,7 +199,8 @@ class GenomeDB(object):
     # Build task method implementations.
     # ----------
 
-    def download_gdna(self, logstream=sys.stderr):  # pragma: no cover
+    def download_gdna(self, logstream=sys.stderr,
+                      engine=None):  # pragma: no cover
         """Download genomic DNA sequence."""
         subprocess.call(['mkdir', '-p', self.dbdir])
         if logstream is not None:
@@ -191,9 +208,11 @@ class GenomeDB(object):
             logmsg += 'download genome sequence from %r' % self
             print(logmsg, file=logstream)
         genhub.download.url_download(self.gdnaurl, self.gdnapath,
-                                     compress=self.compress_gdna)
+                                     compress=self.compress_gdna,
+                                     engine=engine)
 
-    def download_gff3(self, logstream=sys.stderr):  # pragma: no cover
+    def download_gff3(self, logstream=sys.stderr,
+                      engine=None):  # pragma: no cover
         """Download genome annotation."""
         subprocess.call(['mkdir', '-p', self.dbdir])
         if logstream is not None:
@@ -201,9 +220,11 @@ class GenomeDB(object):
             logmsg += 'download genome annotation from %r' % self
             print(logmsg, file=logstream)
         genhub.download.url_download(self.gff3url, self.gff3path,
-                                     compress=self.compress_gff3)
+                                     compress=self.compress_gff3,
+                                     engine=engine)
 
-    def download_prot(self, logstream=sys.stderr):  # pragma: no cover
+    def download_prot(self, logstream=sys.stderr,
+                      engine=None):  # pragma: no cover
         """Download protein sequences."""
         subprocess.call(['mkdir', '-p', self.dbdir])
         if logstream is not None:
@@ -211,19 +232,32 @@ class GenomeDB(object):
             logmsg += 'download protein sequences from %r' % self
             print(logmsg, file=logstream)
         genhub.download.url_download(self.proturl, self.protpath,
-                                     compress=self.compress_prot)
+                                     compress=self.compress_prot,
+                                     engine=engine)
+
+    def download(self, logstream=sys.stderr, engine=None):  # pragma: no cover
+        """
+        Run download task.
 
-    def download(self, logstream=sys.stderr):  # pragma: no cover
-        """Run download task."""
+        If a `genhub.download.DownloadEngine` is given, the data files are
+        only queued for download by the engine; otherwise they are downloaded
+        concurrently before returning.
+        """
         subprocess.call(['mkdir', '-p', self.dbdir])
-        self.download_gdna(logstream)
-        self.download_gff3(logstream)
-        self.download_prot(logstream)
+        if engine is None:
+            with genhub.download.DownloadEngine() as engine:
+                self.download(logstream=logstream, engine=engine)
+                engine.run()
+            return
+        self.download_gdna(logstream, engine=engine)
+        self.download_gff3(logstream, engine=engine)
+        self.download_prot(logstream, engine=engine)
 
-    def prep(self, logstream=sys.stderr, verify=True,
-             strict=True):  # pragma: no cover
+    def prep(self, logstream=sys.stderr, verify=True, strict=True,
+             twobit=False):  # pragma: no cover
         """Run prep task"""
-        self.preprocess_gdna(logstream=logstream, verify=verify, strict=strict)
+        self.preprocess_gdna(logstream=logstream, verify=verify, strict=strict,
+                             twobit=twobit)
         self.preprocess_gff3(logstream=logstream, verify=verify, strict=strict)
         self.preprocess_prot(logstream=logstream, verify=verify, strict=strict)
 
@@ -298,8 +332,37 @@ class GenomeDB(object):
                 message += '%s without a checksum' % datatypes[datatype]
                 print(message, file=logstream)
 
-    def preprocess_gdna(self, logstream=sys.stderr, verify=True, strict=True):
+    def preprocess_gdna(self, logstream=sys.stderr, verify=True, strict=True,
+                        twobit=False):
+        """
+        Preprocess the genome sequence file.
+
+        Set `twobit` to True to also store the genome in packed .2bit format;
+        see `pack_gdna`.
+        """
         self.preprocess('gdna', logstream, verify, strict)
+        if twobit:
+            self.pack_gdna(logstream=logstream)
+
+    def pack_gdna(self, logstream=sys.stderr):
+        """
+        Store the genome sequence in packed .2bit format.
+
+        The packed genome is about a quarter the size of the Fasta file, and
+        is used by `genome()` for random access when present. Genomes with
+        IUPAC symbols other than N cannot be packed without loss; in that case
+        a warning is issued and the Fasta file is used as is.
+        """
+        if logstream is not None:  # pragma: no cover
+            logmsg = '[GenHub: %s] ' % self.config['species']
+            logmsg += 'packing genome sequence'
+            print(logmsg, file=logstream)
+        try:
+            genhub.twobit.convert(self.gdnafile, self.twobitfile)
+        except ValueError as e:
+            if logstream is not None:  # pragma: no cover
+                message = 'Warning: genome sequence not packed; %s' % str(e)
+                print(message, file=logstream)
 
     def preprocess_gff3(self, logstream=sys.stderr, verify=True, strict=True):
         self.preprocess('gff3', logstream, verify, strict)
@@ -347,10 +410,11 @@ class GenomeDB(object):
         Clean up the DB working directory.
 
         By default, the files to be kept are the following.
-        - *.iloci.fa
+        - *.iloci.fa (and its .fai index)
         - *.iloci.gff3
         - *.miloci.gff3
-        - *.tsv
+        - *.tsv (and the columnar *.npz tables)
+        - *.summary.json
         - original (downloaded) data files
         All other files are deleted.
 
@@ -363,7 +427,8 @@ class GenomeDB(object):
         """
         dbfiles = glob.glob(self.dbdir + '/*')
         files_deleted = list()
-        suffixes = ['.iloci.fa', '.iloci.gff3', '.miloci.gff3', '.tsv']
+        suffixes = ['.iloci.fa', '.iloci.fa.fai', '.iloci.gff3',
+                    '.miloci.gff3', '.tsv', '.npz', '.summary.json']
         for dbfile in dbfiles:
             tokeep = False
             for suffix in suffixes:
@@ -385,9 +450,60 @@ class GenomeDB(object):
                     continue
             files_deleted.append(dbfile)
             if not dryrun:  # pragma: no cover
-                os.unlink(dbfile)
+                if os.path.isdir(dbfile):
+                    shutil.rmtree(dbfile)
+                else:
+                    os.unlink(dbfile)
         return files_deleted
 
+    def fasta(self, datatype):
+        """
+        Random-access reader for one of the DB's Fasta files.
+
+        The `datatype` is the file name minus the label and the `.fa`
+        extension: for example, `gdna`, `iloci`, `miloci`, `prot`, or
+        `all.prot`. The file is indexed on first access.
+        """
+        filename = '%s.%s.fa' % (self.label, datatype)
+        return genhub.fasta.IndexedFasta(self.file_path(filename))
+
+    def genome(self):
+        """
+        Random-access reader for the genome sequence.
+
+        The packed .2bit genome is used if it is present and up to date (see
+        `pack_gdna`), and the indexed Fasta file otherwise. Both readers
+        provide the same interface (`fetch`, `fetch_bytes`, `length`, etc.).
+        """
+        twobitfile = self.twobitfile
+        if os.path.exists(twobitfile):
+            gdnafile = self.gdnafile
+            if not os.path.exists(gdnafile) or \
+                    os.path.getmtime(twobitfile) >= os.path.getmtime(gdnafile):
+                return genhub.twobit.TwoBitFile(twobitfile)
+        return self.fasta('gdna')
+
+    def composition_index(self, logstream=sys.stderr):
+        """
+        Prefix-sum index of the genome's nucleotide composition.
+
+        The index (see `genhub.composition.CompositionIndex`) is built from
+        the genome sequence if it is missing or out of date, and gives the GC
+        content, GC skew, and N content of any feature directly from its GFF3
+        coordinates. Requires NumPy.
+        """
+        indexdir = self.compindexdir
+        indexfile = indexdir + '/index.json'
+        if not os.path.exists(indexfile) or \
+                os.path.getmtime(indexfile) < os.path.getmtime(self.gdnafile):
+            if logstream is not None:  # pragma: no cover
+                logmsg = '[GenHub: %s] ' % self.config['species']
+                logmsg += 'indexing genome composition'
+                print(logmsg, file=logstream)
+            with self.genome() as genome:
+                genhub.composition.build_index(genome, indexdir)
+        return genhub.composition.CompositionIndex(indexdir)
+
     def get_prot_map(self):
         mapfile = '%s/%s.protein2ilocus.tsv' % (self.dbdir, self.label)
         with open(mapfile, 'r') as instream:
@@ -415,6 +531,7 @@ def test_file_path():
     assert db.ilocustable == 'wd/Bimp/Bimp.iloci.tsv'
     assert db.milocustable == 'wd/Bimp/Bimp.miloci.tsv'
     assert db.premrnatable == 'wd/Bimp/Bimp.pre-mrnas.tsv'
+    assert db.summaryfile == 'wd/Bimp/Bimp.summary.json'
 
     checkfailed = False
     try:
@@ -467,3 +584,47 @@ def test_compress():
     assert db.compress_gdna is True
     assert db.compress_gff3 is True
     assert db.compress_prot is True
+
+
+def test_fasta():
+    """GenomeDB: random access to sequence files"""
+    db = genhub.test_registry.genome('Scer', workdir='testdata/demo-workdir')
+    with db.fasta('all.prot') as seqs:
+        assert seqs.filename == \
+            'testdata/demo-workdir/Scer/Scer.all.prot.fa'
+        with open(seqs.filename, 'r') as instream:
+            for defline, seq in genhub.fasta.parse(instream):
+                seqid = defline[1:].split()[0]
+                assert seqs[seqid] == seq
+
+
+def test_genome():
+    """GenomeDB: packed genome storage"""
+    db = genhub.test_registry.genome('Atha', workdir='testdata/demo-workdir')
+    with db.genome() as genome:
+        assert isinstance(genome, genhub.fasta.IndexedFasta)
+        seq = genome.fetch_bytes('NC_003070.9')
+
+    db.pack_gdna(logstream=None)
+    with db.genome() as genome:
+        assert isinstance(genome, genhub.twobit.TwoBitFile)
+        assert genome.filename == 'testdata/demo-workdir/Atha/Atha.gdna.2bit'
+        assert genome.fetch_bytes('NC_003070.9') == seq
+        assert genome.fetch('NC_003070.9', 316187, 316196) == 'GATCTTCGCC'
+    os.unlink(db.twobitfile)
+
+
+def test_composition_index():
+    """GenomeDB: composition index"""
+    if genhub.composition.numpy is None:  # pragma: no cover
+        return
+    db = genhub.test_registry.genome('Atha', workdir='testdata/demo-workdir')
+    assert db.compindexdir == 'testdata/demo-workdir/Atha/Atha.gdna.comp'
+    with db.composition_index(logstream=None) as index:
+        assert index.dirname == db.compindexdir
+        assert index.counts_for('NC_003070.9', [(316187, 316196)]) == \
+            (4, 2, 4, 0, 0, 0)
+    mtime = os.path.getmtime(db.compindexdir + '/index.json')
+    with db.composition_index(logstream=None) as index:
+        assert os.path.getmtime(index.dirname + '/index.json') == mtime
+    shutil.rmtree(db.compindexdir)
@@ -104,18 +104,7 @@ def sequences(db, logstream=sys.stderr):
     for ltype in ['iloci', 'miloci']:
         outfile = '%s/%s.%s.fa' % (specdir, db.label, ltype)
         gff3in = '%s/%s.%s.gff3' % (specdir, db.label, ltype)
-        command = 'xtractore --type=locus '
-        command += '--outfile=%s %s %s' % (outfile, gff3in, fastain)
-        cmd = command.split(' ')
-        proc = subprocess.Popen(cmd, stderr=subprocess.PIPE,
-                                universal_newlines=True)
-        stdout, stderr = proc.communicate()
-        for line in stderr.split('\n'):
-            if 'has not been previously introduced' not in line and \
-               'does not begin with "##gff-version"' not in line and \
-               line != '':  # pragma: no cover
-                print(line, file=logstream)
-        assert proc.returncode == 0, 'command failed: ' + command
+        genhub.extract.extract(gff3in, fastain, outfile, 'locus')
 
 
 def ancillary(db, logstream=sys.stderr):
@@ -150,11 +139,18 @@ def ancillary(db, logstream=sys.stderr):
 # Driver function
 # -----------------------------------------------------------------------------
 
-def prepare(db, delta=500, ilcformat='%sILC-', logstream=sys.stderr):  # pragma: no cover # noqa
+def prepare(db, delta=500, ilcformat='%sILC-', extract=True, logstream=sys.stderr):  # pragma: no cover # noqa
+    """
+    Compute iLoci and related data.
+
+    If `extract` is false, iLocus sequences are not extracted; this is left to
+    `genhub.extract.prepare`, which handles all feature sequences at once.
+    """
     intervals(db, delta=delta, ilcformat=ilcformat, logstream=logstream)
     simple(db, logstream=logstream)
     representatives(db, logstream=logstream)
-    sequences(db, logstream=logstream)
+    if extract:
+        sequences(db, logstream=logstream)
     ancillary(db, logstream=logstream)
 
 
@@ -70,7 +70,7 @@ def mature_mrna_intervals(db, logstream=sys.stderr):
     Extracting the sequence of a pre-mRNA is trivial, but extracting the
     sequence of a mature mRNA (sans introns) requires some additional work.
     This function creates a new GFF3 file containing mRNA multi-features,
-    enabling sequence extraction via xtractore.
+    enabling sequence extraction with `genhub.extract`.
     """
     if logstream is not None:  # pragma: no cover
         logmsg = '[GenHub: %s] ' % db.config['species']
@@ -121,41 +121,44 @@ def sequences(db, logstream=sys.stderr):
     gff3infile = '%s/%s.gff3' % (specdir, db.label)
     fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
     outfile = '%s/%s.all.pre-mrnas.fa' % (specdir, db.label)
-    command = 'xtractore --type=mRNA --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    genhub.extract.extract(gff3infile, fastainfile, outfile, 'mRNA')
 
     # All mature mRNA sequences
     gff3infile = '%s/%s.all.mrnas.gff3' % (specdir, db.label)
     fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
     outfile = '%s/%s.all.mrnas.fa' % (specdir, db.label)
-    command = 'xtractore --type=mRNA --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    genhub.extract.extract(gff3infile, fastainfile, outfile, 'mRNA')
+
+    representatives(db, logstream=None)
+
+
+def representatives(db, logstream=sys.stderr):
+    """Select representative pre-mRNA and mature mRNA sequences."""
+    if logstream is not None:  # pragma: no cover
+        logmsg = '[GenHub: %s] ' % db.config['species']
+        logmsg += 'selecting representative mRNA sequences'
+        print(logmsg, file=logstream)
+    specdir = '%s/%s' % (db.workdir, db.label)
 
     # Representative pre-mRNA sequences
     idfile = '%s/%s.mrnas.txt' % (specdir, db.label)
     seqfile = '%s/%s.all.pre-mrnas.fa' % (specdir, db.label)
     outfile = '%s/%s.pre-mrnas.fa' % (specdir, db.label)
-    with open(idfile, 'r') as idstream, \
-            open(seqfile, 'r') as seqstream, \
-            open(outfile, 'w') as outstream:
-        for defline, seq in genhub.fasta.select(idstream, seqstream):
-            print(defline, file=outstream)
-            genhub.fasta.format(seq, outstream=outstream)
+    with open(idfile, 'r') as idstream, open(outfile, 'w') as outstream:
+        writer = genhub.fasta.FastaWriter(outstream)
+        with writer:
+            genhub.fasta.select_indexed(idstream, seqfile, writer)
+        writer.write_index()
 
     # Representative mature mRNA sequences
     idfile = '%s/%s.mrnas.txt' % (specdir, db.label)
     seqfile = '%s/%s.all.mrnas.fa' % (specdir, db.label)
     outfile = '%s/%s.mrnas.fa' % (specdir, db.label)
-    with open(idfile, 'r') as idstream, \
-            open(seqfile, 'r') as seqstream, \
-            open(outfile, 'w') as outstream:
-        for defline, seq in genhub.fasta.select(idstream, seqstream):
-            print(defline, file=outstream)
-            genhub.fasta.format(seq, outstream=outstream)
+    with open(idfile, 'r') as idstream, open(outfile, 'w') as outstream:
+        writer = genhub.fasta.FastaWriter(outstream)
+        with writer:
+            genhub.fasta.select_indexed(idstream, seqfile, writer)
+        writer.write_index()
 
 
 # -----------------------------------------------------------------------------
@@ -204,24 +207,24 @@ def test_mrna_sequences():
 
     outfile = 'testdata/demo-workdir/Atha/Atha.all.pre-mrnas.fa'
     testfile = 'testdata/fasta/atha-all-pre-mrnas.fa'
-    with open(outfile, 'r') as out, open(testfile, 'r') as test:
-        assert genhub.fasta.compare(out, test) is True, \
-            'all pre-mRNA seq extraction failed'
+    only1, only2 = genhub.fasta.compare_files(outfile, testfile)
+    assert only1 == [] and only2 == [], \
+        'all pre-mRNA seq extraction failed: %r %r' % (only1, only2)
 
     outfile = 'testdata/demo-workdir/Atha/Atha.pre-mrnas.fa'
     testfile = 'testdata/fasta/atha-pre-mrnas.fa'
-    with open(outfile, 'r') as out, open(testfile, 'r') as test:
-        assert genhub.fasta.compare(out, test) is True, \
-            'pre-mRNA seq extraction failed'
+    only1, only2 = genhub.fasta.compare_files(outfile, testfile)
+    assert only1 == [] and only2 == [], \
+        'pre-mRNA seq extraction failed: %r %r' % (only1, only2)
 
     outfile = 'testdata/demo-workdir/Atha/Atha.all.pre-mrnas.fa'
     testfile = 'testdata/fasta/atha-all-pre-mrnas.fa'
-    with open(outfile, 'r') as out, open(testfile, 'r') as test:
-        assert genhub.fasta.compare(out, test) is True, \
-            'all mRNA seq extraction failed'
+    only1, only2 = genhub.fasta.compare_files(outfile, testfile)
+    assert only1 == [] and only2 == [], \
+        'all mRNA seq extraction failed: %r %r' % (only1, only2)
 
     outfile = 'testdata/demo-workdir/Atha/Atha.mrnas.fa'
     testfile = 'testdata/fasta/atha-mrnas.fa'
-    with open(outfile, 'r') as out, open(testfile, 'r') as test:
-        assert genhub.fasta.compare(out, test) is True, \
-            'mature mRNA seq extraction failed'
+    only1, only2 = genhub.fasta.compare_files(outfile, testfile)
+    assert only1 == [] and only2 == [], \
+        'mature mRNA seq extraction failed: %r %r' % (only1, only2)
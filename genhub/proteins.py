@@ -45,13 +45,16 @@ def sequences(db, logstream=sys.stderr):
     idfile = '%s/%s.protids.txt' % (specdir, db.label)
     seqfile = '%s/%s.all.prot.fa' % (specdir, db.label)
     outfile = '%s/%s.prot.fa' % (specdir, db.label)
-    with open(idfile, 'r') as idstream, \
-            open(seqfile, 'r') as seqstream, \
-            open(outfile, 'w') as outstream:
-        for defline, seq in genhub.fasta.select(idstream, seqstream):
-            defline = '>gnl|%s|%s' % (db.label, defline[1:])
-            print(defline, file=outstream)
-            genhub.fasta.format(seq, outstream=outstream)
+
+    def relabel(defline):
+        return '>gnl|%s|%s' % (db.label, defline[1:])
+
+    with open(idfile, 'r') as idstream, open(outfile, 'w') as outstream:
+        writer = genhub.fasta.FastaWriter(outstream)
+        with writer:
+            genhub.fasta.select_indexed(idstream, seqfile, writer,
+                                        relabel=relabel)
+        writer.write_index()
 
 
 def mapping(db, only_reps=False, logstream=sys.stderr):
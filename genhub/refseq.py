@@ -76,17 +76,20 @@ class RefSeqDB(genhub.genomedb.GenomeDB):
         return '%s_protein.faa.gz' % self.specbase
 
     def format_fasta(self, instream, outstream, logstream=sys.stderr):
-        for defline, sequence in genhub.fasta.parse(instream):
-            if 'seqfilter' in self.config:
-                discard = False
-                for pattern in self.config['seqfilter']:
-                    if pattern in defline:
-                        discard = True
-                        break
-                if discard:
-                    continue
-            print(defline, file=outstream)
-            genhub.fasta.format(sequence, linewidth=80, outstream=outstream)
+        writer = genhub.fasta.FastaWriter(outstream, linewidth=80)
+        with writer:
+            for defline, sequence in genhub.fasta.parse_bulk(instream,
+                                                             astext=True):
+                if 'seqfilter' in self.config:
+                    discard = False
+                    for pattern in self.config['seqfilter']:
+                        if pattern in defline:
+                            discard = True
+                            break
+                    if discard:
+                        continue
+                writer.write(defline, sequence)
+        writer.write_index()
 
     def format_gff3(self, logstream=sys.stderr, debug=False):
         cmds = list()
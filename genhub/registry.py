@@ -8,13 +8,23 @@
 # licensed under the BSD 3-clause license: see LICENSE.txt.
 # -----------------------------------------------------------------------------
 
-"""Module implementing a registry for handling genome configuration files."""
+"""
+Module implementing a registry for handling genome configuration files.
+
+Genome configs are indexed by label (the base name of each YAML file), and
+each file is parsed only when one of its genomes is first accessed, using
+LibYAML's C loader if available. Parsed configs are kept in a cache file
+(see `ConfigCache`), so that a registry of unchanged config files is built
+without parsing any YAML.
+"""
 
 from __future__ import print_function
+import atexit
 import glob
 import os
-import pkg_resources
-import yaml
+import pickle
+import subprocess
+import sys
 import genhub
 try:
     FileNotFoundError
@@ -22,32 +32,233 @@ except NameError:  # pragma: no cover
     FileNotFoundError = IOError
 
 
+def default_cachefile():
+    """
+    The default location of the registry's cache file.
+
+    This is `$GENHUB_CACHE` if set (an empty value disables the cache), or
+    `registry-pyN.pickle` in the `genhub` directory of the user's cache
+    directory (`$XDG_CACHE_HOME` or `~/.cache`).
+    """
+    if 'GENHUB_CACHE' in os.environ:
+        return os.environ['GENHUB_CACHE'] or None
+    cachedir = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    filename = 'registry-py%d.pickle' % sys.version_info[0]
+    return os.path.join(cachedir, 'genhub', filename)
+
+
+class ConfigCache(object):
+    """
+    Parsed genome configs, saved to a file between runs.
+
+    Entries are keyed by the absolute path of each config file, and are valid
+    only as long as the file's modification time and size are unchanged. A
+    missing, unreadable, or outdated cache file is simply ignored, and failure
+    to save the cache is not an error. Entries added since the cache was last
+    saved are saved when the interpreter exits, so that configs parsed one at
+    a time on first access do not rewrite the file after each one.
+    """
+
+    version = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = dict()
+        self.modified = False
+        self.registered = False
+        try:
+            with open(filename, 'rb') as instream:
+                data = pickle.load(instream)
+            if data['version'] == self.version:
+                self.entries = data['entries']
+        except Exception:
+            pass
+
+    @staticmethod
+    def _stamp(filepath):
+        stat = os.stat(filepath)
+        return stat.st_mtime, stat.st_size
+
+    def get(self, filepath):
+        """Retrieve the cached configs of a file, if they are up to date."""
+        filepath = os.path.abspath(filepath)
+        entry = self.entries.get(filepath)
+        if entry is None or entry[0] != self._stamp(filepath):
+            return None
+        return entry[1]
+
+    def put(self, filepath, configs):
+        filepath = os.path.abspath(filepath)
+        self.entries[filepath] = (self._stamp(filepath), configs)
+        self.modified = True
+        if not self.registered:
+            atexit.register(self.save)
+            self.registered = True
+
+    def save(self):
+        if not self.modified:
+            return
+        tempfile = '%s.%d.tmp' % (self.filename, os.getpid())
+        try:
+            dirname = os.path.dirname(self.filename)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            with open(tempfile, 'wb') as outstream:
+                data = {'version': self.version, 'entries': self.entries}
+                pickle.dump(data, outstream, protocol=2)
+            os.rename(tempfile, self.filename)
+            self.modified = False
+        except (IOError, OSError):
+            if os.path.exists(tempfile):
+                os.unlink(tempfile)
+
+
+def _label(filepath):
+    return os.path.splitext(os.path.basename(filepath))[0]
+
+
+class ConfigIndex(object):
+    """
+    Genome configs by label, parsed from their YAML files on first access.
+
+    Files added lazily are expected to follow the naming convention of the
+    GenHub configs, with file `Xxxx.yml` holding the config of genome `Xxxx`;
+    such a file is parsed only when that genome is accessed (or is loaded from
+    `cache`, a `ConfigCache`). If a label is not found, or a file does not
+    hold the expected config, all files are parsed. As with a `dict` updated
+    with each file in turn, a label defined in several files refers to the
+    last.
+    """
+
+    def __init__(self, parse, cache=None):
+        self.parse = parse
+        self.cache = cache
+        self.files = list()
+        self.configs = dict()
+        self.index = dict()
+        self.complete = True
+
+    def add(self, filepath, lazy=True):
+        """Add a config file to the index."""
+        configs = None
+        if self.cache is not None:
+            configs = self.cache.get(filepath)
+        self.files.append(filepath)
+        if configs is None and not lazy:
+            configs = self.parse(filepath)
+            if self.cache is not None:
+                self.cache.put(filepath, configs)
+        if configs is not None:
+            self.configs[filepath] = configs
+            for label in configs:
+                self.index[label] = filepath
+        else:
+            self.index[_label(filepath)] = filepath
+            self.complete = False
+
+    def _parse(self, filepath):
+        if filepath in self.configs:
+            return self.configs[filepath]
+        configs = self.parse(filepath)
+        self.configs[filepath] = configs
+        if self.cache is not None:
+            self.cache.put(filepath, configs)
+        if list(configs.keys()) != [_label(filepath)]:
+            self._reindex()
+        return configs
+
+    def _reindex(self):
+        self.index = dict()
+        for filepath in self.files:
+            labels = [_label(filepath)]
+            if filepath in self.configs:
+                labels = self.configs[filepath].keys()
+            for label in labels:
+                self.index[label] = filepath
+
+    def load(self):
+        """Parse all config files not yet parsed."""
+        if self.complete:
+            return
+        for filepath in self.files:
+            self._parse(filepath)
+        self._reindex()
+        self.complete = True
+        if self.cache is not None:
+            self.cache.save()
+
+    def _lookup(self, label):
+        filepath = self.index.get(label)
+        if filepath is not None:
+            configs = self._parse(filepath)
+            if label in configs and self.index.get(label) == filepath:
+                return configs[label]
+        if not self.complete:
+            self.load()
+            if label in self.index:
+                return self.configs[self.index[label]][label]
+        return None
+
+    def __contains__(self, label):
+        return self._lookup(label) is not None
+
+    def __getitem__(self, label):
+        config = self._lookup(label)
+        if config is None:
+            raise KeyError(label)
+        return config
+
+    def __iter__(self):
+        self.load()
+        return iter(list(self.index.keys()))
+
+    def __len__(self):
+        self.load()
+        return len(self.index)
+
+
 class Registry(object):
 
-    def __init__(self):
-        """Initialize the registry with the default GenHub configs."""
-        genhubdir = pkg_resources.resource_filename('genhub', 'genomes')
-        self.update(genhubdir, clear=True)
+    def __init__(self, cachefile=None, usecache=True):
+        """
+        Initialize the registry with the default GenHub configs.
 
-    def update(self, path, clear=False):
+        Parsed configs are cached in `cachefile`, by default in the location
+        given by `default_cachefile`; set `usecache` to false to disable the
+        cache.
+        """
+        self.cache = None
+        if usecache:
+            cachefile = cachefile or default_cachefile()
+            if cachefile:
+                self.cache = ConfigCache(cachefile)
+        genhubdir = os.path.join(os.path.dirname(__file__), 'genomes')
+        self.update(genhubdir, clear=True, lazy=True)
+
+    def update(self, path, clear=False, lazy=False):
         """
         Update the registry from the given directory path.
 
         The registry will attempt to load all .yml files as genome configs and
         .txt files as batch configs. If `clear` is true, any previous entries
-        in the registry will be cleared before loading new entries.
+        in the registry will be cleared before loading new entries. If `lazy`
+        is true, genome configs are parsed only when first accessed, which
+        requires each file to be named after its genome (see `ConfigIndex`).
         """
         if clear:
-            self.genome_configs = dict()
+            self.genome_configs = ConfigIndex(self.parse_genome_config,
+                                              cache=self.cache)
             self.batch_configs = dict()
 
         if not os.path.exists(path):
             message = 'config directory "%s" does not exist' % path
             raise FileNotFoundError(message)
 
-        for filepath in glob.glob(path + '/*.yml'):
-            configs = self.parse_genome_config(filepath)
-            self.genome_configs.update(configs)
+        for filepath in sorted(glob.glob(path + '/*.yml')):
+            self.genome_configs.add(filepath, lazy=lazy)
+        if self.cache is not None:
+            self.cache.save()
 
         for filepath in glob.glob(path + '/*.txt'):
             batch = self.parse_batch_config(filepath)
@@ -89,9 +300,12 @@ class Registry(object):
         If `config` is a string it is treated as a filename, otherwise as a
         file handle or similar object.
         """
+        import yaml
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
         if isinstance(config, str):
-            config = open(config, 'r')
-        return yaml.load(config)
+            with open(config, 'r') as instream:
+                return yaml.load(instream, Loader=loader)
+        return yaml.load(config, Loader=loader)
 
     def parse_batch_config(self, config):
         """
@@ -214,3 +428,100 @@ def test_parse_genome_config():
     assert len(config) == 1
     assert 'Hlab' in config
     assert config['Hlab']['common'] == 'blueberry bee'
+
+
+def test_lazy():
+    """Registry: parse genome configs on first access"""
+    parsed = list()
+
+    class CountingRegistry(Registry):
+        def parse_genome_config(self, config):
+            parsed.append(config)
+            return super(CountingRegistry, self).parse_genome_config(config)
+
+    registry = CountingRegistry(usecache=False)
+    assert parsed == []
+    assert registry.config('Pbar')['species'] == 'Pogonomyrmex barbatus'
+    assert 'Hlab' in registry.genome_configs
+    assert [os.path.basename(f) for f in parsed] == ['Pbar.yml', 'Hlab.yml']
+    registry.genome('Pbar')
+    assert len(parsed) == 2
+
+    assert registry.config('Bogus') is None
+    assert len(parsed) == len(glob.glob('genhub/genomes/*.yml'))
+
+    confdir = 'testdata/demo-workdir/conf'
+    os.mkdir(confdir)
+    with open(confdir + '/mislabeled.yml', 'w') as outstream:
+        print('Hlab:\n  source: local\n  species: Bogus', file=outstream)
+    registry = Registry(usecache=False)
+    registry.update(confdir)
+    assert registry.config('Hlab')['species'] == 'Bogus'
+    assert 'mislabeled' not in registry.genome_configs
+    for filepath in glob.glob('genhub/genomes/*.yml'):
+        config = registry.parse_genome_config(filepath)
+        assert list(config.keys()) == [_label(filepath)], filepath
+    os.unlink(confdir + '/mislabeled.yml')
+    os.rmdir(confdir)
+
+
+def test_cache():
+    """Registry: cache parsed genome configs between runs"""
+    cachefile = 'testdata/demo-workdir/cache/registry.pickle'
+    registry = Registry(cachefile=cachefile)
+    registry.config('Pbar')
+    assert not os.path.exists(cachefile)
+    registry.cache.save()
+    assert os.path.exists(cachefile)
+    labels = [label for label, _ in registry.list_genomes()]
+
+    parsed = list()
+
+    class CountingRegistry(Registry):
+        def parse_genome_config(self, config):
+            parsed.append(config)
+            return super(CountingRegistry, self).parse_genome_config(config)
+
+    registry = CountingRegistry(cachefile=cachefile)
+    assert [label for label, _ in registry.list_genomes()] == labels
+    assert registry.config('Pbar')['species'] == 'Pogonomyrmex barbatus'
+    assert parsed == []
+
+    registry.update('testdata/conf')
+    assert registry.config('Osat')['accession'] == \
+        'BogusThisIsNotARealAccession'
+    ymlfiles = glob.glob('testdata/conf/*.yml')
+    assert len(parsed) == len(ymlfiles)
+    registry = CountingRegistry(cachefile=cachefile)
+    registry.update('testdata/conf')
+    registry.config('Osat')
+    assert len(parsed) == len(ymlfiles)
+
+    cache = ConfigCache(cachefile)
+    filepath = os.path.abspath('genhub/genomes/Pbar.yml')
+    stamp, configs = cache.entries[filepath]
+    cache.entries[filepath] = ((stamp[0] - 1, stamp[1]), configs)
+    assert cache.get(filepath) is None
+    os.unlink(cachefile)
+    os.rmdir(os.path.dirname(cachefile))
+    assert ConfigCache(cachefile).entries == dict()
+
+
+def test_lazy_import():
+    """Registry: import package modules and genome DB classes on demand"""
+    if sys.version_info >= (3, 7):
+        code = ('import sys, genhub; print(sorted(m for m in sys.modules '
+                'if m.startswith("genhub")))')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        assert output.decode('utf-8').strip() == "['genhub']"
+
+    assert sorted(genhub.dbtype) == sorted(genhub.sources)
+    assert genhub.dbtype['genbank'] is genhub.refseq.GenbankDB
+    assert genhub.dbtype['local'] is genhub.generic.GenericDB
+    assert 'stats' in dir(genhub)
+    try:
+        genhub.bogus
+    except AttributeError:
+        pass
+    else:
+        assert False, 'attribute error not raised'
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Null models of genome compactness by shuffling iLoci.
+
+Gene-containing iLoci (giLoci) that are adjacent, with no intergenic iLocus
+(iiLocus) between them, are merged into miLoci. The compactness measures
+computed by `genhub-compact.py` are sigma, the fraction of a sequence
+occupied by miLoci, and phi, the fraction of giLoci that are merged. For a
+null distribution of these measures, the order of iLoci along each sequence
+is permuted at random (flanking iLoci stay at the ends) and the miLoci are
+formed again.
+
+An `ILocusShuffler` holds the iLocus classes and lengths of a genome in
+arrays grouped by sequence, and computes any number of replicates in memory,
+many at a time, without writing shuffled iLocus tables.
+
+    >>> shuffler = ILocusShuffler(seqids, classes, efflengths, lengths)
+    >>> sigma, phi = shuffler.compactness(seqlengths, replicates=1000)
+"""
+
+from __future__ import division
+from __future__ import print_function
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+GILOCUS_TYPES = ['siLocus', 'ciLocus', 'niLocus']
+
+
+class ILocusShuffler(object):
+    """
+    Shuffle the iLoci of each sequence to form miLoci at random.
+
+    The iLoci are given as parallel sequences of sequence IDs, iLocus classes,
+    effective lengths and, if `gthresh` is set, lengths (as in the `SeqID`,
+    `LocusClass`, `EffectiveLength`, and `Length` columns of an iLocus table).
+    As in `genhub-compact.py`, giLoci shorter than `gthresh` are merged like
+    any other, but are not counted for phi.
+
+    The length of a random miLocus is the sum of the effective lengths of its
+    giLoci, which for the observed miLoci is the length of the miLocus.
+    """
+
+    def __init__(self, seqids, classes, efflengths, lengths=None,
+                 gthresh=None):
+        if numpy is None:
+            raise ImportError('iLocus shuffling requires NumPy')
+        seqids = numpy.asarray(seqids).astype(str)
+        classes = numpy.asarray(classes).astype(str)
+        efflengths = numpy.asarray(efflengths, dtype=numpy.int64)
+        isgene = numpy.isin(classes, GILOCUS_TYPES)
+        counted = isgene.copy()
+        if gthresh:
+            counted &= numpy.asarray(lengths) >= gthresh
+
+        # Interior (non-flanking) iLoci, grouped by sequence in order of first
+        # appearance.
+        interior = classes != 'fiLocus'
+        labels, first, codes = numpy.unique(
+            seqids[interior], return_index=True, return_inverse=True)
+        rank = numpy.empty(len(labels), dtype=numpy.int64)
+        rank[numpy.argsort(first)] = numpy.arange(len(labels))
+        codes = rank[codes.ravel()]
+        order = numpy.argsort(codes, kind='mergesort')
+        self.seqids = [str(s) for s in labels[numpy.argsort(first)]]
+        self.index = dict((seqid, i) for i, seqid in enumerate(self.seqids))
+        self.segment = codes[order]
+        self.isgene = isgene[interior][order]
+        self.counted = counted[interior][order]
+        self.efflengths = efflengths[interior][order]
+        self.starts = numpy.flatnonzero(numpy.diff(self.segment,
+                                                   prepend=-1))
+        self.sameseq = self.segment[1:] == self.segment[:-1]
+        self.giloci = numpy.add.reduceat(self.counted.astype(numpy.int64),
+                                         self.starts) \
+            if len(self.segment) > 0 else numpy.zeros(0, dtype=numpy.int64)
+
+    def __len__(self):
+        return len(self.seqids)
+
+    def replicates(self, count, seed=None, chunksize=2**22):
+        """
+        Shuffle iLoci and merge giLoci, `count` times.
+
+        Returns two arrays of shape (count, number of sequences): for each
+        replicate and sequence, the number of singleton giLoci (those not
+        merged, as counted for phi) and the miLocus occupancy. Replicates are
+        computed in chunks of about `chunksize` iLoci.
+        """
+        random = numpy.random.RandomState(seed)
+        nloci = len(self.segment)
+        singletons = numpy.zeros((count, len(self)), dtype=numpy.int64)
+        occupancy = numpy.zeros((count, len(self)), dtype=numpy.int64)
+        if nloci == 0:
+            return singletons, occupancy
+        step = max(1, chunksize // nloci)
+        for begin in range(0, count, step):
+            end = min(begin + step, count)
+            keys = self.segment + random.random_sample((end - begin, nloci))
+            order = numpy.argsort(keys, axis=1)
+            gene = self.isgene[order]
+            merged = numpy.zeros_like(gene)
+            merged[:, 1:] |= gene[:, :-1] & self.sameseq
+            merged[:, :-1] |= gene[:, 1:] & self.sameseq
+            merged &= gene
+            single = gene & ~merged & self.counted[order]
+            singletons[begin:end] = numpy.add.reduceat(
+                single.astype(numpy.int64), self.starts, axis=1)
+            occupancy[begin:end] = numpy.add.reduceat(
+                numpy.where(merged, self.efflengths[order], 0), self.starts,
+                axis=1)
+        return singletons, occupancy
+
+    def compactness(self, seqlengths, replicates, seed=None):
+        """
+        Compute the null distribution of sigma and phi for each sequence.
+
+        The `seqlengths` map sequence IDs to the effective sequence lengths
+        by which miLocus occupancy is divided (see `genhub-compact.py`).
+        Returns the sequence IDs and two arrays of shape (replicates, number
+        of sequences) with sigma and phi; sequences with no giLoci have NaN
+        phi values.
+        """
+        seqids = [s for s in seqlengths if s in self.index]
+        columns = [self.index[s] for s in seqids]
+        lengths = numpy.array([seqlengths[s] for s in seqids], dtype=float)
+        singletons, occupancy = self.replicates(replicates, seed=seed)
+        singletons, occupancy = singletons[:, columns], occupancy[:, columns]
+        giloci = self.giloci[columns]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            sigma = occupancy / lengths
+            phi = (giloci - singletons) / giloci
+        return seqids, sigma, phi
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+
+def test_replicates():
+    """Shuffle: merge giLoci of shuffled iLoci"""
+    if numpy is None:  # pragma: no cover
+        return
+    seqids = ['chr1'] * 6 + ['chr2'] * 4
+    classes = ['fiLocus', 'siLocus', 'iiLocus', 'siLocus', 'niLocus',
+               'fiLocus', 'ciLocus', 'iiLocus', 'siLocus', 'iiLocus']
+    efflens = [100, 10, 50, 20, 30, 100, 40, 60, 5, 70]
+    shuffler = ILocusShuffler(seqids, classes, efflens)
+    assert shuffler.seqids == ['chr1', 'chr2']
+    assert list(shuffler.giloci) == [3, 2]
+    singletons, occupancy = shuffler.replicates(500, seed=42)
+    assert singletons.shape == (500, 2)
+
+    # chr1: the 3 giLoci are either all merged, or 2 merged and 1 singleton.
+    for single, occ in zip(singletons[:, 0], occupancy[:, 0]):
+        assert (single, occ) in [(0, 60), (1, 30), (1, 40), (1, 50)]
+    # chr2: 2 giLoci, 2 iiLoci; adjacent in 3 of 6 arrangements.
+    adjacent = occupancy[:, 1] == 45
+    assert numpy.all(singletons[adjacent, 1] == 0)
+    assert numpy.all(singletons[~adjacent, 1] == 2)
+    assert numpy.all(occupancy[~adjacent, 1] == 0)
+    assert 0.4 < adjacent.mean() < 0.6
+
+    again = shuffler.replicates(500, seed=42, chunksize=16)
+    assert numpy.array_equal(again[0], singletons)
+    assert numpy.array_equal(again[1], occupancy)
+
+
+def test_compactness():
+    """Shuffle: null distribution of sigma and phi"""
+    if numpy is None:  # pragma: no cover
+        return
+    seqids = ['chr1'] * 4 + ['chr2'] * 3 + ['chr3']
+    classes = ['siLocus', 'siLocus', 'iiLocus', 'ciLocus',
+               'iiLocus', 'siLocus', 'iiLocus', 'fiLocus']
+    efflens = [10, 20, 30, 40, 50, 60, 70, 80]
+    lengths = [10, 20, 30, 40, 50, 60, 70, 80]
+    shuffler = ILocusShuffler(seqids, classes, efflens, lengths, gthresh=15)
+    assert shuffler.seqids == ['chr1', 'chr2']
+    assert list(shuffler.giloci) == [2, 1]
+    seqlengths = {'chr1': 100, 'chr2': 180, 'chr3': 80}
+    seqids, sigma, phi = shuffler.compactness(seqlengths, 200, seed=1)
+    assert sorted(seqids) == ['chr1', 'chr2']
+    assert sigma.shape == phi.shape == (200, 2)
+    chr1, chr2 = seqids.index('chr1'), seqids.index('chr2')
+    assert numpy.all(sigma[:, chr2] == 0.0) and numpy.all(phi[:, chr2] == 0.0)
+    for s, p in zip(sigma[:, chr1], phi[:, chr1]):
+        # The short siLocus (10) is merged but not counted for phi.
+        assert (s, p) in [(0.3, 0.5), (0.5, 0.5), (0.6, 1.0), (0.7, 1.0)]
+    assert len(set(sigma[:, chr1])) > 2
@@ -1,38 +1,1398 @@
 #!/usr/bin/env python
 #
 # -----------------------------------------------------------------------------
-# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
-# Copyright (c) 2016   Indiana University
+# Copyright (c) 2015-2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2015-2016   Indiana University
 #
 # This file is part of genhub (http://github.com/standage/genhub) and is
 # licensed under the BSD 3-clause license: see LICENSE.txt.
 # -----------------------------------------------------------------------------
 
+"""
+Descriptive statistics of genome features.
+
+Each table (see `TABLES`) describes one type of feature, one row per feature,
+and is computed from the feature annotations (GFF3) and the nucleotide
+composition of the feature sequences. Composition is taken either from the
+extracted feature sequences (Fasta) or, if a composition index is available,
+directly from the genome (see `genhub.composition.CompositionIndex`). Tables
+computed from the same GFF3 file share a single pass over it.
+
+    >>> genhub.stats.compute(db, tables=['exons', 'introns'])
+"""
+
 from __future__ import print_function
-import subprocess
+from collections import OrderedDict
+from contextlib import contextmanager
+import filecmp
+import io
+import multiprocessing
+import os
+import re
+import shutil
 import sys
+import genhub
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+try:
+    from StringIO import StringIO
+except ImportError:  # pragma: no cover
+    from io import StringIO
+
+
+def _key(defline, keyfield):
+    """The feature key in the specified field of a Fasta defline."""
+    if isinstance(defline, bytes):
+        defline = defline.decode('utf-8')
+    return defline[1:].split(' ')[keyfield]
+
+
+def load_composition(fasta, keyfield=0, unique=False):
+    """
+    Compute the length and nucleotide composition of each sequence.
+
+    Sequences are processed in batches and discarded, so that only their
+    lengths and (GC content, GC skew, N content) values are retained. Records
+    are keyed by the specified field of the defline; if `unique` is true, a
+    duplicated key is an error, otherwise the first record is kept.
+
+    Instead of a Fasta file handle, precomputed (defline, length, values)
+    tuples can be provided, such as those from a composition index.
+    """
+    seqs = {}
+    records = fasta
+    if hasattr(fasta, 'read'):
+        records = genhub.composition.batch_records(
+            genhub.fasta.parse_bulk(fasta))
+    for defline, length, values in records:
+        key = _key(defline, keyfield)
+        if key in seqs:
+            assert not unique, 'duplicate seqid: ' + key
+            continue
+        seqs[key] = (length, values)
+    return seqs
+
+
+class CompositionStream(object):
+    """
+    Sequence composition read from a Fasta file in step with a table.
+
+    A streaming alternative to `load_composition` for Fasta files whose
+    records are in the same order as the features of the GFF3 file, as
+    written by `genhub.extract`. Records are read only as the table looks them
+    up, and only the `window` most recently read are retained, so memory use
+    does not grow with the number of features. When a record is not found
+    within the window (the orders diverge), it is read through the Fasta
+    file's index instead (see `genhub.fasta.IndexedFasta`).
+
+    Lookups give the same values as with `load_composition`, except that
+    duplicated keys are resolved (or if `unique`, reported) only within the
+    window. As with `composition_source`, `seqids` restricts the records read
+    to those of features on the given sequences.
+    """
+
+    def __init__(self, fastafile, keyfield=0, unique=False, seqids=None,
+                 window=1024):
+        self.fastafile = fastafile
+        self.keyfield = keyfield
+        self.unique = unique
+        self.window = window
+        self.recent = OrderedDict()
+        self.index = None
+        self._instream = open(fastafile, 'rb')
+        records = genhub.fasta.parse_bulk(self._instream)
+        if seqids is not None:
+            seqids = set([s.encode('utf-8') for s in seqids])
+            records = ((defline, seq) for defline, seq in records
+                       if _seqid(defline) in seqids)
+        self._records = genhub.composition.batch_records(records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.close()
+
+    def __getitem__(self, key):
+        if key in self.recent:
+            return self.recent[key]
+        for _ in range(self.window):
+            record = next(self._records, None)
+            if record is None:
+                break
+            defline, length, values = record
+            reckey = _key(defline, self.keyfield)
+            if reckey in self.recent:
+                assert not self.unique, 'duplicate seqid: ' + reckey
+                continue
+            self.recent[reckey] = (length, values)
+            if len(self.recent) > self.window:
+                self.recent.popitem(last=False)
+            if reckey == key:
+                return self.recent[key]
+        return self.lookup(key)
+
+    def close(self):
+        self._instream.close()
+        if self.index is not None:
+            self.index.close()
+
+    def lookup(self, key):
+        """Read a record through the Fasta file's index."""
+        if self.index is None:
+            self.index = genhub.fasta.IndexedFasta(self.fastafile,
+                                                   keyfield=self.keyfield)
+        seq = self.index.fetch_bytes(key)
+        return len(seq), genhub.composition.composition(seq)
+
+
+def _seqid(defline):
+    """The sequence ID in the defline of an extracted feature sequence."""
+    fields = defline.split()
+    if len(fields) < 2:
+        return None
+    return fields[1].rsplit(b'_', 1)[0]
+
+
+def open_region(gff3file, region=None):
+    """
+    Open a GFF3 file for reading, or only a region of it.
+
+    A region is a (start, end, seqids) tuple as produced by `shards`; `start`
+    and `end` are byte offsets, with `end` None for the end of the file.
+    """
+    if region is None:
+        return open(gff3file, 'r')
+    start, end = region[:2]
+    with open(gff3file, 'rb') as instream:
+        instream.seek(start)
+        data = instream.read(-1 if end is None else end - start)
+    return io.TextIOWrapper(io.BytesIO(data))
+
+
+@contextmanager
+def composition_source(fastafile, gff3file, ftype, index=None,
+                       exontype=None, region=None):
+    """
+    Open the source of sequence composition for a feature type.
+
+    This is the Fasta file of extracted sequences, or if a composition index
+    is provided, the features of the given type in the GFF3 file. For mature
+    mRNAs, set `exontype` to assemble each mRNA from its exons (or CDS
+    segments) where present, as `genhub.mrnas.mrna_exons` does. If a region
+    of the GFF3 file is given (see `shards`), only the sequences of features
+    in that region are loaded.
+    """
+    if index is None:
+        with open(fastafile, 'r') as fasta:
+            if region is None or region[2] is None:
+                yield fasta
+            else:
+                seqids = set([s.encode('utf-8') for s in region[2]])
+                records = genhub.fasta.parse_bulk(fasta)
+                yield genhub.composition.batch_records(
+                    (defline, seq) for defline, seq in records
+                    if _seqid(defline) in seqids)
+    else:
+        with open_region(gff3file, region) as instream:
+            features = instream
+            if exontype is not None:
+                usecds = exontype == 'CDS'
+                features = list(genhub.mrnas.mrna_exons(
+                    instream, convert=True, usecds=usecds))
+                if len(features) == 0:
+                    instream.seek(0)
+                    features = instream
+            yield index.features(features, ftype)
+
+
+def groups(gff3):
+    """
+    Parse a GFF3 stream into groups of features separated by `###` lines.
+
+    Each entry is an (entry, fields) tuple: the raw line, and its tab-separated
+    fields. Every group but the last ends with its `###` entry.
+    """
+    group = list()
+    for entry in gff3:
+        group.append((entry, entry.rstrip().split('\t')))
+        if entry.startswith('###'):
+            yield group
+            group = list()
+    if len(group) > 0:
+        yield group
+
+
+def feattype(fields):
+    """The type of a GFF3 feature, or None for directives and comments."""
+    if len(fields) == 9:
+        return fields[2]
+    return None
+
+
+class ILocusTable(object):
+    """
+    Tabular record for each iLocus in the input.
+
+    - seqs: composition of iLocus sequences (see `load_composition`)
+    """
+
+    header = ['LocusId', 'SeqID', 'LocusPos', 'Length', 'EffectiveLength',
+              'GCContent', 'GCSkew', 'NContent', 'LocusClass', 'GeneCount',
+              'SeqUnannot', 'FlankGeneOrient']
+    types = ['str', 'cat', 'str', 'int', 'int', 'float', 'float', 'float',
+             'cat', 'int', 'bool', 'cat']
+
+    def __init__(self, seqs, miloci=False):
+        self.seqs = seqs
+        self.miloci = miloci
+
+    def rows(self, group):
+        for entry, fields in group:
+            if feattype(fields) != 'locus':
+                continue
+            locuspos = '%s_%s-%s' % (fields[0], fields[3], fields[4])
+            if self.miloci:
+                locuspos = 'locus:%s.' % locuspos
+            locusid = locuspos
+            locusidmatch = re.search('Name=([^;\n]+)', fields[8])
+            if locusidmatch:
+                locusid = locusidmatch.group(1)
+            locuslen = int(fields[4]) - int(fields[3]) + 1
+            seqlen, (gccontent, gcskew, ncontent) = self.seqs[locusid]
+            assert seqlen == locuslen, \
+                'Locus "%s": length mismatch; gff=%d, fa=%d' % \
+                (locusid, locuslen, seqlen)
+
+            classmatch = re.search('iLocus_type=([^;\n]+)', fields[8])
+            assert classmatch, fields[8]
+            locusclass = classmatch.group(1)
+            genecount = 0
+            attrs = fields[8]
+            unannot = 'unannot=true' in attrs
+            efflen = 0
+            efflenmatch = re.search(r'effective_length=(\d+)', attrs)
+            if efflenmatch:
+                efflen = int(efflenmatch.group(1))
+            if 'gene=' in attrs:
+                gmatch = re.search(r'gene=(\d+)', attrs)
+                assert gmatch
+                genecount = int(gmatch.group(1))
+            orient = 'NA'
+            orientmatch = re.search('fg_orient=(..)', attrs)
+            if orientmatch:
+                orient = orientmatch.group(1)
+            values = '%s %s %s %d %d %.3f %.3f %.3f %s %d %r %s' % (
+                locusid, fields[0], locuspos, locuslen, efflen, gccontent,
+                gcskew, ncontent, locusclass, genecount, unannot, orient)
+            yield values.split(' ')
+
+
+class PremrnaTable(object):
+    """
+    Tabular record for each pre-mRNA, given the composition of pre-mRNA
+    sequences.
+    """
+
+    header = ['Accession', 'Length', 'GCContent', 'GCSkew', 'NContent',
+              'ExonCount', 'IntronCount', '5pUTRlen', '3pUTRlen']
+    types = ['str', 'int', 'float', 'float', 'float', 'int', 'int', 'int',
+             'int']
+
+    def __init__(self, seqs):
+        self.seqs = seqs
+
+    def rows(self, group):
+        mrnaacc = ''
+        mrnalen = 0
+        gccontent, gcskew, ncontent = 0.0, 0.0, 0.0
+        exoncount, introncount = 0, 0
+        utr5plen, utr3plen = 0, 0
+        for entry, fields in group:
+            ftype = feattype(fields)
+            if ftype == 'mRNA':
+                mrnaacc = re.search('accession=([^;\n]+)',
+                                    fields[8]).group(1)
+                mrnalen = int(fields[4]) - int(fields[3]) + 1
+                seqlen, (gccontent, gcskew, ncontent) = self.seqs[mrnaacc]
+                if seqlen != mrnalen:
+                    message = 'pre-mRNA "%s": length mismatch' % mrnaacc
+                    message += ' (gff3=%d, fa=%d)' % (mrnalen, seqlen)
+                    message += '; most likely a duplicated accession'
+                    message += ', discarding'
+                    print(message, file=sys.stderr)
+                    mrnaacc = ''
+            elif ftype == 'exon':
+                exoncount += 1
+            elif ftype == 'intron':
+                introncount += 1
+            elif ftype == 'five_prime_UTR':
+                utr5plen += int(fields[4]) - int(fields[3]) + 1
+            elif ftype == 'three_prime_UTR':
+                utr3plen += int(fields[4]) - int(fields[3]) + 1
+            elif entry.startswith('###'):
+                if mrnaacc != '':
+                    values = '%s %d %.3f %.3f %.3f %d %d %d %d' % (
+                        mrnaacc, mrnalen, gccontent, gcskew, ncontent,
+                        exoncount, introncount, utr5plen, utr3plen)
+                    yield values.split(' ')
+
+
+class MrnaTable(object):
+    """
+    Tabular record for each mature (sans introns) mRNA, given the composition
+    of mature mRNA sequences.
+
+    The mRNA structure is taken either from mRNA multi-features (as in
+    `<label>.mrnas.gff3`), or from the exons of each mRNA (as in
+    `<label>.ilocus.mrnas.gff3`); set `exontype` to `CDS` if the exon
+    structure is given by CDS features instead (see `genhub.mrnas`).
+    """
+
+    header = ['Accession', 'Length', 'GCContent', 'GCSkew', 'NContent']
+    types = ['str', 'int', 'float', 'float', 'float']
+
+    def __init__(self, seqs, exontype='exon'):
+        self.seqs = seqs
+        self.exontype = exontype
+
+    def rows(self, group):
+        mrnaacc = ''
+        mrnaids = set()
+        mrnalen = 0
+        exonlen = None
+        for entry, fields in group:
+            ftype = feattype(fields)
+            if ftype == 'mRNA':
+                mrnalen += int(fields[4]) - int(fields[3]) + 1
+                accmatch = re.search('accession=([^;\n]+)', fields[8])
+                assert accmatch, \
+                    'Unable to parse mRNA accession: %s' % fields[8]
+                mrnaacc = accmatch.group(1)
+                idmatch = re.search('ID=([^;\n]+)', fields[8])
+                if idmatch:
+                    mrnaids.add(idmatch.group(1))
+            elif ftype == self.exontype:
+                parentmatch = re.search('Parent=([^;\n]+)', fields[8])
+                if parentmatch and parentmatch.group(1) in mrnaids:
+                    exonlen = (exonlen or 0) + \
+                        int(fields[4]) - int(fields[3]) + 1
+            elif entry.startswith('###') and mrnaacc != '':
+                if exonlen is not None:
+                    mrnalen = exonlen
+                seqlen, (gccontent, gcskew, ncontent) = self.seqs[mrnaacc]
+                if seqlen != mrnalen:
+                    message = 'mature mRNA "%s": length mismatch' % mrnaacc
+                    message += ' (gff3=%d, fa=%d)' % (mrnalen, seqlen)
+                    message += '; most likely a duplicated accession'
+                    message += ', discarding'
+                    print(message, file=sys.stderr)
+                else:
+                    values = '%s %d %.3f %.3f %.3f' % (
+                        mrnaacc, mrnalen, gccontent, gcskew, ncontent)
+                    yield values.split(' ')
+
+
+class CDSTable(object):
+    """
+    Tabular record for each CDS, given the composition of CDS sequences.
+    """
+
+    header = ['MrnaAcc', 'Length', 'GCContent', 'GCSkew', 'NContent']
+    types = ['str', 'int', 'float', 'float', 'float']
+
+    def __init__(self, seqs):
+        self.seqs = seqs
+
+    def rows(self, group):
+        accession = ''
+        cdslen = 0
+        for entry, fields in group:
+            if feattype(fields) == 'CDS':
+                accession = re.search('accession=([^;\n]+)',
+                                      fields[8]).group(1)
+                cdslen += int(fields[4]) - int(fields[3]) + 1
+            elif entry.startswith('###') and accession:
+                seqlen, (gccontent, gcskew, ncontent) = self.seqs[accession]
+                if seqlen != cdslen:
+                    message = 'CDS for "%s": length mismatch' % accession
+                    message += ' (gff3=%d, fa=%d)' % (cdslen, seqlen)
+                    message += '; most likely a duplicated accession'
+                    message += ', discarding'
+                    print(message, file=sys.stderr)
+                else:
+                    values = '%s %d %.3f %.3f %.3f' % (
+                        accession, cdslen, gccontent, gcskew, ncontent)
+                    yield values.split(' ')
+
+
+def feat_overlap(f1, f2):
+    """
+    Given two features (lists of length=9 from GFF3), determine whether they
+    overlap.
+    """
+    f1start = int(f1[3])
+    f1end = int(f1[4])
+    f2start = int(f2[3])
+    f2end = int(f2[4])
+
+    if f1start <= f2end and f1end >= f2start:
+        return True
+    return False
+
+
+def exon_context(exon, start, stop):
+    """
+    Given an exon, a start codon, and a stop codon (GFF3 entries),
+    determine the context of the exon:
+      - cds (entirely coding)
+      - 5putr (entirely 5' UTR)
+      - 3putr (entirely 3' UTR)
+      - start (includes start codon)
+      - stop (includes stop codon)
+      - complete (includes both start and stop codon)
+    """
+    assert start and stop
+    exon = exon.split('\t')
+    start = start.split('\t')
+    stop = stop.split('\t')
+    assert len(exon) == 9 and len(start) == 9 and len(stop) == 9
+
+    hasstart = feat_overlap(exon, start)
+    hasstop = feat_overlap(exon, stop)
+    if hasstart or hasstop:
+        if hasstart and hasstop:
+            return 'complete'
+        elif hasstart:
+            return 'start'
+        else:
+            assert hasstop
+            return 'stop'
+
+    exonstart = int(exon[3])
+    exonend = int(exon[4])
+    codonnucs = [start[3], start[4], stop[3], stop[4]]
+    codonnucs = [int(x) for x in codonnucs]
+    leftmostnuc = min(codonnucs)
+    rightmostnuc = max(codonnucs)
+    if exonend < leftmostnuc:
+        if exon[6] == '-':
+            return '3putr'
+        else:
+            return '5putr'
+    elif exonstart > rightmostnuc:
+        if exon[6] == '-':
+            return '5putr'
+        else:
+            return '3putr'
+    else:
+        assert exonstart > leftmostnuc and exonend < rightmostnuc
+        return 'cds'
+
+
+class ExonTable(object):
+    """
+    Tabular record for each exon, given the composition of exon sequences.
+
+    Exons are reported only once, even if shared by several transcripts.
+    """
+
+    header = ['ExonPos', 'MrnaAcc', 'Length', 'GCContent', 'GCSkew',
+              'NContent', 'Context', 'Phase', 'Remainder']
+    types = ['str', 'str', 'int', 'float', 'float', 'float', 'cat', 'int?',
+             'int?']
+    moltypes = ['mRNA', 'tRNA', 'ncRNA', 'transcript', 'primary_transcript',
+                'V_gene_segment', 'D_gene_segment', 'J_gene_segment',
+                'C_gene_segment']
+
+    def __init__(self, seqs):
+        self.seqs = seqs
+        self.rnaid_to_accession = dict()
+        self.reported_exons = dict()
+        self.exons, self.cdss = [], {}
+        self.start, self.stop = None, None
+
+    def rows(self, group):
+        for entry, fields in group:
+            ftype = feattype(fields)
+            if ftype in self.moltypes:
+                accession = re.search('accession=([^;\n]+)', entry).group(1)
+                tid = re.search('ID=([^;\n]+)', entry).group(1)
+                self.rnaid_to_accession[tid] = accession
+
+            if ftype == 'exon':
+                self.exons.append(entry)
+            elif ftype == 'CDS':
+                pos = '%s_%s-%s%s' % (fields[0], fields[3], fields[4],
+                                      fields[6])
+                self.cdss[pos] = entry
+            elif ftype == 'start_codon':
+                self.start = entry
+            elif ftype == 'stop_codon':
+                self.stop = entry
+            elif entry.startswith('###'):
+                for row in self.report():
+                    yield row
+
+    def report(self):
+        if len(self.exons) == 0:
+            return
+        for exonpos in self.cdss:
+            if ';exception=ribosomal slippage' in self.cdss[exonpos]:
+                self.exons, self.cdss = [], {}
+                self.start, self.stop = None, None
+                return
+        start, stop = self.start, self.stop
+        assert start, 'No start codon for exon(s): %s' % self.exons[0]
+        assert stop,  'No stop codon for exon(s): %s' % self.exons[0]
+        for exon in self.exons:
+            fields = exon.split('\t')
+            assert len(fields) == 9, 'entry does not have 9 fields: %s' % exon
+            mrnaid = re.search('Parent=([^;\n]+)', fields[8]).group(1)
+            exonpos = '%s_%s-%s%s' % (fields[0], fields[3], fields[4],
+                                      fields[6])
+            if exonpos in self.reported_exons:
+                continue
+            exonlength = int(fields[4]) - int(fields[3]) + 1
+            seqlen, (gccontent, gcskew, ncontent) = self.seqs[exonpos]
+            assert seqlen == exonlength, \
+                'exon "%s": length mismatch; gff=%d, fa=%d' % \
+                (exonpos, exonlength, seqlen)
+            context = exon_context(exon, start, stop)
+            phase = None
+            remainder = None
+            if context == 'cds':
+                cexon = self.cdss[exonpos]
+                phase = int(cexon.split('\t')[7])
+                remainder = (exonlength - phase) % 3
+            values = '%s %s %d %.3f %.3f %.3f %s %r %r' % (
+                exonpos, self.rnaid_to_accession[mrnaid], exonlength,
+                gccontent, gcskew, ncontent, context, phase, remainder)
+            self.reported_exons[exonpos] = 1
+            yield values.split(' ')
+        self.exons, self.cdss = [], {}
+        self.start, self.stop = None, None
+
+
+def intron_context(intron, start, stop):
+    """
+    Given an intron, a start codon, and a stop codon (GFF3 entries),
+    determine the context of the exon:
+      - cds (entirely coding)
+      - 5putr (entirely 5' UTR)
+      - 3putr (entirely 3' UTR)
+      - start (includes start codon)
+      - stop (includes stop codon)
+      - complete (includes both start and stop codon)
+    """
+    assert start and stop
+    intron = intron.split('\t')
+    start = start.split('\t')
+    stop = stop.split('\t')
+    assert len(intron) == 9 and len(start) == 9 and len(stop) == 9
+
+    intronstart = int(intron[3])
+    intronend = int(intron[4])
+    codonnucs = [start[3], start[4], stop[3], stop[4]]
+    codonnucs = [int(x) for x in codonnucs]
+    leftmostnuc = min(codonnucs)
+    rightmostnuc = max(codonnucs)
+    if intronend < leftmostnuc:
+        if intron[6] == '-':
+            return '3putr'
+        else:
+            return '5putr'
+    elif intronstart > rightmostnuc:
+        if intron[6] == '-':
+            return '5putr'
+        else:
+            return '3putr'
+    else:
+        assert intronstart > leftmostnuc and intronend < rightmostnuc
+        return 'cds'
+
+
+class IntronTable(object):
+    """
+    Tabular record for each intron, given the composition of intron
+    sequences.
+
+    Introns are reported only once, even if shared by several transcripts.
+    """
+
+    header = ['IntronPos', 'MrnaAcc', 'Length', 'GCContent', 'GCSkew',
+              'NContent', 'Context']
+    types = ['str', 'str', 'int', 'float', 'float', 'float', 'cat']
+
+    def __init__(self, seqs):
+        self.seqs = seqs
+        self.reported_introns = dict()
+        self.introns = []
+        self.mrnaid = None
+        self.start, self.stop = None, None
+
+    def rows(self, group):
+        for entry, fields in group:
+            ftype = feattype(fields)
+            if ftype == 'mRNA':
+                self.mrnaid = re.search('accession=([^;\n]+)',
+                                        entry).group(1)
+            elif ftype == 'intron':
+                self.introns.append(entry)
+            elif ftype == 'start_codon':
+                self.start = entry
+            elif ftype == 'stop_codon':
+                self.stop = entry
+            elif entry.startswith('###'):
+                for row in self.report():
+                    yield row
+
+    def report(self):
+        if self.mrnaid is None:
+            return
+        introns, start, stop = self.introns, self.start, self.stop
+        assert start, 'No start codon for introns(s): %s' % introns[0]
+        assert stop,  'No stop codon for introns(s): %s' % introns[0]
+        for intron in introns:
+            fields = intron.split('\t')
+            assert len(fields) == 9, \
+                'entry does not have 9 fields: %s' % intron
+            intronpos = '%s_%s-%s%s' % (fields[0], fields[3], fields[4],
+                                        fields[6])
+            if intronpos in self.reported_introns:
+                continue
+            intronlength = int(fields[4]) - int(fields[3]) + 1
+            seqlen, (gccontent, gcskew, ncontent) = self.seqs[intronpos]
+            assert seqlen == intronlength, \
+                'intron "%s": length mismatch; gff=%d, fa=%d' % \
+                (intronpos, intronlength, seqlen)
+            context = intron_context(intron, start, stop)
+            values = '%s %s %d %.3f %.3f %.3f %s' % (
+                intronpos, self.mrnaid, intronlength, gccontent, gcskew,
+                ncontent, context)
+            self.reported_introns[intronpos] = 1
+            yield values.split(' ')
+        self.mrnaid = None
+        self.introns = []
+        self.start, self.stop = None, None
+
+
+def scan(gff3, tables, species, header=True, columns=None):
+    """
+    Compute any number of tables with a single pass over a GFF3 stream.
+
+    Each feature group is parsed once and passed to every table, and its rows
+    are written immediately. The `tables` are (table, output stream) pairs.
+    Rows are also appended to the corresponding `columns`, a list of
+    `ColumnarTable` objects (or None), if provided.
+    """
+    if columns is None:
+        columns = [None] * len(tables)
+    for table, outstream in tables:
+        if header:
+            print('\t'.join(['Species'] + table.header), file=outstream)
+    for group in groups(gff3):
+        for (table, outstream), cols in zip(tables, columns):
+            for fields in table.rows(group):
+                fields = [species] + fields
+                print('\t'.join(fields), file=outstream)
+                if cols is not None:
+                    cols.append(fields)
 
 
-def compute(db, logstream=sys.stderr):  # pragma: no cover
-    if logstream is not None:
+# Table name: (GFF3 suffix, Fasta suffix, table suffix, feature type, defline
+# field holding the feature key, whether keys must be unique)
+TABLES = OrderedDict([
+    ('iloci', ('iloci.gff3', 'iloci.fa', 'iloci.tsv', 'locus', 0, True)),
+    ('miloci', ('miloci.gff3', 'miloci.fa', 'miloci.tsv', 'locus', 0, True)),
+    ('prnas', ('ilocus.mrnas.gff3', 'pre-mrnas.fa', 'pre-mrnas.tsv', 'mRNA',
+               0, False)),
+    ('mrnas', ('ilocus.mrnas.gff3', 'mrnas.fa', 'mrnas.tsv', 'mRNA', 0,
+               False)),
+    ('cds', ('ilocus.mrnas.gff3', 'cds.fa', 'cds.tsv', 'CDS', 0, False)),
+    ('exons', ('ilocus.mrnas.gff3', 'exons.fa', 'exons.tsv', 'exon', 1,
+               False)),
+    ('introns', ('ilocus.mrnas.gff3', 'introns.fa', 'introns.tsv', 'intron',
+                 1, False)),
+])
+
+
+def new_table(name, seqs, usecds=False):
+    """Create a table of the given name (see `TABLES`)."""
+    if name == 'iloci':
+        return ILocusTable(seqs)
+    elif name == 'miloci':
+        return ILocusTable(seqs, miloci=True)
+    elif name == 'mrnas':
+        return MrnaTable(seqs, exontype='CDS' if usecds else 'exon')
+    tables = {'prnas': PremrnaTable, 'cds': CDSTable, 'exons': ExonTable,
+              'introns': IntronTable}
+    return tables[name](seqs)
+
+
+def shards(gff3file, count, grouped=True):
+    """
+    Divide a GFF3 file into at most `count` regions of similar size.
+
+    Each region is a (start, end, seqids) tuple: byte offsets (`end` is None
+    for the end of the file) and the set of sequence IDs of its features.
+    Regions break only between sequences, and if `grouped` is true only at
+    `###` lines, so that no feature group is split. If the features of a
+    sequence are not contiguous, the entire file is a single region (with
+    `seqids` None).
+    """
+    blocks = list()
+    seqid, seen = None, set()
+    offset, cut, last = 0, 0, 0
+    with open(gff3file, 'rb') as instream:
+        for line in instream:
+            if line.startswith(b'###'):
+                cut = offset + len(line)
+            elif not line.startswith(b'#') and b'\t' in line:
+                lineseqid = line.split(b'\t', 1)[0].decode('utf-8')
+                if lineseqid != seqid:
+                    if lineseqid in seen:
+                        return [(0, None, None)]
+                    seen.add(lineseqid)
+                    if not grouped:
+                        cut = offset
+                    if len(blocks) == 0:
+                        blocks.append((0, set([lineseqid])))
+                    elif cut > last:
+                        blocks.append((cut, set([lineseqid])))
+                    else:
+                        blocks[-1][1].add(lineseqid)
+                    seqid = lineseqid
+                last = offset
+            offset += len(line)
+
+    regions = list()
+    start, seqids = 0, set()
+    for i, (_, blockseqids) in enumerate(blocks):
+        seqids |= blockseqids
+        if i + 1 == len(blocks):
+            break
+        end = blocks[i + 1][0]
+        if end * count >= offset * (len(regions) + 1):
+            regions.append((start, end, seqids))
+            start, seqids = end, set()
+    regions.append((start, None, seqids))
+    return regions
+
+
+# Tables whose rows depend only on features of the same sequence, which can be
+# computed for each region of a GFF3 file independently (see `shards`).
+SHARDED = ['iloci', 'miloci', 'exons', 'introns']
+
+
+def _scan_file(args):
+    """
+    Compute tables for a GFF3 file, or for one region of it.
+
+    For an entire file, the tables are written to their output files;
+    otherwise a (text, columns) tuple is returned for each table, with its
+    rows (without headers) and if columnar output is enabled the columns of a
+    `ColumnarTable`.
+    """
+    gff3file, region, outputs, species, options = args
+    index = None
+    if options['indexdir'] is not None:
+        index = genhub.composition.CompositionIndex(options['indexdir'])
+    usecds = options['usecds']
+    tables, streams = list(), list()
+    for name, fastafile, outfile in outputs:
+        ftype, keyfield, unique = TABLES[name][3:]
+        exontype = None
+        if name == 'mrnas':
+            exontype = 'CDS' if usecds else 'exon'
+        if options['stream'] and index is None:
+            seqids = None if region is None else region[2]
+            seqs = CompositionStream(fastafile, keyfield=keyfield,
+                                     unique=unique, seqids=seqids)
+            streams.append(seqs)
+        else:
+            with composition_source(fastafile, gff3file, ftype, index,
+                                    exontype=exontype, region=region) as fa:
+                seqs = load_composition(fa, keyfield=keyfield, unique=unique)
+        tables.append(new_table(name, seqs, usecds=usecds))
+    if index is not None:
+        index.close()
+
+    columns = None
+    if options['columnar']:
+        columns = [ColumnarTable(table) for table in tables]
+    if region is None:
+        outstreams = [open(outfile, 'w') for _, _, outfile in outputs]
+    else:
+        outstreams = [StringIO() for _ in outputs]
+    try:
+        with open_region(gff3file, region) as gff3:
+            scan(gff3, list(zip(tables, outstreams)), species,
+                 header=region is None, columns=columns)
+        if region is not None:
+            if columns is None:
+                columns = [None] * len(outputs)
+            return [(out.getvalue(), None if cols is None else cols.columns)
+                    for out, cols in zip(outstreams, columns)]
+    finally:
+        for out in outstreams + streams:
+            out.close()
+    if columns is not None:
+        for (_, _, outfile), cols in zip(outputs, columns):
+            cols.save(columnar_path(outfile))
+
+
+def compute_tables(requests, species, indexdir=None, usecds=False, jobs=1,
+                   stream=False, columnar=False):
+    """
+    Compute feature statistics tables.
+
+    Each request is a `(name, gff3file, fastafile, outfile)` tuple, where
+    `name` is one of the keys of `TABLES`. If `indexdir` is given, sequence
+    composition is computed with that composition index and the Fasta files
+    are not used; otherwise, set `stream` to read the Fasta files in step with
+    the GFF3 files rather than loading them up front (see
+    `CompositionStream`). Set `usecds` to determine mature mRNA structure from
+    CDS rather than exon features. Set `columnar` to also save each table in
+    columnar format (see `ColumnarTable` and `read_table`).
+
+    With `jobs` > 1, tables are computed by a pool of worker processes: each
+    table separately, and the `SHARDED` tables in regions of the GFF3 file
+    (see `shards`) whose rows are then concatenated in their original order.
+    The output is identical to that of a single process.
+    """
+    if columnar and numpy is None:
+        raise ImportError('columnar output requires NumPy')
+    options = {'indexdir': indexdir, 'usecds': usecds, 'stream': stream,
+               'columnar': columnar}
+    scans = OrderedDict()
+    for name, gff3file, fastafile, outfile in requests:
+        assert name in TABLES, 'unknown table "%s"' % name
+        outputs = scans.setdefault(gff3file, list())
+        outputs.append((name, fastafile, outfile))
+
+    if jobs < 2 or multiprocessing.current_process().daemon:
+        for gff3file, outputs in scans.items():
+            _scan_file((gff3file, None, outputs, species, options))
+        return
+
+    tasks, merged = list(), list()
+    for gff3file, outputs in scans.items():
+        sharded = [o for o in outputs if o[0] in SHARDED]
+        for output in outputs:
+            if output not in sharded:
+                tasks.append((gff3file, None, [output], species, options))
+        if len(sharded) == 0:
+            continue
+        grouped = any([o[0] not in ('iloci', 'miloci') for o in sharded])
+        for region in shards(gff3file, jobs, grouped=grouped):
+            tasks.append((gff3file, region, sharded, species, options))
+        merged.extend(sharded)
+
+    outstreams, columns = dict(), dict()
+    pool = multiprocessing.Pool(processes=min(jobs, len(tasks)))
+    try:
+        for name, _, outfile in merged:
+            table = new_table(name, dict())
+            outstreams[outfile] = open(outfile, 'w')
+            print('\t'.join(['Species'] + table.header),
+                  file=outstreams[outfile])
+            if columnar:
+                columns[outfile] = ColumnarTable(table)
+        for task, result in zip(tasks, pool.imap(_scan_file, tasks)):
+            if result is None:
+                continue
+            for (_, _, outfile), (rows, cols) in zip(task[2], result):
+                outstreams[outfile].write(rows)
+                if cols is not None:
+                    columns[outfile].extend(cols)
+    finally:
+        pool.close()
+        pool.join()
+        for outstream in outstreams.values():
+            outstream.close()
+    for outfile, cols in columns.items():
+        cols.save(columnar_path(outfile))
+
+
+# -----------------------------------------------------------------------------
+# Columnar output
+# -----------------------------------------------------------------------------
+
+def columnar_path(tsvfile):
+    """The columnar (`.npz`) counterpart of a table's TSV file."""
+    if tsvfile.endswith('.tsv'):
+        tsvfile = tsvfile[:-4]
+    return tsvfile + '.npz'
+
+
+class ColumnarTable(object):
+    """
+    Rows of a table, accumulated column by column and saved as typed arrays.
+
+    Columns have the types declared by the table (see `ILocusTable.types`,
+    etc.): `int`, `float`, and `bool` columns are stored as such, `int?` as
+    floats with NaN for missing values, `str` as strings, and `cat` as
+    categoricals, i.e. an array of integer codes (-1 for missing values) and
+    an array of categories. As with `pandas.read_table`, the values `NA` and
+    `None` are missing. Tables are saved in NumPy's `.npz` format.
+    """
+
+    missing = ['NA', 'None']
+
+    def __init__(self, table):
+        self.header = ['Species'] + table.header
+        self.types = ['cat'] + table.types
+        self.columns = [list() for _ in self.header]
+
+    def append(self, fields):
+        for column, value in zip(self.columns, fields):
+            column.append(value)
+
+    def extend(self, columns):
+        for column, values in zip(self.columns, columns):
+            column.extend(values)
+
+    def arrays(self):
+        """Convert each column to an array; categoricals to (codes, labels)."""
+        arrays = OrderedDict()
+        for name, coltype, values in zip(self.header, self.types,
+                                         self.columns):
+            values = numpy.array(values, dtype=str)
+            if coltype == 'int':
+                values = values.astype(numpy.int64)
+            elif coltype == 'float':
+                values = values.astype(numpy.float64)
+            elif coltype == 'int?':
+                values = numpy.where(numpy.isin(values, self.missing), 'nan',
+                                     values).astype(numpy.float64)
+            elif coltype == 'bool':
+                values = values == 'True'
+            elif coltype == 'cat':
+                labels, codes = numpy.unique(values, return_inverse=True)
+                keep = ~numpy.isin(labels, self.missing)
+                recode = numpy.cumsum(keep) - 1
+                recode[~keep] = -1
+                values = (recode[codes.ravel()].astype(numpy.int32),
+                          labels[keep])
+            arrays[name] = values
+        return arrays
+
+    def save(self, filename):
+        if numpy is None:
+            raise ImportError('columnar output requires NumPy')
+        data = {'columns': numpy.array(self.header)}
+        for name, values in self.arrays().items():
+            if isinstance(values, tuple):
+                data[name], data[name + '.categories'] = values
+            else:
+                data[name] = values
+        tempfile = filename + '.tmp'
+        with open(tempfile, 'wb') as outstream:
+            numpy.savez(outstream, **data)
+        os.rename(tempfile, filename)
+
+
+def load_columns(npzfile, columns=None):
+    """
+    Load a table saved by `ColumnarTable`.
+
+    Returns an ordered mapping of column names to arrays, and a mapping of
+    categorical column names to their categories; the arrays of categorical
+    columns hold the integer codes. Only the arrays of the specified
+    `columns` are read, if provided.
+    """
+    if numpy is None:
+        raise ImportError('columnar output requires NumPy')
+    with numpy.load(npzfile) as data:
+        arrays = OrderedDict()
+        categories = dict()
+        for name in data['columns']:
+            name = str(name)
+            if columns is not None and name not in columns:
+                continue
+            arrays[name] = data[name]
+            if name + '.categories' in data.files:
+                categories[name] = data[name + '.categories']
+    return arrays, categories
+
+
+# The type of each column of the feature tables (see `ColumnarTable`).
+COLUMN_TYPES = {'Species': 'cat'}
+for _table in (ILocusTable, PremrnaTable, MrnaTable, CDSTable, ExonTable,
+               IntronTable):
+    COLUMN_TYPES.update(zip(_table.header, _table.types))
+
+
+def read_table(tsvfile, columns=None):
+    """
+    Load a feature table as a `pandas.DataFrame`.
+
+    If its columnar counterpart (see `columnar_path`) exists and is not older
+    than the TSV file, it is loaded instead of parsing the TSV file. Either
+    way, categorical columns (see `COLUMN_TYPES`) are loaded as
+    `pandas.Categorical` values, and if `columns` is given only those columns
+    are loaded.
+    """
+    import pandas
+    npzfile = columnar_path(tsvfile)
+    if numpy is not None and os.path.exists(npzfile):
+        if not os.path.exists(tsvfile) or \
+                os.path.getmtime(npzfile) >= os.path.getmtime(tsvfile):
+            arrays, categories = load_columns(npzfile, columns)
+            for name, labels in categories.items():
+                arrays[name] = pandas.Categorical.from_codes(arrays[name],
+                                                             labels)
+            return pandas.DataFrame(arrays)
+    with open(tsvfile, 'r') as instream:
+        header = instream.readline().rstrip('\n').split('\t')
+    dtype = dict()
+    for name in header:
+        if columns is not None and name not in columns:
+            continue
+        if COLUMN_TYPES.get(name) == 'cat':
+            dtype[name] = 'category'
+    return pandas.read_table(tsvfile, usecols=columns, dtype=dtype)
+
+
+# -----------------------------------------------------------------------------
+# Driver function
+# -----------------------------------------------------------------------------
+
+def compute(db, tables=None, jobs=1, columnar=False, index=False,
+            logstream=sys.stderr):
+    """
+    Compute descriptive statistics of genome features.
+
+    By default all tables are computed (see `TABLES`); otherwise, `tables` is
+    a list of table names. Sequence composition is taken from the feature
+    sequences extracted by the `breakdown` task, or if `index` is true, from
+    the composition index (`GenomeDB.composition_index`, built if needed), in
+    which case only the GFF3 files are needed. The index requires NumPy and
+    takes more disk space than the genome sequence itself. Set `columnar` to
+    also save the tables in columnar format.
+
+    All tables of the genome are then summarized in its summary file (see
+    `genhub.summary.save_summary`).
+    """
+    if logstream is not None:  # pragma: no cover
         logmsg = '[GenHub: %s] ' % db.config['species']
         logmsg += 'calculating feature statistics'
         print(logmsg, file=logstream)
 
+    if tables is None:
+        tables = list(TABLES.keys())
     prefix = '%s/%s/%s' % (db.workdir, db.label, db.label)
-    prefix3 = (prefix, prefix, prefix)
-
-    command = 'genhub-stats.py --species ' + db.label
-    command += ' --iloci %s.iloci.gff3 %s.iloci.fa %s.iloci.tsv' % prefix3
-    command += ' --miloci %s.miloci.gff3 %s.miloci.fa %s.miloci.tsv' % prefix3
-    command += (' --prnas %s.ilocus.mrnas.gff3 %s.pre-mrnas.fa '
-                '%s.pre-mrnas.tsv' % prefix3)
-    command += ' --mrnas %s.mrnas.gff3 %s.mrnas.fa %s.mrnas.tsv' % prefix3
-    command += ' --cds %s.ilocus.mrnas.gff3 %s.cds.fa %s.cds.tsv' % prefix3
-    command += (' --exons %s.ilocus.mrnas.gff3 %s.exons.fa '
-                '%s.exons.tsv' % prefix3)
-    command += (' --introns %s.ilocus.mrnas.gff3 %s.introns.fa '
-                '%s.introns.tsv' % prefix3)
-
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    requests = list()
+    for name in tables:
+        gff3suffix, fastasuffix, tablesuffix = TABLES[name][:3]
+        requests.append((name, '%s.%s' % (prefix, gff3suffix),
+                         '%s.%s' % (prefix, fastasuffix),
+                         '%s.%s' % (prefix, tablesuffix)))
+
+    indexdir = None
+    if index:
+        assert genhub.composition.numpy is not None, \
+            'the composition index requires NumPy'
+        db.composition_index(logstream=logstream).close()
+        indexdir = db.compindexdir
+    usecds = repr(db) in ['BeeBase', 'OGS1.0']
+    compute_tables(requests, db.label, indexdir=indexdir, usecds=usecds,
+                   jobs=jobs, columnar=columnar)
+    genhub.summary.save_summary(db, logstream=logstream)
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+
+def _requests(outdir):
+    workdir = 'testdata/demo-workdir/Atha/Atha.'
+    requests = [
+        ('iloci', 'testdata/gff3/bdis-iloci.gff3',
+         'testdata/fasta/bdis-iloci.fa', outdir + '/Bdis.iloci.tsv'),
+        ('miloci', 'testdata/gff3/bdis-miloci.gff3',
+         'testdata/fasta/bdis-miloci.fa', outdir + '/Bdis.miloci.tsv'),
+    ]
+    for name in ['prnas', 'mrnas', 'cds', 'exons', 'introns']:
+        fastasuffix, tablesuffix = TABLES[name][1:3]
+        requests.append((name, workdir + 'ilocus.mrnas.gff3',
+                         'testdata/fasta/atha-' + fastasuffix,
+                         outdir + '/Atha.' + tablesuffix))
+    return requests
+
+
+def _compare(outdir, tables):
+    for name in tables:
+        species = 'bdis' if name.endswith('iloci') else 'atha'
+        tablesuffix = TABLES[name][2]
+        outfile = '%s/%s.%s' % (outdir, species.capitalize(), tablesuffix)
+        testfile = 'testdata/misc/%s-stats.%s' % (species, tablesuffix)
+        assert filecmp.cmp(outfile, testfile), (outfile, testfile)
+
+
+def test_groups():
+    """Stats: feature groups"""
+    gff3 = ['##gff-version 3\n', 'chr\t.\tgene\t1\t9\t.\t+\t.\tID=g1\n',
+            '###\n', 'chr\t.\tgene\t20\t29\t.\t+\t.\tID=g2\n']
+    grouped = list(groups(gff3))
+    assert len(grouped) == 2
+    assert [len(group) for group in grouped] == [3, 1]
+    assert [feattype(fields) for entry, fields in grouped[0]] == \
+        [None, 'gene', None]
+    assert grouped[1][0][1][8] == 'ID=g2'
+
+
+def test_tables():
+    """Stats: feature tables from extracted sequences"""
+    outdir = 'testdata/demo-workdir/stats'
+    os.mkdir(outdir)
+    compute_tables(_requests(outdir), 'Test')
+    _compare(outdir, TABLES.keys())
+    shutil.rmtree(outdir)
+
+
+def test_tables_index():
+    """Stats: feature tables from the composition index, in parallel"""
+    if genhub.composition.numpy is None:  # pragma: no cover
+        return
+    outdir = 'testdata/demo-workdir/stats'
+    os.mkdir(outdir)
+    requests = [r for r in _requests(outdir) if 'iloci' not in r[0]]
+    indexdir = outdir + '/Atha.gdna.comp'
+    genhub.composition.build_index('testdata/demo-workdir/Atha/Atha.gdna.fa',
+                                   indexdir)
+    compute_tables(requests, 'Test', indexdir=indexdir, jobs=2)
+    _compare(outdir, [r[0] for r in requests])
+    shutil.rmtree(outdir)
+
+
+def test_tables_stream():
+    """Stats: feature tables with streaming sequence composition"""
+    outdir = 'testdata/demo-workdir/stats'
+    os.mkdir(outdir)
+    compute_tables(_requests(outdir), 'Test', stream=True)
+    _compare(outdir, TABLES.keys())
+
+    fastafile = 'testdata/fasta/bdis-iloci.fa'
+    with open(fastafile, 'r') as instream:
+        expected = load_composition(instream, unique=True)
+        instream.seek(0)
+        records = list(genhub.fasta.parse_bulk(instream, astext=True))
+    keys = [defline[1:].split(' ')[0] for defline, seq in records]
+    with CompositionStream(fastafile, unique=True, window=2) as seqs:
+        assert [seqs[key] for key in keys] == [expected[k] for k in keys]
+        assert seqs.index is None and len(seqs.recent) == 2
+    shuffled = outdir + '/shuffled.fa'
+    with open(shuffled, 'w') as outstream:
+        for defline, seq in reversed(records):
+            print(defline, seq, sep='\n', file=outstream)
+    with CompositionStream(shuffled, unique=True, window=2) as seqs:
+        assert [seqs[key] for key in keys] == [expected[k] for k in keys]
+        assert len(seqs.index) == len(keys)
+        try:
+            seqs['BdisILC-99999']
+        except KeyError:
+            pass
+        else:
+            assert False, 'missing key not detected'
+
+    fastafile = 'testdata/fasta/atha-exons.fa'
+    with open(fastafile, 'r') as instream:
+        expected = load_composition(instream, keyfield=1)
+        instream.seek(0)
+        records = list(genhub.fasta.parse_bulk(instream, astext=True))
+    shuffled = outdir + '/shuffled-exons.fa'
+    with open(shuffled, 'w') as outstream:
+        for defline, seq in reversed(records):
+            print(defline, seq, sep='\n', file=outstream)
+    keys = [defline[1:].split(' ')[1] for defline, seq in records]
+    with CompositionStream(shuffled, keyfield=1, window=2) as seqs:
+        assert [seqs[key] for key in keys] == [expected[k] for k in keys]
+    assert not os.path.exists(shuffled + '.fai')
+    shutil.rmtree(outdir)
+
+
+def test_columnar():
+    """Stats: feature tables in columnar format"""
+    if numpy is None:  # pragma: no cover
+        return
+    outdir = 'testdata/demo-workdir/stats'
+    os.mkdir(outdir)
+    requests = _requests(outdir)
+    compute_tables(requests, 'Test', columnar=True)
+    for name, _, _, outfile in requests:
+        with open(outfile, 'r') as instream:
+            header = next(instream).rstrip().split('\t')
+            rows = [line.rstrip('\n').split('\t') for line in instream]
+        columns, categories = load_columns(columnar_path(outfile))
+        assert list(columns.keys()) == header
+        types = ['cat'] + new_table(name, dict()).types
+        for i, (colname, coltype) in enumerate(zip(header, types)):
+            values = [row[i] for row in rows]
+            if coltype == 'cat':
+                labels = [None if c < 0 else categories[colname][c]
+                          for c in columns[colname]]
+                assert labels == [None if v in ('NA', 'None') else v
+                                  for v in values]
+            elif coltype == 'int?':
+                assert [None if numpy.isnan(x) else int(x)
+                        for x in columns[colname]] == \
+                    [None if v == 'None' else int(v) for v in values]
+            elif coltype == 'bool':
+                assert columns[colname].dtype == bool
+                assert list(columns[colname]) == [v == 'True' for v in values]
+            else:
+                convert = {'int': int, 'float': float, 'str': str}[coltype]
+                assert list(columns[colname]) == [convert(v) for v in values]
+    columns, categories = load_columns(outdir + '/Bdis.iloci.npz')
+    assert list(categories['LocusClass']) == ['fiLocus', 'niLocus', 'siLocus']
+    assert list(columns['LocusClass']) == [2, 0, 0, 2, 2, 1]
+    assert list(categories['SeqID']) == ['NW_014576703.1', 'NW_014576707.1']
+    assert len(categories['FlankGeneOrient']) == 0
+    assert list(columns['FlankGeneOrient']) == [-1] * 6
+    assert columns['Length'].dtype == numpy.int64
+    columns, categories = load_columns(outdir + '/Bdis.iloci.npz',
+                                       ['LocusClass', 'Length', 'Species'])
+    assert list(columns.keys()) == ['Species', 'Length', 'LocusClass']
+    assert sorted(categories.keys()) == ['LocusClass', 'Species']
+    assert COLUMN_TYPES['LocusClass'] == 'cat'
+    assert COLUMN_TYPES['GeneCount'] == 'int'
+
+    serial = dict()
+    for name, _, _, outfile in requests:
+        serial[name] = load_columns(columnar_path(outfile))
+        os.unlink(columnar_path(outfile))
+    compute_tables(requests, 'Test', columnar=True, jobs=16)
+    for name, _, _, outfile in requests:
+        columns, categories = load_columns(columnar_path(outfile))
+        for colname, values in columns.items():
+            assert numpy.array_equal(values, serial[name][0][colname],
+                                     equal_nan=values.dtype == float)
+        for colname, labels in categories.items():
+            assert list(labels) == list(serial[name][1][colname])
+    _compare(outdir, TABLES.keys())
+    shutil.rmtree(outdir)
+
+
+def test_read_table():
+    """Stats: load feature tables with pandas"""
+    try:
+        import pandas
+    except ImportError:  # pragma: no cover
+        return
+    if numpy is None:  # pragma: no cover
+        return
+    import tempfile
+    outdir = tempfile.mkdtemp()
+    try:
+        requests = [r for r in _requests(outdir) if r[0] == 'iloci']
+        compute_tables(requests, 'Test', columnar=True)
+        tsvfile = requests[0][3]
+        npzfile = columnar_path(tsvfile)
+        mtime = os.path.getmtime(tsvfile)
+        with open(tsvfile, 'r') as instream:
+            header = next(instream).rstrip().split('\t')
+            rows = [line.rstrip('\n').split('\t') for line in instream]
+
+        frames = list()
+        for npztime in [mtime, mtime - 60]:  # .npz branch, then TSV branch
+            os.utime(npzfile, (npztime, npztime))
+            frame = read_table(tsvfile)
+            assert list(frame.columns) == header
+            for name in ['Species', 'SeqID', 'LocusClass', 'FlankGeneOrient']:
+                assert frame[name].dtype.name == 'category', name
+            assert list(frame['LocusClass'].cat.categories) == \
+                ['fiLocus', 'niLocus', 'siLocus']
+            assert list(frame['LocusClass']) == [row[9] for row in rows]
+            assert frame['FlankGeneOrient'].isnull().all()
+            assert list(frame['Length']) == [int(row[4]) for row in rows]
+            assert frame['Length'].dtype == numpy.int64
+            assert list(frame['GCContent']) == [float(row[6]) for row in rows]
+            assert frame['SeqUnannot'].dtype == bool
+            frames.append(frame)
+        for name in header:
+            assert frames[0][name].equals(frames[1][name]), name
+
+        os.unlink(tsvfile)
+        frame = read_table(tsvfile, columns=['LocusClass', 'Length'])
+        assert list(frame.columns) == ['Length', 'LocusClass']
+        assert frame['LocusClass'].dtype.name == 'category'
+        assert frame['Length'].equals(frames[0]['Length'])
+    finally:
+        shutil.rmtree(outdir)
+
+
+def test_shards():
+    """Stats: divide GFF3 files into regions"""
+    gff3file = 'testdata/gff3/bdis-ilocus-mrnas.gff3'
+    assert shards(gff3file, 2) == \
+        [(0, None, set(['NW_014576703.1', 'NW_014576707.1']))]
+    regions = shards(gff3file, 8)
+    assert regions == [(0, 2036, set(['NW_014576703.1'])),
+                       (2036, None, set(['NW_014576707.1']))]
+    with open(gff3file, 'r') as instream:
+        data = instream.read()
+    with open_region(gff3file, regions[0]) as first, \
+            open_region(gff3file, regions[1]) as second:
+        assert second.readline().startswith('NW_014576707.1\t')
+        second.seek(0)
+        assert first.read() + second.read() == data
+
+    regions = shards('testdata/gff3/bdis-iloci.gff3', 16, grouped=False)
+    assert [r[2] for r in regions] == \
+        [set(['NW_014576703.1']), set(['NW_014576707.1'])]
+    assert shards('testdata/gff3/bdis-iloci.gff3', 16)[0][:2] == (0, None)
+
+
+def test_tables_parallel():
+    """Stats: feature tables computed in parallel by sequence"""
+    outdir = 'testdata/demo-workdir/stats'
+    os.mkdir(outdir)
+    requests = [r for r in _requests(outdir) if 'iloci' in r[0]]
+    compute_tables(requests, 'Test', jobs=16)
+    _compare(outdir, ['iloci', 'miloci'])
+
+    if genhub.composition.numpy is not None:
+        indexdir = outdir + '/Bdis.gdna.comp'
+        genhub.composition.build_index(
+            'testdata/demo-workdir/Bdis/Bdis.gdna.fa', indexdir)
+        gff3file = 'testdata/gff3/bdis-ilocus-mrnas.gff3'
+        outputs = dict()
+        for jobs in [1, 8]:
+            requests = [(name, gff3file, None, '%s/%s.%d' % (outdir, name,
+                                                             jobs))
+                        for name in ['prnas', 'exons', 'introns']]
+            compute_tables(requests, 'Bdis', indexdir=indexdir, jobs=jobs)
+            for name, _, _, outfile in requests:
+                with open(outfile, 'r') as instream:
+                    outputs[name, jobs] = instream.read()
+        for name in ['prnas', 'exons', 'introns']:
+            assert outputs[name, 1] == outputs[name, 8]
+        assert outputs['exons', 8].count('\n') == 11
+    shutil.rmtree(outdir)
+
+
+def test_compute():
+    """Stats: compute feature tables for a genome"""
+    if genhub.composition.numpy is None:  # pragma: no cover
+        return
+    db = genhub.test_registry.genome('Atha', workdir='testdata/demo-workdir')
+    tables = ['prnas', 'mrnas', 'cds', 'exons', 'introns']
+    compute(db, tables=tables, index=True, logstream=None)
+    for name in tables:
+        tablesuffix = TABLES[name][2]
+        outfile = db.file_path('Atha.' + tablesuffix)
+        with open(outfile, 'r') as instream, \
+                open('testdata/misc/atha-stats.' + tablesuffix, 'r') as test:
+            expected = re.sub('^Test\t', 'Atha\t', test.read(), flags=re.M)
+            assert instream.read() == expected
+        os.unlink(outfile)
+    summary = genhub.summary.GenomeSummary.load(db.summaryfile)
+    assert list(summary.features.keys()) == tables
+    assert summary.species == 'Atha'
+    os.unlink(db.summaryfile)
+    shutil.rmtree(db.compindexdir)
@@ -0,0 +1,789 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Summaries of the feature tables of many genomes.
+
+The `genhub-ilocus-summary.py`, `genhub-milocus-summary.py`, and
+`genhub-pilocus-summary.py` scripts report a few aggregates of the iLocus,
+miLocus, and pre-mRNA tables of each genome: feature counts by class, total
+effective length, and the like. The `stats` task records these aggregates,
+along with quantile sketches of feature length and GC content, in a small
+summary file for each genome (`GenomeSummary`, `save_summary`), so that
+summaries of many genomes need not read the full tables.
+
+    >>> engine = SummaryEngine(registry, workdir='./species', jobs=4)
+    >>> for species, summary in engine.summaries(labels, ['iloci']):
+    ...     print(species, summary.count('iloci', ['siLocus']))
+
+Where the full tables are needed, as for `genhub-compact.py`, a
+`SummaryEngine` loads each table only once, with only the columns that any of
+these scripts use (see `COLUMNS`) and with categorical columns as
+`pandas.Categorical` values (see `genhub.stats.read_table`), and keeps
+recently used tables in a least-recently-used cache. The tables of many
+species can be loaded in parallel.
+
+    >>> for species, tables in engine.tables(labels, ['iloci', 'miloci']):
+    ...     print(species, len(tables['miloci']))
+"""
+
+from __future__ import print_function
+from __future__ import division
+from collections import OrderedDict
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+import genhub
+
+
+# The columns of each table loaded for summaries.
+COLUMNS = {
+    'iloci': ['Species', 'SeqID', 'Length', 'EffectiveLength', 'LocusClass'],
+    'miloci': ['Species', 'SeqID', 'Length', 'EffectiveLength', 'LocusClass',
+               'GeneCount'],
+    'prnas': ['Species', 'ExonCount'],
+}
+
+# The `GenomeDB` attribute with the file name of each table.
+FILES = {
+    'iloci': 'ilocustable',
+    'miloci': 'milocustable',
+    'prnas': 'premrnatable',
+}
+
+# Tables for which shuffled iLocus data is available.
+SHUFFLED = ['iloci', 'miloci']
+
+
+# -----------------------------------------------------------------------------
+# Summary files
+# -----------------------------------------------------------------------------
+
+GILOCUS_TYPES = ['siLocus', 'ciLocus', 'niLocus']
+
+# Columns by which the features of each table are classified.
+CLASS_COLUMNS = ['LocusClass', 'Context']
+
+# Columns whose totals, exact value counts, and approximate quantiles are
+# recorded for each class of features.
+TOTAL_COLUMNS = ['Length', 'EffectiveLength']
+HISTOGRAM_COLUMNS = ['GeneCount', 'ExonCount']
+SKETCH_COLUMNS = ['Length', 'GCContent']
+
+
+class QuantileSketch(object):
+    """
+    Streaming quantile sketch of non-negative values.
+
+    Values are counted in logarithmic bins, so that any quantile is estimated
+    within a relative error of `accuracy`, in a space that grows only with the
+    logarithm of the range of values. Sketches of the same accuracy can be
+    merged.
+    """
+
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.bins = dict()
+        self.zeros = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value != value:  # NaN
+            return
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zeros += 1
+            return
+        key = int(math.ceil(math.log(value, self.gamma)))
+        self.bins[key] = self.bins.get(key, 0) + 1
+
+    def merge(self, other):
+        assert other.accuracy == self.accuracy, 'incompatible sketches'
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate the `q` quantile (0.0-1.0); None if there are no values."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return self.min
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def todict(self):
+        return {'accuracy': self.accuracy, 'count': self.count,
+                'zeros': self.zeros, 'min': self.min, 'max': self.max,
+                'bins': dict((str(k), v) for k, v in self.bins.items())}
+
+    @classmethod
+    def fromdict(cls, data):
+        sketch = cls(accuracy=data['accuracy'])
+        sketch.count = data['count']
+        sketch.zeros = data['zeros']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        sketch.bins = dict((int(k), v) for k, v in data['bins'].items())
+        return sketch
+
+
+def histogram_quantile(histogram, q):
+    """
+    Compute the `q` quantile (0.0-1.0) of values counted in a histogram.
+
+    As with `pandas.Series.quantile`, the quantile is linearly interpolated
+    between the two nearest values.
+    """
+    total = sum(histogram.values())
+    if total == 0:
+        return None
+    position = q * (total - 1)
+    lower, upper = int(math.floor(position)), int(math.ceil(position))
+    values = dict()
+    seen = 0
+    for value in sorted(histogram):
+        count = histogram[value]
+        for rank in (lower, upper):
+            if seen <= rank < seen + count:
+                values[rank] = value
+        seen += count
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class FeatureClass(object):
+    """Aggregates of one class of features (such as siLoci) of a table."""
+
+    def __init__(self):
+        self.count = 0
+        self.totals = dict()
+        self.histograms = dict()
+        self.sketches = dict()
+
+    def merge(self, other):
+        self.count += other.count
+        for column, total in other.totals.items():
+            self.totals[column] = self.totals.get(column, 0) + total
+        for column, histogram in other.histograms.items():
+            merged = self.histograms.setdefault(column, dict())
+            for value, count in histogram.items():
+                merged[value] = merged.get(value, 0) + count
+        for column, sketch in other.sketches.items():
+            if column not in self.sketches:
+                self.sketches[column] = QuantileSketch(sketch.accuracy)
+            self.sketches[column].merge(sketch)
+
+    def todict(self):
+        histograms = dict()
+        for column, histogram in self.histograms.items():
+            histograms[column] = dict((str(value), count)
+                                      for value, count in histogram.items())
+        sketches = dict((column, sketch.todict())
+                        for column, sketch in self.sketches.items())
+        return {'count': self.count, 'totals': self.totals,
+                'histograms': histograms, 'sketches': sketches}
+
+    @classmethod
+    def fromdict(cls, data):
+        fclass = cls()
+        fclass.count = data['count']
+        fclass.totals = data['totals']
+        for column, histogram in data['histograms'].items():
+            fclass.histograms[column] = dict(
+                (int(value), count) for value, count in histogram.items())
+        for column, sketch in data['sketches'].items():
+            fclass.sketches[column] = QuantileSketch.fromdict(sketch)
+        return fclass
+
+
+def _number(value, convert):
+    if value in ('NA', 'None', 'nan'):
+        return None
+    return convert(value)
+
+
+class GenomeSummary(object):
+    """
+    Aggregates of the feature tables of a genome.
+
+    For each table (named as in `genhub.stats.TABLES`), the number of
+    sequences and, for each class of features (see `CLASS_COLUMNS`), the
+    number of features, the totals of `TOTAL_COLUMNS`, the exact value counts
+    of `HISTOGRAM_COLUMNS`, and quantile sketches of `SKETCH_COLUMNS`. The
+    summary is small enough to be saved and loaded as a JSON file, so that
+    summaries of many genomes need not read their feature tables.
+    """
+
+    def __init__(self, species=None):
+        self.species = species
+        self.seqcounts = OrderedDict()
+        self.features = OrderedDict()
+
+    def __contains__(self, name):
+        return name in self.features
+
+    def add_table(self, name, instream, accuracy=0.01):
+        """Summarize a feature table from a stream of its TSV file."""
+        header = next(instream).rstrip('\n').split('\t')
+        pos = dict((column, i) for i, column in enumerate(header))
+        classcol = [pos[c] for c in CLASS_COLUMNS if c in pos]
+        totals = [(c, pos[c]) for c in TOTAL_COLUMNS if c in pos]
+        histograms = [(c, pos[c]) for c in HISTOGRAM_COLUMNS if c in pos]
+        sketches = [(c, pos[c]) for c in SKETCH_COLUMNS if c in pos]
+        seqids = set()
+        classes = OrderedDict()
+        for line in instream:
+            values = line.rstrip('\n').split('\t')
+            if self.species is None and 'Species' in pos:
+                self.species = values[pos['Species']]
+            if 'SeqID' in pos:
+                seqids.add(values[pos['SeqID']])
+            label = values[classcol[0]] if classcol else name
+            fclass = classes.get(label)
+            if fclass is None:
+                fclass = classes[label] = FeatureClass()
+                for column, _ in histograms:
+                    fclass.histograms[column] = dict()
+                for column, _ in sketches:
+                    fclass.sketches[column] = QuantileSketch(accuracy)
+            fclass.count += 1
+            for column, i in totals:
+                value = _number(values[i], int)
+                if value is not None:
+                    fclass.totals[column] = \
+                        fclass.totals.get(column, 0) + value
+            for column, i in histograms:
+                value = _number(values[i], int)
+                if value is not None:
+                    histogram = fclass.histograms[column]
+                    histogram[value] = histogram.get(value, 0) + 1
+            for column, i in sketches:
+                value = _number(values[i], float)
+                if value is not None:
+                    fclass.sketches[column].add(value)
+        self.seqcounts[name] = len(seqids) if 'SeqID' in pos else None
+        self.features[name] = classes
+
+    def classes(self, name):
+        """List the feature classes of a table."""
+        return list(self.features[name].keys())
+
+    def _merged(self, name, classes=None, exclude=None):
+        merged = FeatureClass()
+        for label, fclass in self.features[name].items():
+            if classes is not None and label not in classes:
+                continue
+            if exclude is not None and label in exclude:
+                continue
+            merged.merge(fclass)
+        return merged
+
+    def count(self, name, classes=None, exclude=None):
+        """
+        Count the features of a table.
+
+        All features are counted by default; `classes` restricts the count to
+        features of the given classes, and `exclude` omits the given classes.
+        The same applies to `total`, `histogram`, and `quantile`.
+        """
+        return self._merged(name, classes, exclude).count
+
+    def seqs(self, name):
+        """Count the distinct sequences of a table."""
+        return self.seqcounts[name]
+
+    def total(self, name, column, classes=None, exclude=None):
+        """Sum one of the `TOTAL_COLUMNS` of a table."""
+        return self._merged(name, classes, exclude).totals.get(column, 0)
+
+    def histogram(self, name, column, classes=None, exclude=None):
+        """Count the values of one of the `HISTOGRAM_COLUMNS` of a table."""
+        return self._merged(name, classes, exclude).histograms.get(column,
+                                                                   dict())
+
+    def quantile(self, name, column, q, classes=None, exclude=None):
+        """
+        Compute a quantile of a column of a table.
+
+        The quantile is exact for `HISTOGRAM_COLUMNS`, and estimated from the
+        quantile sketch for `SKETCH_COLUMNS`.
+        """
+        merged = self._merged(name, classes, exclude)
+        if column in merged.histograms:
+            return histogram_quantile(merged.histograms[column], q)
+        return merged.sketches[column].quantile(q)
+
+    def todict(self):
+        tables = OrderedDict()
+        for name, classes in self.features.items():
+            tables[name] = OrderedDict([
+                ('seqs', self.seqcounts[name]),
+                ('classes', OrderedDict((label, fclass.todict())
+                                        for label, fclass in classes.items())),
+            ])
+        return OrderedDict([('species', self.species), ('tables', tables)])
+
+    @classmethod
+    def fromdict(cls, data):
+        summary = cls(species=data['species'])
+        for name, table in data['tables'].items():
+            summary.seqcounts[name] = table['seqs']
+            summary.features[name] = OrderedDict(
+                (label, FeatureClass.fromdict(fclass))
+                for label, fclass in table['classes'].items())
+        return summary
+
+    def save(self, filename):
+        """Save the summary as a JSON file."""
+        tempfile = filename + '.tmp'
+        with open(tempfile, 'w') as outstream:
+            json.dump(self.todict(), outstream, indent=1)
+        os.rename(tempfile, filename)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'r') as instream:
+            return cls.fromdict(json.load(instream,
+                                          object_pairs_hook=OrderedDict))
+
+
+def summarize(tables, species=None):
+    """
+    Summarize feature tables.
+
+    The `tables` are `(name, tsvfile)` tuples; see `GenomeSummary`. The
+    species is taken from the tables' `Species` column, or from `species` if
+    the tables are empty.
+    """
+    summary = GenomeSummary()
+    for name, tsvfile in tables:
+        with open(tsvfile, 'r') as instream:
+            summary.add_table(name, instream)
+    if summary.species is None:
+        summary.species = species
+    return summary
+
+
+def is_current(summaryfile, tsvfiles):
+    """Determine whether a summary file is not older than the tables."""
+    if not os.path.exists(summaryfile):
+        return False
+    mtime = os.path.getmtime(summaryfile)
+    return all([os.path.getmtime(f) <= mtime for f in tsvfiles
+                if os.path.exists(f)])
+
+
+def save_summary(db, logstream=sys.stderr):
+    """
+    Summarize all feature tables of a genome in its summary file.
+
+    See `GenomeSummary` and `GenomeDB.summaryfile`.
+    """
+    if logstream is not None:  # pragma: no cover
+        logmsg = '[GenHub: %s] ' % db.config['species']
+        logmsg += 'summarizing feature statistics'
+        print(logmsg, file=logstream)
+    prefix = '%s/%s/%s' % (db.workdir, db.label, db.label)
+    tables = list()
+    for name, (_, _, tablesuffix, _, _, _) in genhub.stats.TABLES.items():
+        tsvfile = '%s.%s' % (prefix, tablesuffix)
+        if os.path.exists(tsvfile):
+            tables.append((name, tsvfile))
+    summarize(tables, species=db.label).save(db.summaryfile)
+
+
+def _summary(args):
+    """Load or compute a genome's summary; see `SummaryEngine.summaries`."""
+    species, tables, summaryfile = args
+    if summaryfile is not None and \
+            is_current(summaryfile, [f for _, f in tables]):
+        summary = GenomeSummary.load(summaryfile)
+        if all([name in summary for name, _ in tables]):
+            return summary
+    return summarize(tables, species=species)
+
+
+# -----------------------------------------------------------------------------
+# Feature tables
+# -----------------------------------------------------------------------------
+
+class TableCache(object):
+    """
+    A least-recently-used cache of tables.
+
+    Tables missing from the cache are loaded with `loader(key)`; once more
+    than `size` tables are cached, the least recently used is discarded.
+    """
+
+    def __init__(self, loader, size=16):
+        self.loader = loader
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        if key in self.entries:
+            self.hits += 1
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            return value
+        self.misses += 1
+        value = self.loader(key)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+def _read(args):
+    """Load a table; `args` is a `(reader, tsvfile, columns)` tuple."""
+    reader, tsvfile, columns = args
+    return reader(tsvfile, columns)
+
+
+class SummaryEngine(object):
+    """
+    Load the feature tables of many genomes for summaries.
+
+    Genomes are looked up by label in the `registry`, with data files in
+    `workdir`. If `shuffled` is set, iLocus and miLocus tables are loaded from
+    shuffled iLocus data. Up to `cachesize` tables are cached, and up to
+    `jobs` tables are loaded in parallel by `tables`. Tables are loaded by
+    `genhub.stats.read_table` by default, or by any function accepting the
+    same arguments.
+    """
+
+    def __init__(self, registry, workdir='./species', jobs=1, cachesize=16,
+                 shuffled=False, reader=None):
+        self.registry = registry
+        self.workdir = workdir
+        self.jobs = jobs
+        self.shuffled = shuffled
+        self.reader = reader or genhub.stats.read_table
+        self.cache = TableCache(self._load, size=cachesize)
+
+    def filename(self, species, name):
+        """The file name of a species' table."""
+        db = self.registry.genome(species, workdir=self.workdir)
+        attr = FILES[name]
+        if self.shuffled and name in SHUFFLED:
+            attr += 'shuf'
+        return getattr(db, attr)
+
+    def _task(self, key):
+        species, name = key
+        return self.reader, self.filename(species, name), COLUMNS[name]
+
+    def _load(self, key):
+        return _read(self._task(key))
+
+    def table(self, species, name):
+        """Retrieve one of a species' tables: iloci, miloci, or prnas."""
+        return self.cache.get((species, name))
+
+    def tables(self, species, names):
+        """
+        Retrieve the named tables of each species.
+
+        Yields a `(species, {name: table})` tuple for each species, in order.
+        Tables that are not cached are loaded in parallel if `jobs` is greater
+        than 1 (unless called from a worker process), as many species at a
+        time as the cache holds.
+        """
+        pool = None
+        if self.jobs > 1 and not multiprocessing.current_process().daemon:
+            pool = multiprocessing.Pool(processes=self.jobs)
+        step = max(1, self.cache.size // max(1, len(names)))
+        try:
+            for i in range(0, len(species), step):
+                batch = species[i:i + step]
+                keys = [(label, name) for label in batch for name in names]
+                missing = [key for key in OrderedDict.fromkeys(keys)
+                           if key not in self.cache]
+                loaded = dict()
+                if pool is not None and len(missing) > 1:
+                    tasks = [self._task(key) for key in missing]
+                    loaded = dict(zip(missing, pool.map(_read, tasks)))
+                for label in batch:
+                    tables = dict()
+                    for name in names:
+                        key = (label, name)
+                        if key in loaded:
+                            self.cache.misses += 1
+                            tables[name] = loaded.pop(key)
+                            self.cache.put(key, tables[name])
+                        else:
+                            tables[name] = self.cache.get(key)
+                    yield label, tables
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def summaries(self, species, names, rescan=False):
+        """
+        Retrieve summaries of the named tables of each species.
+
+        Yields a `(species, summary)` tuple for each species, in order (see
+        `GenomeSummary`). A genome's summary file (see `save_summary`) is used
+        if it is up to date and includes the tables; otherwise, or if `rescan`
+        is set, the summary is computed from the tables, for as many species
+        in parallel as `jobs`. Summary files do not cover shuffled iLocus data.
+        """
+        if self.shuffled and any([name in SHUFFLED for name in names]):
+            rescan = True
+        tasks = list()
+        for label in species:
+            db = self.registry.genome(label, workdir=self.workdir)
+            summaryfile = None if rescan else db.summaryfile
+            tables = [(name, self.filename(label, name)) for name in names]
+            tasks.append((label, tables, summaryfile))
+        pool = None
+        if self.jobs > 1 and len(tasks) > 1 and \
+                not multiprocessing.current_process().daemon:
+            pool = multiprocessing.Pool(processes=min(self.jobs, len(tasks)))
+            results = pool.imap(_summary, tasks)
+        else:
+            results = (_summary(task) for task in tasks)
+        try:
+            for task, summary in zip(tasks, results):
+                yield task[0], summary
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+
+def _test_reader(tsvfile, columns):
+    return tsvfile, tuple(columns)
+
+
+def test_table_cache():
+    """Summary: least-recently-used table cache"""
+    loaded = list()
+
+    def loader(key):
+        loaded.append(key)
+        return key.upper()
+
+    cache = TableCache(loader, size=2)
+    assert cache.get('a') == 'A'
+    assert cache.get('b') == 'B'
+    assert cache.get('a') == 'A'
+    assert cache.get('c') == 'C'
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.get('b') == 'B'
+    assert 'a' not in cache
+    assert loaded == ['a', 'b', 'c', 'b']
+    assert (cache.hits, cache.misses) == (1, 4)
+    assert len(cache) == 2
+
+
+def test_engine():
+    """Summary: load tables of many species"""
+    registry = genhub.registry.Registry()
+    engine = SummaryEngine(registry, workdir='wd', reader=_test_reader)
+    tsvfile, columns = engine.table('Bimp', 'iloci')
+    assert tsvfile == 'wd/Bimp/Bimp.iloci.tsv'
+    assert columns == tuple(COLUMNS['iloci'])
+    assert engine.table('Bimp', 'iloci') is engine.table('Bimp', 'iloci')
+    assert engine.cache.misses == 1
+
+    species = ['Bimp', 'Amel', 'Bter', 'Bimp']
+    for jobs in [1, 4]:
+        engine = SummaryEngine(registry, workdir='wd', jobs=jobs, cachesize=6,
+                               shuffled=True, reader=_test_reader)
+        result = list(engine.tables(species, ['miloci', 'prnas']))
+        assert [label for label, tables in result] == species
+        for label, tables in result:
+            assert tables['miloci'][0] == \
+                'wd/%s/%s.miloci.shuffled.tsv' % (label, label)
+            assert tables['prnas'][0] == \
+                'wd/%s/%s.pre-mrnas.tsv' % (label, label)
+        assert engine.cache.misses == 6
+        assert engine.cache.hits == 2
+        assert len(engine.cache) == 6
+
+
+def _test_tables(workdir):
+    tables = [('iloci', 'testdata/misc/bdis-stats.iloci.tsv'),
+              ('miloci', 'testdata/misc/bdis-stats.miloci.tsv'),
+              ('prnas', 'testdata/misc/atha-stats.pre-mrnas.tsv'),
+              ('exons', 'testdata/misc/atha-stats.exons.tsv')]
+    os.makedirs(workdir + '/Bdis')
+    copies = list()
+    for name, tsvfile in tables:
+        suffix = genhub.stats.TABLES[name][2]
+        copy = '%s/Bdis/Bdis.%s' % (workdir, suffix)
+        shutil.copy(tsvfile, copy)
+        copies.append((name, copy))
+    return copies
+
+
+def _test_rows(tsvfile):
+    with open(tsvfile, 'r') as instream:
+        header = next(instream).rstrip('\n').split('\t')
+        return [dict(zip(header, line.rstrip('\n').split('\t')))
+                for line in instream]
+
+
+def test_quantile_sketch():
+    """Summary: streaming quantile sketch"""
+    sketch = QuantileSketch(accuracy=0.01)
+    assert sketch.quantile(0.5) is None
+    values = [0.0] * 10 + [x / 10 for x in range(1, 991)]
+    for value in values:
+        sketch.add(value)
+    sketch.add(float('nan'))
+    assert sketch.count == 1000 and sketch.zeros == 10
+    values.sort()
+    for q in [0.0, 0.005, 0.05, 0.25, 0.5, 0.9, 0.99, 1.0]:
+        exact = values[int(q * (len(values) - 1))]
+        estimate = sketch.quantile(q)
+        assert abs(estimate - exact) <= 0.01 * exact, (q, estimate, exact)
+
+    first, second = QuantileSketch(), QuantileSketch()
+    for i, value in enumerate(values):
+        (first if i % 2 else second).add(value)
+    first.merge(second)
+    assert first.todict() == sketch.todict()
+    copy = QuantileSketch.fromdict(json.loads(json.dumps(sketch.todict())))
+    assert copy.bins == sketch.bins
+    assert copy.quantile(0.5) == sketch.quantile(0.5)
+
+
+def test_histogram_quantile():
+    """Summary: exact quantiles from value counts"""
+    assert histogram_quantile({}, 0.5) is None
+    histogram = {1: 3, 2: 1, 5: 2}
+    values = [1, 1, 1, 2, 5, 5]
+    for q in [0.0, 0.25, 0.5, 0.6, 0.75, 1.0]:
+        position = q * (len(values) - 1)
+        lower = int(math.floor(position))
+        upper = min(lower + 1, len(values) - 1)
+        exact = values[lower] + (values[upper] - values[lower]) * \
+            (position - lower)
+        assert abs(histogram_quantile(histogram, q) - exact) < 1e-9, q
+
+
+def test_genome_summary():
+    """Summary: aggregates of feature tables"""
+    workdir = 'testdata/demo-workdir/summary'
+    tables = _test_tables(workdir)
+    summary = summarize(tables, species='Bdis')
+    assert summary.species == 'Test'
+    iloci = _test_rows(tables[0][1])
+    assert summary.seqs('iloci') == len(set([r['SeqID'] for r in iloci]))
+    assert summary.seqs('prnas') is None
+    assert sorted(summary.classes('iloci')) == \
+        sorted(set([r['LocusClass'] for r in iloci]))
+    assert summary.count('iloci') == len(iloci)
+    assert summary.count('iloci', classes=GILOCUS_TYPES) == \
+        len([r for r in iloci if r['LocusClass'] in GILOCUS_TYPES])
+    assert summary.total('iloci', 'EffectiveLength', exclude=['fiLocus']) \
+        == sum([int(r['EffectiveLength']) for r in iloci
+                if r['LocusClass'] != 'fiLocus'])
+    miloci = [r for r in _test_rows(tables[1][1])
+              if r['LocusClass'] == 'miLocus']
+    genecounts = sorted([int(r['GeneCount']) for r in miloci])
+    assert summary.quantile('miloci', 'GeneCount', 0.0, ['miLocus']) == \
+        genecounts[0]
+    assert summary.quantile('miloci', 'GeneCount', 1.0, ['miLocus']) == \
+        genecounts[-1]
+    prnas = _test_rows(tables[2][1])
+    assert summary.histogram('prnas', 'ExonCount').get(1, 0) == \
+        len([r for r in prnas if r['ExonCount'] == '1'])
+    assert summary.classes('prnas') == ['prnas']
+    exons = _test_rows(tables[3][1])
+    assert set(summary.classes('exons')) == set([r['Context'] for r in exons])
+    lengths = sorted([int(r['Length']) for r in exons])
+    median = summary.quantile('exons', 'Length', 0.5)
+    assert abs(median - lengths[(len(lengths) - 1) // 2]) <= 0.01 * median
+    assert summary.count('exons') == len(exons)
+
+    summaryfile = workdir + '/Bdis/Bdis.summary.json'
+    assert not is_current(summaryfile, [f for _, f in tables])
+    summary.save(summaryfile)
+    assert is_current(summaryfile, [f for _, f in tables])
+    loaded = GenomeSummary.load(summaryfile)
+    assert json.dumps(loaded.todict()) == json.dumps(summary.todict())
+    assert loaded.quantile('iloci', 'GCContent', 0.5) == \
+        summary.quantile('iloci', 'GCContent', 0.5)
+    shutil.rmtree(workdir)
+
+
+def test_engine_summaries():
+    """Summary: load or compute summaries of many species"""
+    workdir = 'testdata/demo-workdir/summary'
+    tables = _test_tables(workdir)
+    registry = genhub.registry.Registry()
+    db = registry.genome('Bdis', workdir=workdir)
+    names = ['iloci', 'miloci', 'prnas']
+    engine = SummaryEngine(registry, workdir=workdir, jobs=2)
+    computed = list(engine.summaries(['Bdis', 'Bdis'], names))
+    assert [label for label, _ in computed] == ['Bdis', 'Bdis']
+    assert not os.path.exists(db.summaryfile)
+
+    save_summary(db, logstream=None)
+    saved = GenomeSummary.load(db.summaryfile)
+    assert list(saved.features.keys()) == ['iloci', 'miloci', 'prnas',
+                                           'exons']
+    with open(db.summaryfile, 'r') as instream:
+        data = json.load(instream)
+    data['species'] = 'FromFile'
+    with open(db.summaryfile, 'w') as outstream:
+        json.dump(data, outstream)
+    for label, summary in engine.summaries(['Bdis'], names):
+        assert summary.species == 'FromFile'
+        assert summary.count('iloci') == computed[0][1].count('iloci')
+    for label, summary in engine.summaries(['Bdis'], names, rescan=True):
+        assert summary.species == 'Test'
+    mtime = os.path.getmtime(db.summaryfile)
+    os.utime(tables[0][1], (mtime + 10, mtime + 10))
+    for label, summary in engine.summaries(['Bdis'], names):
+        assert summary.species == 'Test'
+    shutil.rmtree(workdir)
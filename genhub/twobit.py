@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Packed genome storage in UCSC's .2bit format.
+
+Each nucleotide is stored in 2 bits, with runs of N and runs of soft-masked
+(lower case) sequence recorded in separate interval tables, so a .2bit file is
+roughly a quarter the size of the corresponding Fasta file. Files written here
+can be read by UCSC tools (`twoBitToFa`, etc.) and vice versa.
+
+The format can only represent the characters A, C, G, T, and N (in upper or
+lower case); any other IUPAC symbol in the input raises a ValueError, so that
+a lossy genome store is never created.
+"""
+
+from __future__ import print_function
+from bisect import bisect_right
+from collections import namedtuple, OrderedDict
+import binascii
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import genhub
+
+
+SIGNATURE = 0x1A412743
+_BASES = b'TCAG'
+
+_CODES = bytearray(256)
+for _code, _base in enumerate(bytearray(_BASES)):
+    _CODES[_base] = _code
+    _CODES[ord(chr(_base).lower())] = _code
+_CODES = bytes(_CODES)
+
+# One table per position within a packed byte, each mapping a packed byte to
+# the base at that position; unpacking is then 4 translations and an
+# interleave, rather than a Python loop over the bytes.
+_UNPACK = [bytes(bytearray([bytearray(_BASES)[(byte >> shift) & 3]
+                            for byte in range(256)]))
+           for shift in (6, 4, 2, 0)]
+
+_NRUNS = re.compile(b'[Nn]+')
+_MASKRUNS = re.compile(b'[a-z]+')
+
+
+def _toint(data):
+    """Interpret bytes as a big-endian unsigned integer."""
+    if hasattr(int, 'from_bytes'):
+        return int.from_bytes(data, 'big')
+    return int(binascii.hexlify(data), 16) if data else 0  # pragma: no cover
+
+
+def _tobytes(value, length):
+    """Encode an unsigned integer as `length` big-endian bytes."""
+    if hasattr(value, 'to_bytes'):
+        return value.to_bytes(length, 'big')
+    if length == 0:  # pragma: no cover
+        return b''
+    return binascii.unhexlify('%0*x' % (2 * length, value))  # pragma: no cover
+
+
+def pack(seq):
+    """
+    Pack a nucleotide sequence (bytes) into 2 bits per base.
+
+    Bases are coded as T=0, C=1, A=2, G=3 (N is stored as T), 4 bases per byte
+    with the first base in the high-order bits. Rather than looping over the
+    sequence, the 4 interleaved code streams are each read as one big integer
+    and summed with the appropriate shifts: since every code is at most 3, no
+    carries cross byte boundaries.
+    """
+    codes = seq.translate(_CODES)
+    codes += b'\x00' * (-len(codes) % 4)
+    length = len(codes) // 4
+    value = 0
+    for offset in range(4):
+        value = (value << 2) + _toint(codes[offset::4])
+    return _tobytes(value, length)
+
+
+def unpack(packed):
+    """Unpack 2-bit coded bytes into upper case nucleotides."""
+    seq = bytearray(len(packed) * 4)
+    for offset, table in enumerate(_UNPACK):
+        seq[offset::4] = packed.translate(table)
+    return seq
+
+
+def _runs(pattern, seq):
+    starts, sizes = list(), list()
+    for match in pattern.finditer(seq):
+        starts.append(match.start())
+        sizes.append(match.end() - match.start())
+    return starts, sizes
+
+
+def _record(seq):
+    """Encode a single sequence as a .2bit record."""
+    invalid = seq.translate(None, b'ACGTNacgtn')
+    if invalid:
+        message = 'cannot pack symbol(s) %r in 2-bit format' % \
+            ''.join(sorted(set(invalid.decode('ascii', 'replace'))))
+        raise ValueError(message)
+    nstarts, nsizes = _runs(_NRUNS, seq)
+    mstarts, msizes = _runs(_MASKRUNS, seq)
+    values = [len(seq), len(nstarts)] + nstarts + nsizes + \
+        [len(mstarts)] + mstarts + msizes + [0]
+    header = struct.pack('<%dI' % len(values), *values)
+    return header + pack(seq)
+
+
+def write(records, filename):
+    """
+    Write sequences to a .2bit file.
+
+    The `records` are (defline, sequence) tuples such as those produced by
+    `genhub.fasta.parse_bulk`; only one sequence is held in memory at a time.
+    Each sequence is named by the first token of its defline, and as with
+    Fasta indexing only the first of any duplicated sequence IDs is kept.
+    """
+    names = list()
+    offsets = list()
+    seen = set()
+    dirname = os.path.dirname(os.path.abspath(filename))
+    with tempfile.TemporaryFile(dir=dirname) as body:
+        for defline, seq in records:
+            if not isinstance(defline, bytes):
+                defline, seq = defline.encode('utf-8'), seq.encode('ascii')
+            name = defline[1:].split()[0] if defline[1:].strip() else b''
+            if name in seen:
+                continue
+            if len(name) > 255:
+                raise ValueError('sequence ID too long: %r' % name)
+            seen.add(name)
+            names.append(name)
+            offsets.append(body.tell())
+            body.write(_record(seq))
+
+        headersize = 16 + sum([len(name) + 5 for name in names])
+        version, offsetformat = 0, '<I'
+        if headersize + body.tell() + 4 * len(names) >= 2**32:
+            version, offsetformat = 1, '<Q'
+            headersize += 4 * len(names)
+        with open(filename, 'wb') as outstream:
+            outstream.write(struct.pack('<4I', SIGNATURE, version,
+                                        len(names), 0))
+            for name, offset in zip(names, offsets):
+                outstream.write(struct.pack('B', len(name)) + name)
+                outstream.write(struct.pack(offsetformat,
+                                            headersize + offset))
+            body.seek(0)
+            shutil.copyfileobj(body, outstream, 2**22)
+
+
+def convert(fastafile, twobitfile):
+    """Pack a Fasta file into a .2bit file."""
+    with open(fastafile, 'rb') as instream:
+        try:
+            write(genhub.fasta.parse_bulk(instream), twobitfile)
+        except ValueError:
+            if os.path.exists(twobitfile):
+                os.unlink(twobitfile)
+            raise
+
+
+TwoBitEntry = namedtuple('TwoBitEntry', 'length nstarts nsizes mstarts '
+                         'msizes offset')
+
+
+class TwoBitFile(object):
+    """
+    Random access to the sequences in a .2bit file.
+
+    The file is memory-mapped; only the directory of sequence names is read
+    when the file is opened, and each sequence's N-run and soft-mask tables
+    are read on first access. Subsequences are decoded from just the packed
+    bytes that cover them, so access time does not depend on sequence size.
+    The interface mirrors that of `genhub.fasta.IndexedFasta`.
+
+        >>> genome = TwoBitFile('Bdis.gdna.2bit')
+        >>> genome.fetch('NW_014576703.1', 1, 10)
+        'ATAACGATTA'
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._endian = '<'
+        signature, version, count, _ = struct.unpack_from('<4I', self._data)
+        if signature != SIGNATURE:
+            self._endian = '>'
+            signature, version, count, _ = \
+                struct.unpack_from('>4I', self._data)
+        if signature != SIGNATURE or version not in (0, 1):
+            self.close()
+            raise ValueError('"%s" is not a .2bit file' % filename)
+        offsetformat = self._endian + ('Q' if version == 1 else 'I')
+        offsetsize = struct.calcsize(offsetformat)
+
+        self.offsets = OrderedDict()
+        self._entries = dict()
+        position = 16
+        for _ in range(count):
+            namesize = bytearray(self._data[position:position + 1])[0]
+            position += 1
+            name = self._data[position:position + namesize].decode('utf-8')
+            position += namesize
+            offset, = struct.unpack_from(offsetformat, self._data, position)
+            position += offsetsize
+            self.offsets[name] = offset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __contains__(self, seqid):
+        return seqid in self.offsets
+
+    def __getitem__(self, seqid):
+        return self.fetch(seqid)
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def keys(self):
+        return self.offsets.keys()
+
+    def _uints(self, count, position):
+        fmt = '%s%dI' % (self._endian, count)
+        return struct.unpack_from(fmt, self._data, position)
+
+    def entry(self, seqid):
+        """Load (and cache) the header of a sequence record."""
+        if seqid in self._entries:
+            return self._entries[seqid]
+        position = self.offsets[seqid]
+        length, ncount = self._uints(2, position)
+        position += 8
+        nstarts = self._uints(ncount, position)
+        nsizes = self._uints(ncount, position + 4 * ncount)
+        position += 8 * ncount
+        mcount, = self._uints(1, position)
+        position += 4
+        mstarts = self._uints(mcount, position)
+        msizes = self._uints(mcount, position + 4 * mcount)
+        position += 8 * mcount + 4
+        entry = TwoBitEntry(length, nstarts, nsizes, mstarts, msizes,
+                            position)
+        self._entries[seqid] = entry
+        return entry
+
+    def length(self, seqid):
+        return self.entry(seqid).length
+
+    @staticmethod
+    def _overlaps(starts, sizes, begin, end):
+        """Intervals overlapping [begin, end), clipped to it."""
+        index = max(bisect_right(starts, begin) - 1, 0)
+        while index < len(starts) and starts[index] < end:
+            istart = max(starts[index], begin)
+            iend = min(starts[index] + sizes[index], end)
+            if iend > istart:
+                yield istart - begin, iend - begin
+            index += 1
+
+    def fetch_bytes(self, seqid, start=None, end=None):
+        """
+        Retrieve a sequence or subsequence as bytes.
+
+        Coordinates are 1-based and inclusive (as in GFF3); by default the
+        entire sequence is returned.
+        """
+        entry = self.entry(seqid)
+        if start is None:
+            start = 1
+        if end is None:
+            end = entry.length
+        if start < 1 or end > entry.length or end < start - 1:
+            message = 'invalid range %s:%d-%d' % (seqid, start, end)
+            message += ' (sequence length %d)' % entry.length
+            raise ValueError(message)
+        if end < start:
+            return b''
+
+        begin = start - 1
+        first, last = begin // 4, (end + 3) // 4
+        packed = self._data[entry.offset + first:entry.offset + last]
+        skip = begin - first * 4
+        seq = unpack(packed)[skip:skip + end - begin]
+        for istart, iend in self._overlaps(entry.nstarts, entry.nsizes,
+                                           begin, end):
+            seq[istart:iend] = b'N' * (iend - istart)
+        for istart, iend in self._overlaps(entry.mstarts, entry.msizes,
+                                           begin, end):
+            seq[istart:iend] = seq[istart:iend].lower()
+        return bytes(seq)
+
+    def fetch(self, seqid, start=None, end=None):
+        """Retrieve a sequence or subsequence as a string."""
+        return self.fetch_bytes(seqid, start, end).decode('ascii')
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+
+def test_pack():
+    """2bit: pack and unpack"""
+    assert pack(b'') == b''
+    assert pack(b'TCAG') == b'\x1b'
+    assert pack(b'GGGGA') == b'\xff\x80'
+    assert bytes(unpack(b'\x1b\xff')) == b'TCAGGGGG'
+    seq = b'ACGTTGCAacgtNNNA'
+    assert bytes(unpack(pack(seq))) == b'ACGTTGCAACGTTTTA'
+
+
+def test_roundtrip():
+    """2bit: write and random access"""
+    records = [
+        (b'>seq1 first', b'ACGTNNNNacgtnnACGTAcgtTTTTGGGGnNaC'),
+        (b'>seq2', b'NNNNNNNNNN'),
+        (b'>empty', b''),
+        (b'>seq3', b'gattacaGATTACAgattaca'),
+        (b'>seq1 duplicate', b'AAAA'),
+    ]
+    twobitfile = 'testdata/demo-workdir/test.2bit'
+    write(records, twobitfile)
+    with TwoBitFile(twobitfile) as genome:
+        assert list(genome.keys()) == ['seq1', 'seq2', 'empty', 'seq3']
+        assert len(genome) == 4 and 'seq3' in genome
+        assert genome.length('empty') == 0
+        assert genome['empty'] == ''
+        for defline, seq in records[:4]:
+            seqid = defline[1:].split()[0].decode('ascii')
+            assert genome.fetch_bytes(seqid) == seq
+            for start in range(1, len(seq) + 1):
+                for end in range(start, len(seq) + 1):
+                    subseq = genome.fetch_bytes(seqid, start, end)
+                    assert subseq == seq[start - 1:end], (seqid, start, end)
+        assert genome.fetch('seq3', 5, 9) == 'acaGA'
+        try:
+            genome.fetch('seq2', 5, 11)
+        except ValueError as e:
+            assert 'invalid range seq2:5-11' in str(e)
+        else:
+            assert False, 'invalid range not detected'
+    os.unlink(twobitfile)
+
+    try:
+        write([(b'>bad', b'ACGTRYN')], twobitfile)
+    except ValueError as e:
+        assert 'cannot pack' in str(e) and 'RY' in str(e)
+    else:
+        assert False, 'IUPAC symbols not detected'
+
+
+def test_convert():
+    """2bit: convert a genome Fasta file"""
+    fastafile = 'testdata/demo-workdir/Bdis/Bdis.gdna.fa'
+    twobitfile = 'testdata/demo-workdir/Bdis/Bdis.gdna.2bit'
+    convert(fastafile, twobitfile)
+    assert os.path.getsize(twobitfile) < os.path.getsize(fastafile) / 3
+    with TwoBitFile(twobitfile) as genome, \
+            genhub.fasta.IndexedFasta(fastafile) as seqs:
+        assert list(genome.keys()) == list(seqs.keys())
+        for seqid in seqs:
+            assert genome.fetch_bytes(seqid) == seqs.fetch_bytes(seqid)
+            length = seqs.length(seqid)
+            for start in range(1, length, 997):
+                end = min(start + 1500, length)
+                assert genome.fetch(seqid, start, end) == \
+                    seqs.fetch(seqid, start, end)
+    os.unlink(twobitfile)
@@ -10,6 +10,7 @@
 
 from __future__ import print_function
 from __future__ import division
+from collections import OrderedDict
 import argparse
 import math
 import pandas
@@ -53,6 +54,17 @@ def cli():
                         'centroid is recomputed')
     parser.add_argument('-s', '--shuffled', action='store_true',
                         help='load input from shuffled iLocus data')
+    parser.add_argument('-r', '--replicates', metavar='N', type=int,
+                        default=None, help='instead of the observed values, '
+                        'report the null distribution of phi/sigma values '
+                        'from N replicates, for each of which the iLoci of '
+                        'each sequence are shuffled and merged into miLoci '
+                        'anew (see genhub.shuffle); requires NumPy')
+    parser.add_argument('--seed', metavar='SEED', type=int, default=None,
+                        help='random seed for shuffling iLoci')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                        help='number of tables to load in parallel; default '
+                        'is 1')
     parser.add_argument('species', nargs='+', help='species label(s)')
     return parser
 
@@ -84,33 +96,53 @@ def thresholds(iloci, iqnt=0.95, gqnt=0.05):
     return ithresh, gthresh
 
 
-def seqlen(seqid, iloci, ithresh=None, gthresh=None):
-    seqloci = iloci.loc[(iloci.SeqID == seqid) &
-                        (iloci.LocusClass != 'fiLocus')]
-    effsize = seqloci['EffectiveLength'].sum()
+def seqstats(iloci, miloci, ithresh=None, gthresh=None):
+    """
+    Aggregate iLocus and miLocus data for every sequence in a single pass.
+
+    Returns a data frame indexed by sequence ID with the effective length of
+    each sequence (discounting fiLoci, and long iiLoci and short giLoci as
+    determined by the thresholds), its number of giLoci and singleton
+    miLoci (giLoci that were not merged), and its miLocus occupancy.
+    """
+    gilocus_types = ['siLocus', 'ciLocus', 'niLocus']
+    isgene = iloci.LocusClass.isin(gilocus_types)
+    efflen = iloci.EffectiveLength.where(iloci.LocusClass != 'fiLocus', 0)
     if ithresh:
-        longiiloci = seqloci.loc[(seqloci.LocusClass == 'iiLocus') &
-                                 (seqloci.Length > ithresh)]
-        effsize -= longiiloci['Length'].sum()
+        longiiloci = (iloci.LocusClass == 'iiLocus') & (iloci.Length > ithresh)
+        efflen = efflen - iloci.Length.where(longiiloci, 0)
     if gthresh:
-        gilocus_types = ['siLocus', 'ciLocus', 'niLocus']
-        shortgiloci = seqloci.loc[(seqloci.LocusClass.isin(gilocus_types)) &
-                                  (seqloci.Length < gthresh)]
-        effsize -= shortgiloci['Length'].sum()
-    return effsize
+        shortgiloci = isgene & (iloci.Length < gthresh)
+        efflen = efflen - iloci.Length.where(shortgiloci, 0)
+        isgene = isgene & (iloci.Length >= gthresh)
+    istats = pandas.DataFrame({
+        'SeqID': iloci.SeqID.astype(str),
+        'EffectiveLength': efflen,
+        'giLoci': isgene.astype(int),
+    }).groupby('SeqID', sort=False).sum()
+
+    issingleton = miloci.LocusClass.isin(gilocus_types)
+    if gthresh:
+        issingleton = issingleton & (miloci.Length >= gthresh)
+    occupancy = miloci.Length.where(miloci.LocusClass == 'miLocus', 0)
+    mstats = pandas.DataFrame({
+        'SeqID': miloci.SeqID.astype(str),
+        'Singletons': issingleton.astype(int),
+        'Occupancy': occupancy,
+    }).groupby('SeqID', sort=False).sum()
 
+    return istats.join(mstats, how='outer').fillna(0).astype(int)
 
-def calc_phi(seqid, iloci, miloci, gthresh=None):
-    gilocus_types = ['siLocus', 'ciLocus', 'niLocus']
-    giloci = iloci.loc[(iloci.SeqID == seqid) &
-                       (iloci.LocusClass.isin(gilocus_types))]
-    singletons = miloci.loc[(miloci.SeqID == seqid) &
-                            (miloci.LocusClass.isin(gilocus_types))]
-    if gthresh:
-        giloci = giloci.loc[giloci.Length >= gthresh]
-        singletons = singletons.loc[singletons.Length >= gthresh]
-    merged = len(giloci) - len(singletons)
-    return merged / len(giloci)
+
+def seqlen(seqid, stats):
+    return stats.EffectiveLength.get(seqid, 0)
+
+
+def calc_phi(seqid, stats):
+    giloci = int(stats.giLoci.get(seqid, 0))
+    singletons = int(stats.Singletons.get(seqid, 0))
+    merged = giloci - singletons
+    return merged / giloci
 
 
 def calc_centroid(x, y, outlierfactor=2.25):
@@ -136,45 +168,77 @@ def calc_centroid(x, y, outlierfactor=2.25):
     return final_cent_x, final_cent_y
 
 
+def compactness(species, db, iloci, miloci, args):
+    """Calculate sigma and phi for each long sequence of a genome."""
+    ithresh, gthresh = thresholds(iloci, args.iqnt, args.gqnt)
+    stats = seqstats(iloci, miloci, ithresh, gthresh)
+    if args.replicates:
+        return null_compactness(species, db, args, iloci, stats, gthresh)
+
+    phis = list()
+    sigmas = list()
+    seqids = list()
+    for seqid, length in longseqs(db, args.length):
+        length = seqlen(seqid, stats)
+        phi = calc_phi(seqid, stats)
+        milocus_occ = stats.Occupancy.get(seqid, 0)
+        sigma = milocus_occ / length
+        phis.append(phi)
+        sigmas.append(sigma)
+        seqids.append(seqid)
+
+    if args.centroid:
+        phi, sigma = calc_centroid(phis, sigmas, args.centroid)
+        return [(species, 'Centroid', sigma, phi)]
+    return [(species, seqid, sigma, phi)
+            for seqid, sigma, phi in zip(seqids, sigmas, phis)]
+
+
+def null_compactness(species, db, args, iloci, stats, gthresh=None):
+    """Calculate sigma and phi for each long sequence of shuffled genomes."""
+    shuffler = genhub.shuffle.ILocusShuffler(
+        iloci.SeqID.astype(str).values, iloci.LocusClass.astype(str).values,
+        iloci.EffectiveLength.values, iloci.Length.values, gthresh=gthresh)
+    seqlengths = OrderedDict()
+    for seqid, length in longseqs(db, args.length):
+        seqlengths[seqid] = seqlen(seqid, stats)
+    seqids, sigmas, phis = shuffler.compactness(seqlengths, args.replicates,
+                                                seed=args.seed)
+
+    rows = list()
+    for replicate in range(args.replicates):
+        if args.centroid:
+            phi, sigma = calc_centroid(phis[replicate], sigmas[replicate],
+                                       args.centroid)
+            rows.append((species, 'Centroid', replicate + 1, sigma, phi))
+            continue
+        for seqid, sigma, phi in zip(seqids, sigmas[replicate],
+                                     phis[replicate]):
+            rows.append((species, seqid, replicate + 1, sigma, phi))
+    return rows
+
+
 def main(args):
-    print('Species', 'SeqID', 'Sigma', 'Phi', sep='\t')
+    if args.replicates:
+        print('Species', 'SeqID', 'Replicate', 'Sigma', 'Phi', sep='\t')
+    else:
+        print('Species', 'SeqID', 'Sigma', 'Phi', sep='\t')
 
     registry = genhub.registry.Registry()
     if args.cfgdir:
         for cfgdirpath in args.cfgdir.split(','):
             registry.update(cfgdirpath)
 
-    for species in args.species:
+    engine = genhub.summary.SummaryEngine(registry, workdir=args.workdir,
+                                          jobs=args.jobs,
+                                          shuffled=args.shuffled)
+    for species, tables in engine.tables(args.species, ['iloci', 'miloci']):
         db = registry.genome(species, workdir=args.workdir)
-        if args.shuffled:
-            iloci = pandas.read_table(db.ilocustableshuf)
-            miloci = pandas.read_table(db.milocustableshuf)
-        else:
-            iloci = pandas.read_table(db.ilocustable)
-            miloci = pandas.read_table(db.milocustable)
-        ithresh, gthresh = thresholds(iloci, args.iqnt, args.gqnt)
-
-        phis = list()
-        sigmas = list()
-        seqids = list()
-        for seqid, length in longseqs(db, args.length):
-            length = seqlen(seqid, iloci, ithresh, gthresh)
-            phi = calc_phi(seqid, iloci, miloci, gthresh)
-            milocus_occ = miloci.loc[
-                (miloci.SeqID == seqid) &
-                (miloci.LocusClass == 'miLocus')
-            ]['Length'].sum()
-            sigma = milocus_occ / length
-            phis.append(phi)
-            sigmas.append(sigma)
-            seqids.append(seqid)
+        rows = compactness(species, db, tables['iloci'], tables['miloci'],
+                           args)
+        for row in rows:
+            print(*row, sep='\t')
 
-        if args.centroid:
-            phi, sigma = calc_centroid(phis, sigmas, args.centroid)
-            print(species, 'Centroid', sigma, phi, sep='\t')
-        else:
-            for seqid, sigma, phi in zip(seqids, sigmas, phis):
-                print(species, seqid, sigma, phi, sep='\t')
 
 if __name__ == '__main__':
     main(args=cli().parse_args())
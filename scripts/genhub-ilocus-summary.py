@@ -11,8 +11,6 @@
 from __future__ import division
 from __future__ import print_function
 import argparse
-import pandas
-import re
 import genhub
 
 
@@ -32,34 +30,29 @@ def cli():
     parser.add_argument('--outfmt', metavar='FMT', choices=['tsv', 'tex'],
                         default='tsv', help='output format; "tsv" for machine '
                         'readability, "tex" for typesetting')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                        help='number of genomes to summarize in parallel; '
+                        'default is 1')
+    parser.add_argument('--rescan', action='store_true',
+                        help='compute the summary from the full feature '
+                        'tables rather than from each genome\'s summary file')
     parser.add_argument('species', nargs='+', help='species label(s)')
     return parser
 
 
-def count_seqs(data):
-    """Count sequences from iLocus positions."""
-    seqids = dict()
-    for locuspos in data['LocusPos']:
-        posmatch = re.search('(\S+)_(\d+)-(\d+)', locuspos)
-        assert posmatch, 'error parsing iLocus position: ' + locuspos
-        seqid = posmatch.group(1)
-        seqids[seqid] = True
-    return len(seqids)
-
-
-def get_row(data, fmt):
+def get_row(summary, fmt):
     """Calculate the summary for a row of the table."""
     assert fmt in ['tsv', 'tex']
 
     row = [
-        data['Species'][0],
-        data['EffectiveLength'].sum() / 1000000,
-        count_seqs(data),
-        len(data.loc[data.LocusClass == 'fiLocus']),
-        len(data.loc[data.LocusClass == 'iiLocus']),
-        len(data.loc[data.LocusClass == 'niLocus']),
-        len(data.loc[data.LocusClass == 'siLocus']),
-        len(data.loc[data.LocusClass == 'ciLocus']),
+        summary.species,
+        summary.total('iloci', 'EffectiveLength') / 1000000,
+        summary.seqs('iloci'),
+        summary.count('iloci', ['fiLocus']),
+        summary.count('iloci', ['iiLocus']),
+        summary.count('iloci', ['niLocus']),
+        summary.count('iloci', ['siLocus']),
+        summary.count('iloci', ['ciLocus']),
     ]
 
     if fmt == 'tex':
@@ -90,10 +83,11 @@ def main(args):
         for cfgdirpath in args.cfgdir.split(','):
             registry.update(cfgdirpath)
 
-    for species in args.species:
-        db = registry.genome(species, workdir=args.workdir)
-        data = pandas.read_table(db.ilocustable)
-        row = get_row(data, args.outfmt)
+    engine = genhub.summary.SummaryEngine(registry, workdir=args.workdir,
+                                          jobs=args.jobs)
+    summaries = engine.summaries(args.species, ['iloci'], rescan=args.rescan)
+    for species, summary in summaries:
+        row = get_row(summary, args.outfmt)
         print_row(row, args.outfmt)
 
 
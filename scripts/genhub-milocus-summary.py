@@ -11,8 +11,6 @@
 from __future__ import division
 from __future__ import print_function
 import argparse
-import pandas
-import re
 import genhub
 
 
@@ -34,49 +32,43 @@ def cli():
                         'readability, "tex" for typesetting')
     parser.add_argument('-s', '--shuffled', action='store_true',
                         help='load input from shuffled iLocus data')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                        help='number of genomes to summarize in parallel; '
+                        'default is 1')
+    parser.add_argument('--rescan', action='store_true',
+                        help='compute the summary from the full feature '
+                        'tables rather than from each genome\'s summary file')
     parser.add_argument('species', nargs='+', help='species label(s)')
     return parser
 
 
-def count_seqs(data):
-    """Count sequences from iLocus positions."""
-    seqids = dict()
-    for locuspos in data['LocusPos']:
-        posmatch = re.search('(\S+)_(\d+)-(\d+)', locuspos)
-        assert posmatch, 'error parsing iLocus position: ' + locuspos
-        seqid = posmatch.group(1)
-        seqids[seqid] = True
-    return len(seqids)
-
-
-def get_row(ilocus_data, milocus_data, fmt):
+def get_row(summary, fmt):
     """Calculate the summary for a row of the table."""
     assert fmt in ['tsv', 'tex']
 
-    species = ilocus_data['Species'][0]
-    miloci = milocus_data.loc[milocus_data.LocusClass == 'miLocus']
-    milocus_count = len(miloci)
-    effective_genome = milocus_data.loc[milocus_data.LocusClass != 'fiLocus']
-    effective_genome_size = effective_genome['EffectiveLength'].sum()
-    milocus_occ = miloci['EffectiveLength'].sum()
+    species = summary.species
+    milocus_count = summary.count('miloci', ['miLocus'])
+    effective_genome_size = summary.total('miloci', 'EffectiveLength',
+                                          exclude=['fiLocus'])
+    milocus_occ = summary.total('miloci', 'EffectiveLength', ['miLocus'])
     milocus_perc = milocus_occ / effective_genome_size
-    gene_count = miloci['GeneCount'].quantile([0.25, 0.50, 0.75])
-    gilocus_types = ['siLocus', 'ciLocus', 'niLocus']
-    singletons = milocus_data.loc[milocus_data.LocusClass.isin(gilocus_types)]
-    giloci = ilocus_data.loc[ilocus_data.LocusClass.isin(gilocus_types)]
-    single_frac = len(singletons) / len(giloci)
+    gene_count = [summary.quantile('miloci', 'GeneCount', q, ['miLocus'])
+                  for q in [0.25, 0.50, 0.75]]
+    gilocus_types = genhub.summary.GILOCUS_TYPES
+    singletons = summary.count('miloci', gilocus_types)
+    giloci = summary.count('iloci', gilocus_types)
+    single_frac = singletons / giloci
 
     if fmt == 'tsv':
         genecounts = ','.join(['{:.0f}'.format(gc) for gc in gene_count])
         row = [species, milocus_count, milocus_occ, milocus_perc,
-               genecounts, len(singletons), len(giloci)]
+               genecounts, singletons, giloci]
     elif fmt == 'tex':
         count = '{:,d}'.format(milocus_count)
         occupancy = '{:,.1f} Mb ({:.1f}\\%)'.format(milocus_occ / 1000000,
                                                     milocus_perc * 100)
         genecounts = ', '.join(['{:.0f}'.format(gc) for gc in gene_count])
-        singles = '{:,d} ({:.1f}\\%)'.format(len(singletons),
-                                             single_frac * 100)
+        singles = '{:,d} ({:.1f}\\%)'.format(singletons, single_frac * 100)
         row = [species, count, occupancy, genecounts, singles]
 
     return row
@@ -106,15 +98,13 @@ def main(args):
         for cfgdirpath in args.cfgdir.split(','):
             registry.update(cfgdirpath)
 
-    for species in args.species:
-        db = registry.genome(species, workdir=args.workdir)
-        if args.shuffled:
-            iloci = pandas.read_table(db.ilocustableshuf)
-            miloci = pandas.read_table(db.milocustableshuf)
-        else:
-            iloci = pandas.read_table(db.ilocustable)
-            miloci = pandas.read_table(db.milocustable)
-        row = get_row(iloci, miloci, args.outfmt)
+    engine = genhub.summary.SummaryEngine(registry, workdir=args.workdir,
+                                          jobs=args.jobs,
+                                          shuffled=args.shuffled)
+    summaries = engine.summaries(args.species, ['iloci', 'miloci'],
+                                 rescan=args.rescan)
+    for species, summary in summaries:
+        row = get_row(summary, args.outfmt)
         print_row(row, args.outfmt)
 
 
@@ -11,7 +11,6 @@
 from __future__ import division
 from __future__ import print_function
 import argparse
-import pandas
 import re
 import sys
 import genhub
@@ -33,23 +32,30 @@ def cli():
     parser.add_argument('--outfmt', metavar='FMT', choices=['tsv', 'tex'],
                         default='tsv', help='output format; "tsv" for machine '
                         'readability, "tex" for typesetting')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                        help='number of genomes to summarize in parallel; '
+                        'default is 1')
+    parser.add_argument('--rescan', action='store_true',
+                        help='compute the summary from the full feature '
+                        'tables rather than from each genome\'s summary file')
     parser.add_argument('species', nargs='+', help='species label(s)')
     return parser
 
 
-def get_row(iloci, premrnas, fmt):
+def get_row(summary, fmt):
     """Calculate the summary for a row of the table."""
     assert fmt in ['tsv', 'tex']
 
-    species = iloci['Species'][0]
-    piloci = iloci.loc[iloci.LocusClass.isin(['siLocus', 'ciLocus'])]
-    pilocus_count = len(piloci)
-    effective_genome = iloci.loc[iloci.LocusClass != 'fiLocus']
-    effective_genome_size = effective_genome['EffectiveLength'].sum()
-    pilocus_occ = piloci['EffectiveLength'].sum()
+    species = summary.species
+    pilocus_types = ['siLocus', 'ciLocus']
+    pilocus_count = summary.count('iloci', pilocus_types)
+    effective_genome_size = summary.total('iloci', 'EffectiveLength',
+                                          exclude=['fiLocus'])
+    pilocus_occ = summary.total('iloci', 'EffectiveLength', pilocus_types)
     pilocus_occ_perc = pilocus_occ / effective_genome_size
-    single_exon_piloci = len(premrnas[premrnas['ExonCount'] == 1])
-    single_exon_perc = single_exon_piloci / len(premrnas)
+    exon_counts = summary.histogram('prnas', 'ExonCount')
+    single_exon_piloci = exon_counts.get(1, 0)
+    single_exon_perc = single_exon_piloci / summary.count('prnas')
 
     if fmt == 'tsv':
         row = [species, pilocus_count, pilocus_occ, pilocus_occ_perc,
@@ -89,11 +95,12 @@ def main(args):
         for cfgdirpath in args.cfgdir.split(','):
             registry.update(cfgdirpath)
 
-    for species in args.species:
-        db = registry.genome(species, workdir=args.workdir)
-        iloci = pandas.read_table(db.ilocustable)
-        premrnas = pandas.read_table(db.premrnatable)
-        row = get_row(iloci, premrnas, args.outfmt)
+    engine = genhub.summary.SummaryEngine(registry, workdir=args.workdir,
+                                          jobs=args.jobs)
+    summaries = engine.summaries(args.species, ['iloci', 'prnas'],
+                                 rescan=args.rescan)
+    for species, summary in summaries:
+        row = get_row(summary, args.outfmt)
         print_row(row, args.outfmt)
 
 